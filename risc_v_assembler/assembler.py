@@ -15,57 +15,226 @@
 #select search bar, "Show and Run Commands", search "interpreter" to select the correct python interpreter
 import sys, argparse
 from enum import Enum
+from collections import OrderedDict
 import pseudoinstruction_handler as ph
+import data_segment
 
 PC = int(0x00400000)
 
+#bump this whenever a change to the assembler changes the machine code it 
+#produces, so stale entries in an assembly cache are not used
+ENCODER_VERSION = 3
+
 def main(args):
-    assemble_asm(args.asm.readlines(), args)
+    if(args.stream):
+        #only imported when needed to keep start up short
+        import streaming_assembler
+        streaming_assembler.assemble_stream(args.asm, args.out, output_mode(args), pseudos = load_pseudos(args))
+    elif(args.watch):
+        import incremental_assembler
+        args.asm.close()
+        args.out.close()
+        incremental_assembler.watch(args.asm.name, args.out.name, output_mode(args), args.format, pseudos = load_pseudos(args))
+    else:
+        assemble_asm(args.asm.readlines(), args)
+
+def output_mode(args):
+    """Returns the `mode` for `output` selected by the command line arguments."""
+    if(args.verbose):
+        return None
+    return args.mode
+
+def load_pseudos(args):
+    """Returns the pseudoinstructions selected by the command line arguments:
+        the built in ones plus the definitions in the `--pseudos` file, or `None`
+        (the built in ones) if there is no such file."""
+    if(not args or not args.pseudos):
+        return None
+    #only imported when needed to keep start up short
+    import macro_engine
+    return macro_engine.load_pseudos(args.pseudos)
 
 
 def assemble_asm(asm_lines, args = None):
     """Takes a list of strings of assembly code. The strings can contain instructions, 
     labels, blank lines, and comments indicated with `;` (on their own line or following instructions).
     Removes comments and blanks and assembles the entire code, returning a list 
-    containing binary strings of machine code."""
+    containing binary strings of machine code. The `.data` sections are
+    written after the machine code.
+    
+    If `args.cache` names a directory the machine code is looked up in (and 
+    stored to) an `assembly_cache.AssemblyCache` there instead of running the
+    passes every time."""
 
-    #clean up the code removing comments and blanks
-    print("Cleaning comments...")
-    asm_list = comments_pass(asm_lines)
+    mode = None
+    out = None
+    stats = None
+    data = data_segment.DataSegment()
+    pseudos = load_pseudos(args)
+    if(args):
+        out = args.out
+        mode = output_mode(args)
+        if(args.stats or args.optimize or args.prune or args.relax or args.pool or args.compress):
+            #only imported when needed to keep start up short
+            import assembly_stats
+            stats = assembly_stats.AssemblyStats()
+        if(args.optimize or args.prune or args.relax or args.pool or args.compress):
+            stats.add_hook(report_removed)
+
+    if(args and args.cache):
+        import assembly_cache
+        cache = assembly_cache.AssemblyCache(args.cache, args.cache_size * 1024 * 1024)
+        started = stats.start() if stats else None
+        machine_words, clean_text, labels = assembly_cache.assemble_cached(asm_lines, cache, "%s/%s%s%s%s%s%s" % (mode, args.format,
+                                                                           "/O" if args.optimize else "", "/prune" if args.prune else "",
+                                                                           "/relax" if args.relax else "", "/pool" if args.pool else "",
+                                                                           "/schedule-%s" % args.schedule if args.schedule else ""),
+                                                                           pseudos, args.optimize, args.prune, args.schedule, args.relax,
+                                                                           args.pool, data)
+        if(stats):
+            stats.end_pass("cache %s" % ("hit" if cache.hits else "miss"), started, len(asm_lines), len(machine_words))
 
-    #process the pseudoinstruction defninition
-    print("Processing pseudoinstructions...")
-    pseudos = ph.get_pseudoinstruction_defs()
+    else:
+        machine_words, clean_code, labels = assemble_program(asm_lines, pseudos, jobs = args.jobs if args else 1, stats = stats,
+                                                             optimize = args.optimize if args else False,
+                                                             prune = args.prune if args else False,
+                                                             schedule = args.schedule if args else None,
+                                                             relax = args.relax if args else False,
+                                                             pool = args.pool if args else False, data = data)
+        clean_text = [line.instruction_text() for line in clean_code]
+    
+    #swap in the 16-bit instructions, the addresses and labels move with them
+    output_words, sizes, output_labels = machine_words, None, labels
+    if(args and args.compress):
+        started = stats.start()
+        output_words, sizes, output_labels = compress_pass(machine_words, labels)
+        stats.end_pass("compress", started, 4 * len(sizes), sum(sizes))
+
+    #output the code
+    #set out=None to print to console
+    started = stats.start() if stats else None
+    if(args and args.format):
+        #only imported when needed to keep start up short
+        import object_formats
+        text = output_words
+        if sizes:
+            import compressor
+            text = compressor.to_bytes(zip(output_words, sizes))
+        object_formats.write_object(text, output_labels, args.format, out or sys.stdout, data = data)
+    else:
+        output(output_words, clean_text, output_labels, mode = mode, out = out, sizes = sizes)
+        if(data):
+            output_data(data, output_labels, mode = mode, out = out)
+
+    if(stats):
+        stats.end_pass("output", started, len(machine_words), len(machine_words))
+    if(args and args.stats):
+        stats.write(args.stats)
+    if(args and args.pipeline):
+        import pipeline_analysis
+        pipeline_analysis.write_report(machine_words, clean_text, labels, hazards = args.pipeline == "hazards")
+    if sizes:
+        return [halfword_to_binary(word) if size == 2 else word_to_binary(word) for word, size in zip(output_words, sizes)]
+    return [word_to_binary(word) for word in machine_words]
+
+def assemble_program(asm_lines, pseudos = None, jobs = 1, stats = None, optimize = False, prune = False, schedule = None,
+                     relax = False, pool = False, data = None):
+    """Runs every pass of the assembler over a list of strings of assembly code 
+    without printing anything. Returns a tuple of the list of machine words 
+    (as integers), the list of `AsmLine` records they were assembled from and 
+    the labels dictionary.
+
+    `pseudos` defaults to `pseudoinstruction_handler.get_pseudoinstruction_defs()`.
+    If `stats` is an `assembly_stats.AssemblyStats` each pass is measured 
+    into it. If the source has directives the `data_pass` runs first and
+    adds its `.data` sections to `data` (if given, the labels dictionary
+    has the data labels either way). If `pool` is True the `pool_pass` runs next and adds the
+    constant pool to `data`, a `data_segment.DataSegment`. If `optimize` is True the `peephole_pass` runs after the
+    pseudoinstructions are expanded, if `prune` is True the `prune_pass` runs
+    after the labels are extracted. If `relax` is True the `relax_pass` runs
+    next. If `schedule` is "forwarding" or "no-forwarding" the 
+    `schedule_pass` runs last, for that pipeline."""
+
+    if pseudos == None:
+        pseudos = ph.get_pseudoinstruction_defs()
+    if pool and data == None:
+        raise ValueError("The constant pool needs a data segment")
+    if stats == None:
+        stats = NO_STATS
+
+    #split every line into tokens once, dropping comments and blanks
+    started = stats.start()
+    asm_list = lex_pass(asm_lines)
+    stats.end_pass("lex", started, len(asm_lines), len(asm_list))
+
+    #take out the data sections and the data labels
+    data_labels = {}
+    if has_directives(asm_list):
+        started = stats.start()
+        count = len(asm_list)
+        asm_list, data_labels = data_pass(asm_list, data)
+        stats.end_pass("data", started, count, len(asm_list))
+
+    #load the constants li uses the most from memory, counting their instructions
+    if pool:
+        started = stats.start()
+        asm_list, before, after = pool_pass(asm_list, data)
+        stats.end_pass("pool", started, before, after)
+
+    #replace the pseudoinstructions with core instructions
+    stats.count_pseudos(asm_list, pseudos)
+    started = stats.start()
     core_asm = pseudoinstruction_pass(asm_list, pseudos)
+    stats.end_pass("pseudoinstructions", started, len(asm_list), len(core_asm))
+
+    #rewrite wasteful instruction sequences, counting instructions instead of records
+    if optimize:
+        started = stats.start()
+        core_asm, removed = peephole_pass(core_asm)
+        count = sum(1 for record in core_asm if record.command) if stats != NO_STATS else 0
+        stats.end_pass("peephole", started, count + removed, count)
 
     #extract the labels
-    print("Creating labels...")
+    started = stats.start()
     clean_code, labels = parse_labels(core_asm)
+    stats.end_pass("labels", started, len(core_asm), len(clean_code))
+
+    #drop the code that can never run
+    if prune:
+        started = stats.start()
+        clean_code, labels, removed = prune_pass(clean_code, labels)
+        stats.end_pass("prune", started, len(clean_code) + removed, len(clean_code))
+
+    #rewrite the branches that can not reach their targets
+    if relax:
+        started = stats.start()
+        clean_code, labels, relaxed = relax_pass(clean_code, labels)
+        stats.end_pass("relax", started, len(clean_code) - relaxed, len(clean_code))
+
+    #reorder the instructions of each basic block to avoid stalls
+    if schedule:
+        started = stats.start()
+        clean_code = schedule_pass(clean_code, labels, schedule == "forwarding")[0]
+        stats.end_pass("schedule", started, len(clean_code), len(clean_code))
 
     #assemble each line
-    print("Translating to machine code...")
-    machine_code = machine_pass(clean_code, labels)
-    
-    #output the code
-    #set out=None to print to console
-    print("Outputting...")
-    mode = None
-    out = None
-    if(args):
-        out = args.out
-        if(args.verbose):
-            mode = None
-        else:
-            mode = args.mode
-    output(machine_code, clean_code, labels, mode = mode, out = out)
+    started = stats.start()
+    machine_words = machine_words_pass(clean_code, labels, jobs)
+    stats.end_pass("machine code", started, len(clean_code), len(machine_words))
+    stats.count_types(clean_code)
 
-    print("Done.")
-    return machine_code
+    labels.update(data_labels)
+    return (machine_words, clean_code, labels)
 
 ##############
 #
 # Helpers which define the major passes of the assembler 
 #
+# `lex_pass` turns the source into `AsmLine` records once, every later pass
+# works on those records. For convenience the passes also accept plain 
+# strings, in which case they return strings as well. The optional passes
+# import their modules when they run, to keep start up short.
+#
 ##############
 def comments_pass(asm_lines):
     """Takes in a list representing the contents of an asm file.
@@ -79,65 +248,155 @@ def comments_pass(asm_lines):
         asm_list.append(line)
     return asm_list
 
+def lex_pass(asm_lines, first_line_number=1):
+    """Takes in a list (or any iterable) representing the contents of an asm file.
+        Returns a list of `AsmLine` records, one for each line that is not a 
+        comment or blank. Each record remembers its line number in the 
+        source, counting from `first_line_number`."""
+    asm_list = []
+    for line_number, line in enumerate(asm_lines, first_line_number):
+        record = tokenize_line(line, line_number)
+        if(record == None):
+            #this was a comment or blank line
+            continue
+        asm_list.append(record)
+    return asm_list
+
+def data_pass(assembly_lines, data = None):
+    """Takes in a list of assembly instructions (pseudoinstructions and labels
+        are okay) and a `data_segment.DataSegment`. Returns a tuple of a new
+        list with only the `.text` sections, where the `la`, `lw` and `sw` of
+        data labels are core instructions, and the dictionary of the data
+        labels. The values of the `.data` sections are added to `data`, or
+        left out if it is `None`. See `data_segment.assemble_data`."""
+    records, is_text = lex_if_text(assembly_lines)
+    records, labels = data_segment.assemble_data(records, data if data != None else data_segment.DataSegment())
+    if is_text:
+        return (records_to_text(records), labels)
+    return (records, labels)
+
 def pseudoinstruction_pass(assembly_lines, pseudos_dictionary):
     """Takes in a list of assembly instructions (with no comments, labels are okay) 
         and returns a new list where any pseudoinstructions are replaced with their 
         equivalent core instructions."""
 
+    records, is_text = lex_if_text(assembly_lines)
     modified_instructions = []
-    index = 0
 
-    for line in assembly_lines:
-        instruction = remove_comments(line)
-        if instruction == None:
-            instruction = line
-        
-        split_instruction = instruction.strip().replace(",", " ").split()
-
-        if has_label(instruction):
-            label, instruction = split_out_label(line)
-            label += ":"
-            split_instruction = instruction.strip().replace(",", " ").split()
-            command = split_instruction[0]
-            if command in pseudos_dictionary:
-                psuedo_command = pseudos_dictionary[command]
-                expanded_instructions = psuedo_command(instruction, index)
-                modified_instructions.append(label)
-                
-                for expanded_instruction in expanded_instructions:
-                    modified_instructions.append(expanded_instruction)
-                    index += 1
-            
-            else:
-                modified_instructions.append(label)
-                modified_instructions.append(instruction)
-                index += 1
-            
-        elif split_instruction[0] in pseudos_dictionary:
-            command = split_instruction[0]
-            psuedo_command = pseudos_dictionary[command]
-            expanded_instructions = psuedo_command(line, index)
+    for record in records:
+        if record.command in pseudos_dictionary:
+            if record.label:
+                modified_instructions.append(AsmLine(record.label, None, (), record.line_number))
 
-            for expanded_instruction in expanded_instructions:
-                modified_instructions.append(expanded_instruction)
-                index += 1
+            psuedo_command = pseudos_dictionary[record.command]
+            modified_instructions.extend(psuedo_command(record, record.line_number))
 
         else:
-            modified_instructions.append(line)
-            index += 1
-            
+            modified_instructions.append(record)
 
+    if is_text:
+        return records_to_text(modified_instructions)
     return modified_instructions
 
+def pool_pass(assembly_lines, data):
+    """Takes in a list of assembly instructions (pseudoinstructions and labels
+        are okay) and a `data_segment.DataSegment`. Returns a tuple of a new
+        list where the `li` of constants used often enough are loads from a
+        constant pool added to `data`, the number of instructions the `li`s
+        took before and the number they take now. See `constant_pool`."""
+    import constant_pool
+    records, is_text = lex_if_text(assembly_lines)
+    records, before, after = constant_pool.pool_constants(records, data)
+    if is_text:
+        return (records_to_text(records), before, after)
+    return (records, before, after)
+
+def peephole_pass(assembly_lines):
+    """Takes in a list of assembly instructions with no pseudoinstructions (labels
+        are okay) and returns a tuple of a new list where wasteful sequences of
+        instructions are replaced with shorter ones, and the number of
+        instructions removed. See `peephole` for the rules."""
+    import peephole
+    records, is_text = lex_if_text(assembly_lines)
+    records, removed = peephole.optimize(records)
+    if is_text:
+        return (records_to_text(records), removed)
+    return (records, removed)
+
+def prune_pass(assembly_lines, labels_dictionary):
+    """Takes in a list of assembly instructions with no labels or pseudoinstructions
+        and the labels dictionary. Returns a tuple of a new list without the
+        basic blocks that can not be reached from the first instruction, the
+        new labels dictionary and the number of instructions removed. See
+        `control_flow.remove_unreachable`."""
+    import control_flow
+    return control_flow.remove_unreachable(assembly_lines, labels_dictionary)
+
+def relax_pass(assembly_lines, labels_dictionary):
+    """Takes in a list of assembly instructions with no labels or pseudoinstructions
+        and the labels dictionary. Returns a tuple of a new list where every
+        branch out of range of its target is replaced by the inverted branch
+        over a `jal`, the new labels dictionary and the number of branches
+        replaced. See `relaxation`."""
+    import relaxation
+    return relaxation.relax(assembly_lines, labels_dictionary)
+
+def schedule_pass(assembly_lines, labels_dictionary, forwarding = True):
+    """Takes in a list of assembly instructions with no labels or pseudoinstructions
+        and the labels dictionary. Returns a tuple of a new list where the
+        instructions of each basic block are reordered to avoid pipeline stalls
+        (with or without `forwarding`), and the number of stall cycles saved.
+        See `scheduler`."""
+    import scheduler
+    return scheduler.schedule(assembly_lines, labels_dictionary, forwarding)
+
+def compress_pass(machine_words, labels_dictionary):
+    """Takes in the list of machine words (as integers) of a program and the labels
+        dictionary. Returns a tuple of a new list where the instructions with an
+        RV32C equivalent are replaced by the 16-bit instruction, the list of the
+        size in bytes of each instruction and the labels dictionary with the new
+        addresses. See `compressor`."""
+    import compressor
+    parcels, addresses = compressor.compress(machine_words)
+    return ([value for value, size in parcels], [size for value, size in parcels],
+            compressor.compress_labels(labels_dictionary, addresses))
+
+def report_removed(record):
+    """`assembly_stats` hook writing how many instructions the peephole and
+        prune passes removed, how many branches the relax pass rewrote, how
+        many instructions the `li`s take with the constant pool and how many
+        instructions were compressed (measured in bytes of text)."""
+    if record.name in ["peephole", "prune"]:
+        sys.stderr.write("%s: removed %s of %s instructions\n" % (record.name, record.lines_in - record.lines_out, record.lines_in))
+    elif record.name == "relax":
+        sys.stderr.write("relax: rewrote %s out of range branches\n" % (record.lines_out - record.lines_in))
+    elif record.name == "pool":
+        sys.stderr.write("pool: li takes %s instructions instead of %s\n" % (record.lines_out, record.lines_in))
+    elif record.name == "compress":
+        sys.stderr.write("compress: %s of %s instructions compressed, %s bytes of text instead of %s\n"
+                         % ((record.lines_in - record.lines_out) // 2, record.lines_in // 4, record.lines_out, record.lines_in))
+
 def machine_pass(asm_lines, labels_dictionary):
     """Taken in a list of assembly lines with no comments or pseudoinstructions. 
         Returns a list containing the binary machine translation of each line."""
-    machine_code = []
-    for i, line in enumerate(asm_lines):
-        result = Assemble(line, i, labels_dictionary)
-        machine_code.append(result)
+    return [word_to_binary(word) for word in machine_words_pass(asm_lines, labels_dictionary)]
 
-    return machine_code
+def machine_words_pass(asm_lines, labels_dictionary, jobs = 1):
+    """Same as `machine_pass` but returns each machine translation as a 
+        32-bit integer. 
+        
+        If `jobs` is more than 1 large programs are encoded by that many 
+        worker processes, see `parallel_encoder`."""
+    records, is_text = lex_if_text(asm_lines)
+    if jobs > 1:
+        import parallel_encoder
+        return parallel_encoder.encode_parallel(records, labels_dictionary, jobs)
+
+    machine_words = []
+    for i, record in enumerate(records):
+        machine_words.append(encode(record.command, record.operands, record.line_number, labels_dictionary, i))
+
+    return machine_words
 
 ##############
 #
@@ -163,14 +422,107 @@ def Assemble(instruction, line_number=0, labels=None):
         `0000 1111 0000 1111 0000 1111 0000 1111`
 
         The spacing is intended to make debugging easier.
+
+        This is a thin wrapper around `encode_instruction`, which does the 
+        actual work on integers. Results are memoized in `instruction_cache`,
+        see `InstructionCache`.
         """
-    
-    if has_label(instruction):
-        instruction = instruction[1:]
 
-    split_instructions = instruction.strip().replace(",", " ").split()
-    command = split_instructions[0]
-    arguments = split_instructions[1:]
+    return instruction_cache.assemble(instruction, line_number, labels)
+
+def encode_instruction(instruction, line_number=0, labels=None):
+    """Same as `Assemble` but returns the machine code as a 32-bit integer 
+        instead of a binary string."""
+
+    record = tokenize_line(instruction, line_number)
+    if record == None or record.command == None:
+        raise BadInstruction("No instruction found on line %s:\n\t%s\n" % (line_number, instruction))
+
+    return encode(record.command, record.operands, line_number, labels)
+
+class InstructionCache():
+    """
+    A bounded least recently used cache for assembling single instructions,
+    keyed by the text of the instruction.
+
+    Instructions whose machine code does not depend on the line number or
+    the labels (everything except branches and jumps to labels) are stored
+    fully assembled. Branches and jumps to labels are stored tokenized, so
+    only their offset is computed again. Instructions that raise an error
+    are not stored. `hits` and `misses` count the lookups, to size the cache.
+    """
+    def __init__(self, max_size = 4096):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, instruction, line_number, labels):
+        """Returns the entry for `instruction`, assembling and storing it on a
+            miss: a tuple of the machine word and its binary string, or an
+            `AsmLine` record for instructions that depend on the labels."""
+        entry = self.entries.get(instruction)
+        if entry != None:
+            self.hits += 1
+            self.entries.move_to_end(instruction)
+            return entry
+
+        self.misses += 1
+        record = tokenize_line(instruction, line_number)
+        if record == None or record.command == None:
+            raise BadInstruction("No instruction found on line %s:\n\t%s\n" % (line_number, instruction))
+        if instructions_to_types.get(record.command) in [Types.SB, Types.UJ] and not (record.operands and is_int(record.operands[-1])):
+            #check the registers and label now so bad instructions are never stored
+            encode(record.command, record.operands, line_number, labels)
+            entry = record
+        else:
+            word = encode(record.command, record.operands, line_number, labels)
+            entry = (word, word_to_binary(word))
+
+        if self.max_size > 0:
+            self.entries[instruction] = entry
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def encode(self, instruction, line_number=0, labels=None):
+        """Same as `encode_instruction`, using the cache."""
+        entry = self.lookup(instruction, line_number, labels)
+        if type(entry) == tuple:
+            return entry[0]
+        return encode(entry.command, entry.operands, line_number, labels)
+
+    def assemble(self, instruction, line_number=0, labels=None):
+        """Same as `Assemble`, using the cache."""
+        entry = self.lookup(instruction, line_number, labels)
+        if type(entry) == tuple:
+            return entry[1]
+        return word_to_binary(encode(entry.command, entry.operands, line_number, labels))
+
+    def clear(self):
+        """Removes every entry and resets the counters. Call this after changing
+            the instruction or register tables."""
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Returns a dictionary with the counters, size and hit rate of the cache."""
+        lookups = self.hits + self.misses
+        return {"hits":self.hits, "misses":self.misses, "size":len(self.entries), "max_size":self.max_size,
+                "hit_rate":self.hits / lookups if lookups else 0.0}
+
+instruction_cache = InstructionCache()
+"""The cache used by `Assemble`"""
+
+def encode(command, arguments, line_number=0, labels=None, index=None):
+    """Takes an instruction name and its operands (as a list or tuple) and calls 
+        the correct `encode_X_Type` helper, returning the 32-bit machine word as an
+        integer.
+
+        `line_number` is only used in error messages. `index` is the position of 
+        the instruction in the program, used to compute label offsets, when it 
+        is `None` the `line_number` is used as the index."""
 
     if command in instructions_to_types:
         instruction_type = instructions_to_types[command]
@@ -178,34 +530,121 @@ def Assemble(instruction, line_number=0, labels=None):
         raise BadInstruction("Invalid instruction found on line %s:\n\t%s %s\n" % (line_number, command, arguments))
 
     if instruction_type == Types.R:
-        result = Assemble_R_Type(command, arguments, line_number)
+        result = encode_R_Type(command, arguments, line_number)
 
     elif instruction_type == Types.I:
-        result = Assemble_I_Type(command, arguments, line_number)
+        result = encode_I_Type(command, arguments, line_number)
 
     elif instruction_type == Types.S:
-        result = Assemble_S_Type(command, arguments, line_number)
+        result = encode_S_Type(command, arguments, line_number)
 
     elif instruction_type == Types.SB:
-        result = Assemble_SB_Type(command, arguments, line_number, labels)
+        result = encode_SB_Type(command, arguments, line_number, labels, index)
 
     elif instruction_type == Types.U:
-        result = Assemble_U_Type(command, arguments, line_number)
+        result = encode_U_Type(command, arguments, line_number)
 
     elif instruction_type == Types.UJ:
-        result = Assemble_UJ_Type(command, arguments, line_number, labels)
+        result = encode_UJ_Type(command, arguments, line_number, labels, index)
 
     else:
         raise BadInstruction("Invalid instruction found on line %s:\n\t%s %s\n" % (line_number, command, arguments))
     
     return result
 
+##############
+#
+# Binary string wrappers
+#
+# The `Assemble_X_Type` functions are kept for callers that want the 
+# spaced binary string, each one just formats the integer produced by 
+# the matching `encode_X_Type` function below.
+#
+##############
+
 def Assemble_R_Type(command, operands, line_number):
     """Takes an R Type instruction name and its operands (as a list) and 
         returns the appropriate binary string. A basic call would look like:
         
         `Assemble_R_Type("add", ["t0", "t1", "x2"], 0)`
 
+        See `encode_R_Type` for the exceptions raised.
+    """
+    return word_to_binary(encode_R_Type(command, operands, line_number))
+
+def Assemble_I_Type(command, operands, line_number):
+    """Takes an I Type instruction name and its operands (as a list) and 
+        returns the appropriate binary string.
+
+        See `encode_I_Type` for the exceptions raised.
+    """
+    return word_to_binary(encode_I_Type(command, operands, line_number))
+
+def Assemble_I_Type_shift(command, operands, line_number):
+    """Takes an I Type instruction name and its operands and returns 
+        the appropriate binary string.
+
+        See `encode_I_Type_shift` for the exceptions raised.
+    """
+    return word_to_binary(encode_I_Type_shift(command, operands, line_number))
+
+def Assemble_I_Type_base_offset(command, operands, line_number):
+    """Takes the operands for a lw or jalr instruction and returns the 
+        appropriate binary string.
+
+        See `encode_I_Type_base_offset` for the accepted syntax and the 
+        exceptions raised.
+    """
+    return word_to_binary(encode_I_Type_base_offset(command, operands, line_number))
+
+def Assemble_S_Type(command, operands, line_number):
+    """Takes the operands for an S Type instruction and returns the 
+        appropriate binary string.
+
+        See `encode_S_Type` for the exceptions raised.
+    """
+    return word_to_binary(encode_S_Type(command, operands, line_number))
+
+def Assemble_SB_Type(command, operands, line_number, labels=None):
+    """Takes an SB Type instruction name and its operands (as a list) 
+        and returns the appropriate binary string. 
+
+        See `encode_SB_Type` for how offsets and labels are handled and the 
+        exceptions raised.
+    """
+    return word_to_binary(encode_SB_Type(command, operands, line_number, labels))
+
+def Assemble_U_Type(command, operands, line_number):
+    """Takes an U Type instruction name and its operands 
+        (as a list) and returns the appropriate binary string.
+
+        See `encode_U_Type` for the exceptions raised.
+    """
+    return word_to_binary(encode_U_Type(command, operands, line_number))
+
+def Assemble_UJ_Type(command, operands, line_number, labels):
+    """Takes an UJ Type instruction name and its operands 
+        (as a list) and returns the appropriate binary string.
+
+        See `encode_UJ_Type` for how offsets and labels are handled and the 
+        exceptions raised.
+    """
+    return word_to_binary(encode_UJ_Type(command, operands, line_number, labels))
+
+##############
+#
+# Integer encoders
+#
+# Each of these returns the instruction as a 32-bit integer built with 
+# shifts and masks. `FieldData.base` already holds the opcode, func3 and 
+# func7 bits in place so only the operand fields need to be or'd in.
+#
+##############
+
+def encode_R_Type(command, operands, line_number):
+    """Takes an R Type instruction name and its operands (as a list) and 
+        returns the machine word as an integer.
+
         Raises BadInstruction exception when the command is not a valid R-type.
 
         Raises BadOperands exception when the wrong number of operands is
@@ -225,23 +664,15 @@ def Assemble_R_Type(command, operands, line_number):
         if not is_register_name(register):
             raise BadRegister("Found invalid register name in R Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
 
-    field_data = instructions_to_fields[command]
-    rd  = get_binary_string_of_register(operands[0])
-    rs1 = get_binary_string_of_register(operands[1])
-    rs2 = get_binary_string_of_register(operands[2])
-
-    instruction_field_list = [field_data.func7,
-                            rs2,
-                            rs1,
-                            field_data.func3,
-                            rd, 
-                            field_data.opcode]
+    rd  = register_name_to_num[operands[0]]
+    rs1 = register_name_to_num[operands[1]]
+    rs2 = register_name_to_num[operands[2]]
 
-    return join_binary_string_into_groups_of_four(instruction_field_list)
+    return instructions_to_fields[command].base | (rs2 << 20) | (rs1 << 15) | (rd << 7)
 
-def Assemble_I_Type(command, operands, line_number):
+def encode_I_Type(command, operands, line_number):
     """Takes an I Type instruction name and its operands (as a list) and 
-        returns the appropriate binary string.
+        returns the machine word as an integer.
 
         Raises BadInstruction exception when the cmd is not a valid I-type.
 
@@ -256,7 +687,7 @@ def Assemble_I_Type(command, operands, line_number):
     """
 
     if command in ["lw", "jalr"]:
-        return Assemble_I_Type_base_offset(command, operands, line_number)
+        return encode_I_Type_base_offset(command, operands, line_number)
 
     if len(operands) != 3:
         raise BadOperands("Incorrect number of operands found in I Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
@@ -273,24 +704,17 @@ def Assemble_I_Type(command, operands, line_number):
             raise BadRegister("Found invalid register name in I Type on line %s with args:\n\t%s %s\n" % (line_number, command, registers))
     
     if is_shift_immediate_instance(command):
-        return Assemble_I_Type_shift(command, operands, line_number)
+        return encode_I_Type_shift(command, operands, line_number)
 
-    field_data = instructions_to_fields[command]
-    rd = get_binary_string_of_register(operands[0])
-    rs1 = get_binary_string_of_register(operands[1])
-    immediate = decimal_to_binary(operands[2], 12)
+    rd = register_name_to_num[operands[0]]
+    rs1 = register_name_to_num[operands[1]]
+    immediate = decimal_to_field(operands[2], 12)
 
-    instruction_field_list = [immediate,
-                            rs1,
-                            field_data.func3,
-                            rd,
-                            field_data.opcode]
+    return instructions_to_fields[command].base | (immediate << 20) | (rs1 << 15) | (rd << 7)
 
-    return join_binary_string_into_groups_of_four(instruction_field_list)
-
-def Assemble_I_Type_shift(command, operands, line_number):
-    """Takes an I Type instruction name and its operands and returns 
-        the appropriate binary string.
+def encode_I_Type_shift(command, operands, line_number):
+    """Takes an I Type shift instruction name and its operands and returns 
+        the machine word as an integer.
 
         Raises BadInstruction exception when the cmd is not a valid I-type
         shift.
@@ -305,36 +729,27 @@ def Assemble_I_Type_shift(command, operands, line_number):
         greater than 31.
         """
 
-    field_data = instructions_to_fields[command]
-    rd = get_binary_string_of_register(operands[0])
-    rs1 = get_binary_string_of_register(operands[1])
-    immediate_value = int(operands[2])
+    rd = get_register_number(operands[0])
+    rs1 = get_register_number(operands[1])
+    immediate_value = parse_immediate(operands[2])
 
     if immediate_value < 0 or immediate_value > 31:
         raise BadImmediate("Invalid immediate value for shift instruction on line %s:\n\t%s %s\n" % (line_number, command, operands))
-    
-    valid_immediate = decimal_to_binary(operands[2], 12)
 
     if command == "slli" or command == "srli":
-        valid_immediate = "0000000" + valid_immediate[7:]
+        immediate = immediate_value
 
     elif command == "srai":
-        valid_immediate = "0100000" + valid_immediate[7:]
+        immediate = 0b0100000 << 5 | immediate_value
 
     else:
         raise BadInstruction("Invalid I Type shift instruction found on line %s:\n\t%s %s\n" % (line_number, command, operands))
-    
-    instruction_field_list = [valid_immediate,
-                            rs1,
-                            field_data.func3,
-                            rd,
-                            field_data.opcode]
 
-    return join_binary_string_into_groups_of_four(instruction_field_list)
+    return instructions_to_fields[command].base | (immediate << 20) | (rs1 << 15) | (rd << 7)
     
-def Assemble_I_Type_base_offset(command, operands, line_number):
+def encode_I_Type_base_offset(command, operands, line_number):
     """Takes the operands for a lw or jalr instruction and returns the 
-        appropriate binary string.
+        machine word as an integer.
 
         Note that the following are valid syntax for base-offset instructions (like jalr):
             jalr x0, 4 (ra)  // <- space betwen 4 and (ra)
@@ -353,37 +768,29 @@ def Assemble_I_Type_base_offset(command, operands, line_number):
         Raises BadImmediate exception when the value provided will not fit in
         the immediate space for the instruction or if there is a register
         specifier in the immediate operand location.
- """
+    """
 
-    field_data = instructions_to_fields[command]
-    rd = get_binary_string_of_register(operands[0])
+    rd = get_register_number(operands[0])
     
     if len(operands) == 2:
-        immediate, rs1 = parse_base_offset(operands[1])
+        immediate, rs1 = parse_base_offset_fields(operands[1])
 
     elif len(operands) == 3:
         if is_int(operands[1]):
-            immediate, rs1 = parse_base_offset(operands[1] + operands[2])
+            immediate, rs1 = parse_base_offset_fields(operands[1] + operands[2])
         
         else:
-            rs1 = get_binary_string_of_register(operands[1])
-            immediate = decimal_to_binary(operands[2])
+            rs1 = get_register_number(operands[1])
+            immediate = decimal_to_field(operands[2], 12)
 
     else:
         raise BadOperands("Incorrect number of operands found in I Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
 
-    instruction_field_list = [immediate,
-                            rs1,
-                            field_data.func3,
-                            rd,
-                            field_data.opcode]
-
-    return join_binary_string_into_groups_of_four(instruction_field_list)
-
+    return instructions_to_fields[command].base | (immediate << 20) | (rs1 << 15) | (rd << 7)
 
-def Assemble_S_Type(command, operands, line_number):
+def encode_S_Type(command, operands, line_number):
     """Takes the operands for an S Type instruction and returns the 
-        appropriate binary string.
+        machine word as an integer.
 
         Raises BadInstruction exception when the cmd is not a valid S-type
         instruction.
@@ -399,38 +806,25 @@ def Assemble_S_Type(command, operands, line_number):
         specifier in the immediate operand location.
     """
 
-    field_data = instructions_to_fields[command]
-
     if instructions_to_types[command] != Types.S:
         raise BadInstruction("Invalid S Type instruction found on line %s:\n\t%s %s\n" % (line_number, command, operands))
 
     if len(operands) != 2:
         raise BadOperands("Incorrect number of operands found in SB Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
     
-    immediate, rs1 = parse_base_offset(operands[1])
-    rs2 = get_binary_string_of_register(operands[0])
+    immediate, rs1 = parse_base_offset_fields(operands[1])
+    rs2 = get_register_number(operands[0])
 
-    instruction_field_list = [immediate[0:6],
-                            rs2,
-                            rs1,
-                            field_data.func3,
-                            immediate[7:],
-                            field_data.opcode]
+    #imm[11:5] goes in the top 7 bits, imm[4:0] where rd would be
+    return (instructions_to_fields[command].base 
+            | ((immediate >> 5) << 25) 
+            | (rs2 << 20) 
+            | (rs1 << 15) 
+            | ((immediate & 0x1f) << 7))
 
-    output = join_binary_string_into_groups_of_four(instruction_field_list)
-
-    if immediate[0] == "1":
-        output = "1" + output[1:]
-
-    else:
-        output = "0" + output[1:]
-
-    return output
-
-
-def Assemble_SB_Type(command, operands, line_number, labels=None):
+def encode_SB_Type(command, operands, line_number, labels=None, index=None):
     """Takes an SB Type instruction name and its operands (as a list) 
-        and returns the appropriate binary string. 
+        and returns the machine word as an integer. 
         
         This method assumes that if a number is passed in as the 
         third operand (`operands[2]`) it is the PC offset, not the immediate. 
@@ -443,6 +837,8 @@ def Assemble_SB_Type(command, operands, line_number, labels=None):
         In both cases the `line_number` is used to calculate the immediate from
         the offset. You should assume that a `line_number` equal to 0 indicates
         an instruction at the beginning of the text segment of memory. 
+        If `index` is given it is used for the offset instead and `line_number`
+        is only used for error messages.
 
         Raises BadInstruction exception when the cmd is not a valid SB-type.
 
@@ -457,8 +853,6 @@ def Assemble_SB_Type(command, operands, line_number, labels=None):
         specifier in the immediate operand location.
         """
 
-    field_data = instructions_to_fields[command]
-
     if instructions_to_types[command] != Types.SB:
         raise BadInstruction("Invalid SB Type instruction found on line %s:\n\t%s %s\n" % (line_number, command, operands))
     
@@ -478,27 +872,30 @@ def Assemble_SB_Type(command, operands, line_number, labels=None):
         offset = int(offset_intermediate)
 
     else:
-        offset = label_to_offset(labels, offset_intermediate, line_number)
+        offset = label_to_offset(labels, offset_intermediate, line_number if index == None else index)
 
-    immediate = decimal_to_binary(offset >> 1, 12)
+    #the offset is signed, one past the range would wrap around to the other direction
+    if not -4096 <= offset < 4096:
+        raise BadImmediate("Branch offset %s does not fit in -4096 to 4094 bytes (see --relax) on line %s with args:\n\t%s %s\n" % (offset, line_number, command, operands))
 
-    rs1 = get_binary_string_of_register(operands[0])
-    rs2 = get_binary_string_of_register(operands[1])
+    #the 12 bit immediate holds offset[12:1]
+    immediate = decimal_to_field(offset >> 1, 12)
 
-    instruction_field_list = [immediate[0],
-                            immediate[2:8],
-                            rs2,
-                            rs1,
-                            field_data.func3,
-                            immediate[8:],
-                            immediate[1],
-                            field_data.opcode]
-    
-    return join_binary_string_into_groups_of_four(instruction_field_list)
+    rs1 = register_name_to_num[operands[0]]
+    rs2 = register_name_to_num[operands[1]]
 
-def Assemble_U_Type(command, operands, line_number):
+    #scatter the immediate: imm[12|10:5] on top, imm[4:1|11] where rd would be
+    return (instructions_to_fields[command].base
+            | ((immediate >> 11) << 31)
+            | (((immediate >> 4) & 0x3f) << 25)
+            | (rs2 << 20)
+            | (rs1 << 15)
+            | ((immediate & 0xf) << 8)
+            | (((immediate >> 10) & 0x1) << 7))
+
+def encode_U_Type(command, operands, line_number):
     """Takes an U Type instruction name and its operands 
-        (as a list) and returns the appropriate binary string.
+        (as a list) and returns the machine word as an integer.
 
         Raises BadInstruction exception when the cmd is not a valid U-type.
 
@@ -513,8 +910,6 @@ def Assemble_U_Type(command, operands, line_number):
         specifier in the immediate operand location.
     """
 
-    field_data = instructions_to_fields[command]
-
     if instructions_to_types[command] != Types.U:
         raise BadInstruction("Invalid U Type instruction found on line %s:\n\t%s %s\n" % (line_number, command, operands))
     
@@ -524,24 +919,22 @@ def Assemble_U_Type(command, operands, line_number):
     if not is_register_name(operands[0]):
         raise BadRegister("Found invalid register name in U Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
     
-    rd = get_binary_string_of_register(operands[0])
-    immediate = decimal_to_binary(operands[1], 20)
+    rd = register_name_to_num[operands[0]]
+    immediate = decimal_to_field(operands[1], 20)
 
-    instruction_field_list = [immediate,
-                            rd,
-                            field_data.opcode]
-    
-    return join_binary_string_into_groups_of_four(instruction_field_list)
+    return instructions_to_fields[command].base | (immediate << 12) | (rd << 7)
 
-def Assemble_UJ_Type(command, operands, line_number, labels):
+def encode_UJ_Type(command, operands, line_number, labels, index=None):
     """Takes an UJ Type instruction name and its operands 
-        (as a list) and returns the appropriate binary string.
+        (as a list) and returns the machine word as an integer.
 
         This method assumes that if a number is passed in as 
         the third operand (`operands[2]`) it is the PC offset, 
         not the immediate. Therefore the offset will be 
         right-shifted before the immediate is generated. 
         Otherwise it is assumed to be a label defined in `labels`.
+        As with `encode_SB_Type` the offset is computed from `index` if it is
+        given, otherwise from `line_number`.
 
         Raises BadInstruction exception when the cmd is not a valid UJ-type.
 
@@ -558,8 +951,6 @@ def Assemble_UJ_Type(command, operands, line_number, labels):
         Raises BadLabel exception if the immediate operand provided is a label
         but it is not defined in the `labels` dictionary.
     """
-        
-    field_data = instructions_to_fields[command]
 
     if instructions_to_types[command] != Types.UJ:
         raise BadInstruction("Invalid UJ Type instruction found on line %s:\n\t%s %s\n" % (line_number, command, operands))
@@ -567,10 +958,10 @@ def Assemble_UJ_Type(command, operands, line_number, labels):
     if len(operands) != 2:
         raise BadOperands("Incorrect number of operands found in UJ Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
     
-    rd = operands[0]
-    rd_in_binary = get_binary_string_of_register(rd)
-    if not is_register_name(rd):
+    if not is_register_name(operands[0]):
         raise BadRegister("Found invalid register name in UJ Type on line %s with args:\n\t%s %s\n" % (line_number, command, operands))
+
+    rd = register_name_to_num[operands[0]]
     
     offset_intermediate = operands[1]
     if is_register_name(offset_intermediate):
@@ -580,18 +971,22 @@ def Assemble_UJ_Type(command, operands, line_number, labels):
         offset = int(offset_intermediate)
     
     else:
-        offset = label_to_offset(labels, offset_intermediate, line_number)
-    
-    immediate = decimal_to_binary(offset >> 1, 20)
+        offset = label_to_offset(labels, offset_intermediate, line_number if index == None else index)
     
-    instruction_field_list = [immediate[0],
-                              immediate[10:20],
-                              immediate[9],
-                              immediate[1:9],
-                              rd_in_binary,
-                              field_data.opcode]
+    #the offset is signed, one past the range would wrap around to the other direction
+    if not -(1 << 20) <= offset < (1 << 20):
+        raise BadImmediate("Jump offset %s does not fit in 20 bits on line %s with args:\n\t%s %s\n" % (offset, line_number, command, operands))
+
+    #the 20 bit immediate holds offset[20:1]
+    immediate = decimal_to_field(offset >> 1, 20)
     
-    return join_binary_string_into_groups_of_four(instruction_field_list)
+    #scatter the immediate: imm[20|10:1|11|19:12]
+    return (instructions_to_fields[command].base
+            | ((immediate >> 19) << 31)
+            | ((immediate & 0x3ff) << 21)
+            | (((immediate >> 10) & 0x1) << 20)
+            | (((immediate >> 11) & 0xff) << 12)
+            | (rd << 7))
 
 ##############
 #
@@ -609,6 +1004,44 @@ def remove_comments(line):
     sline = line.split(";")
     return sline[0]
 
+def tokenize_line(line, line_number=0):
+    """Takes a line of raw assembly code and splits it into an `AsmLine` record
+        holding the label, the instruction name and a tuple of operands. 
+        Returns `None` if the line is a comment or blank."""
+    line = remove_comments(line)
+    if(line == None):
+        return None
+
+    (label, instruction) = split_out_label(line)
+    if not instruction:
+        return AsmLine(label, None, (), line_number)
+
+    tokens = instruction.replace(",", " ").split()
+    return AsmLine(label, tokens[0], tuple(tokens[1:]), line_number)
+
+def lex_if_text(assembly_list):
+    """Lets the passes accept either `AsmLine` records or plain strings.
+        Returns a tuple of the records and whether the input was text. Text is 
+        numbered from 0 so error messages match the instruction index."""
+    if assembly_list and type(assembly_list[0]) == str:
+        return (lex_pass(assembly_list, 0), True)
+    return (assembly_list, False)
+
+def has_directives(records):
+    """Returns True if any of the `AsmLine` records is a directive (e.g. `.data`)."""
+    return any(record.command and record.command[0] == "." for record in records)
+
+def records_to_text(records):
+    """Turns a list of `AsmLine` records back into strings, with labels on 
+        their own line."""
+    text = []
+    for record in records:
+        if record.label:
+            text.append(record.label + ":")
+        if record.command:
+            text.append(record.instruction_text())
+    return text
+
 def parse_labels(assembly_list):
     """Takes in a list where each entry is either a label, an instruction, 
         or a label and an instruction. Assumes there are no comments in this code.
@@ -616,27 +1049,23 @@ def parse_labels(assembly_list):
         having been removed), and a dictionary mapping labels to addresses
         in the instruction list."""
     
-    index = 0
+    records, is_text = lex_if_text(assembly_list)
     instructions = []
     labels = {}
 
-    for entry in assembly_list:
-        (label, instruction) = split_out_label(entry)
-        
-        if instruction:
-            instructions.append(instruction)
-
+    for record in records:
+        label = record.label
         if label:
             if label in labels:
-                raise BadLabel("Duplicate label found: %s at line address"  %label, labels[label])
+                raise BadLabel("Duplicate label found on line %s: %s at line address" % (record.line_number, label), labels[label])
             
-            labels[label] = index_to_address(index)
+            labels[label] = index_to_address(len(instructions))
 
-            if not instruction:
-                index -= 1
-            
-        index += 1
+        if record.command:
+            instructions.append(record)
 
+    if is_text:
+        return ([record.instruction_text() for record in instructions], labels)
     return (instructions, labels)
 
 #note: technically we dont need this for RISC-V since all the addresses are PC-relative
@@ -708,8 +1137,9 @@ def has_label(line):
 #
 ##############
 
-def output(machine_code, clean_code, labels, mode = None, out = None):
-    """Takes in two lists, the first a list of binary machine translations,
+def output(machine_code, clean_code, labels, mode = None, out = None, sizes = None):
+    """Takes in two lists, the first a list of machine translations (32-bit 
+    integers, or binary strings as returned by `machine_pass`),
     the second a list containing the raw assembly associated with each 
     instruction (no comments or blank lines).
 
@@ -727,25 +1157,57 @@ def output(machine_code, clean_code, labels, mode = None, out = None):
     If mode is `hex` outputs hex with raw assembly in comments (no binary).
 
     Addresses of each instruction are always printed in the comments.
+
+    `sizes` is the list of the size in bytes of each instruction when some
+    are 16-bit compressed instructions (see `compress_pass`), all are 4 bytes
+    by default.
     """
     i = int("00400000", 16)
     address_to_label = {v:k for (k,v) in labels.items()}
-    for m, c in zip(machine_code, clean_code):
-        label = "\t"
-        if(i in address_to_label):
-            label = address_to_label[i] + ":\t"
-        if(not mode):
-            s = ("%s // 0x%s ;;; %s - %s%s " % (m, bin_to_hex(m), hex(i), label, c.rstrip()))
-        elif (mode == "bin"):
-            s = ("%s // %s - %s%s " % (m, hex(i), label, c.rstrip()))
+    if sizes == None:
+        sizes = [4] * len(machine_code)
+    for m, c, size in zip(machine_code, clean_code, sizes):
+        if(type(m) == str):
+            m = int(m.replace(" ", ""), 2)
+        s = output_line(m, i, address_to_label.get(i), c, mode, size)
+
+        if(out):
+            out.write(s+"\n")
         else:
-            s = ("%s // %s - %s%s " % (bin_to_hex(m), hex(i), label, c.rstrip()))
+            print(s)
+        i += size
 
+def output_data(data, labels, mode = None, out = None):
+    """Writes the words of the `data_segment.DataSegment` `data` after the text
+        segment, in the same format as `output` with a `.word` directive as the
+        assembly text."""
+    address_to_label = {v:k for (k,v) in labels.items()}
+    address = data.base
+    for word in data.words():
+        s = output_line(word, address, address_to_label.get(address), ".word 0x%08x" % word, mode)
         if(out):
             out.write(s+"\n")
         else:
             print(s)
-        i += 4
+        address += 4
+
+def output_line(word, address, label, instruction_text, mode = None, size = 4):
+    """Formats one line of output for `output`: the machine word at `address`
+    followed by comments with the address, the label (or `None`) and the
+    assembly text. See `output` for the modes. A `size` of 2 formats a 16-bit
+    compressed instruction.
+
+    The machine code always comes first and has a fixed width for a given 
+    mode and size, so a line can be rewritten in place once the word is known."""
+    label = "\t" if label == None else label + ":\t"
+    binary = halfword_to_binary(word) if size == 2 else word_to_binary(word)
+    hexadecimal = "%04x" % word if size == 2 else word_to_hex(word)
+    if(not mode):
+        return ("%s // 0x%s ;;; %s - %s%s " % (binary, hexadecimal, hex(address), label, instruction_text.rstrip()))
+    elif (mode == "bin"):
+        return ("%s // %s - %s%s " % (binary, hex(address), label, instruction_text.rstrip()))
+    else:
+        return ("%s // %s - %s%s " % (hexadecimal, hex(address), label, instruction_text.rstrip()))
 
 ##############
 #
@@ -753,6 +1215,52 @@ def output(machine_code, clean_code, labels, mode = None, out = None):
 #
 ##############
 
+class AsmLine():
+    """
+    Tokenized line of assembly code. `label` and `command` may be `None`, 
+    `operands` is a tuple of strings and `line_number` is the line in the 
+    original source this record came from.
+    """
+    __slots__ = ("label", "command", "operands", "line_number")
+
+    def __init__(self, label, command, operands=(), line_number=0):
+        self.label = label
+        self.command = command
+        self.operands = operands
+        self.line_number = line_number
+
+    def instruction_text(self):
+        """Returns the instruction (without the label) as a string, or `None`
+            if this line only holds a label."""
+        if self.command == None:
+            return None
+        if not self.operands:
+            return self.command
+        return "%s %s" % (self.command, ", ".join(self.operands))
+
+    def __repr__(self):
+        return "AsmLine(%r, %r, %r, %r)" % (self.label, self.command, self.operands, self.line_number)
+
+class NullStats():
+    """
+    Stands in for an `assembly_stats.AssemblyStats` when nothing is measured,
+    so `assemble_program` runs the same passes either way.
+    """
+    def start(self):
+        return None
+
+    def end_pass(self, name, started, lines_in, lines_out):
+        return None
+
+    def count_pseudos(self, records, pseudos):
+        pass
+
+    def count_types(self, records):
+        pass
+
+NO_STATS = NullStats()
+"""The `NullStats` used when `assemble_program` gets no stats"""
+
 #Enum of Types
 Types = Enum("Types", ["R", "I", "S", "SB", "U", "UJ", "PSEUDO"])
 """Enum of instruction Types"""
@@ -779,6 +1287,13 @@ class FieldData():
         self.opcode = opcode
         self.func7 = func7
         self.func3 = func3
+        #the fixed bits of the instruction word (opcode, func3 and func7 in 
+        #place) so encoders only need to or in the operand fields
+        self.base = int(opcode, 2)
+        if func3:
+            self.base |= int(func3, 2) << 12
+        if func7:
+            self.base |= int(func7, 2) << 25
 
 #dictionay mapping instruction name to the different fields as a FieldData object
 instructions_to_fields = {#R types
@@ -828,7 +1343,7 @@ register_name_to_num = {"x0":0, "zero":0, "x1":1, "ra":1,
                         "x21":21, "s5":21, "x22":22, "s6":22,
                         "x23":23, "s7":23, "x24":24, "s8":24,
                         "x25":25, "s9":25, "x26":26, "s10":26,
-                        "x27":26, "s11":27, "x28":28, "t3":28,
+                        "x27":27, "s11":27, "x28":28, "t3":28,
                         "x29":29, "t4":29, "x30":30, "t5":30,
                         "x31":31, "at":31
                         }
@@ -838,14 +1353,15 @@ def is_register_name(name):
     """Returns True if the provided name is a valid register name or x value."""
     return name in register_name_to_num.keys()
 
+def get_register_number(name):
+    """Returns the register ID given its name."""
+    if(name not in register_name_to_num):
+        raise BadRegister("Found unknown register name: \n\t%s\n" % name)
+    return register_name_to_num[name]
+
 def get_binary_string_of_register(name):
     """Returns the binary string version of a register ID given its name."""
-    if(name not in register_name_to_num.keys()):
-        raise BadRegister("Found unknown register name: \n\t%s\n" % name)
-        
-    #the [2:] here strips of the leading '0b' in the binary string
-    binary_string = format(register_name_to_num[name], "#05b")[2:]
-    return "0"*(5-len(binary_string)) + binary_string
+    return format(get_register_number(name), "05b")
     
 def is_shift_immediate_instance(inst):
     """Returns true if this is a shift immediate instruction."""
@@ -875,6 +1391,18 @@ def parse_base_offset(operand_string):
     rs1 = get_binary_string_of_register(pieces[1])
     return (imm, rs1)
 
+def parse_base_offset_fields(operand_string):
+    """Same as `parse_base_offset` but returns the 12 bit immediate field and 
+        the register number as integers.
+
+            `parse_base_offset_fields("4(t1)") -> (4, 6)` """
+    operand_string = operand_string.replace(")", "")
+    pieces = operand_string.split("(")
+    if(len(pieces) != 2):
+        raise BadImmediate("Parsing base-offset address, inappropriate number of elements: \n\t%s\n" % operand_string)
+
+    return (decimal_to_field(pieces[0], 12), get_register_number(pieces[1]))
+
 def reverse_string(s):
     """A helper function to reverse strings using list slicing. 
         Just syntactic sugar to help with readability."""
@@ -891,32 +1419,37 @@ def is_int(s):
 
 ###### Functions to convert between different bases #####
 
-def decimal_to_binary(decimal, size=12):
-    """Takes a decimal number (as int or string) and returns the 
-        binary representation with number of bits equal to `size`. 
-        Uses the two's compliment representation for negative numbers."""
-    
+def parse_immediate(decimal):
+    """Takes a decimal number (as int or string) and returns it as an int.
+        Raises BadImmediate if a string can not be parsed."""
     if(type(decimal) == str):
         try:
-            decimal = int(decimal)
+            return int(decimal)
         except ValueError:
             raise BadImmediate("Failed to parse value as an integer: %s" % (decimal))
+    return decimal
+
+def decimal_to_field(decimal, size=12):
+    """Takes a decimal number (as int or string) and returns the unsigned
+        value of its lowest `size` bits, ready to be shifted into an 
+        instruction field. Uses the two's compliment representation for 
+        negative numbers."""
+
+    decimal = parse_immediate(decimal)
     
-    if(decimal >= 2**size):
+    if(decimal >= 1 << size):
         raise BadImmediate("Not enough bits (%s) to represent the decimal number: %s" % (size, decimal))
 
-    #this does some clever math to deal with negative and positive numbers
-    #finds the biggest number in this bit size
-    #then 'and's with the sought number
-    # the 'and' on a positive number will return itself
-    # the 'and' on a negative number will return the positive interpretation of 
-    # the two's compliement number of the negative value
-    binary_string = bin(((1 << size) - 1) & decimal)
-    #the [2:] removes the leading '0b' of the string
-    binary_string = binary_string[2:]
-    #add in any missing leading zeros (this should only affect on positive numbers)
-    #negative numbers will already be the right size
-    return "0"*(size-len(binary_string)) + binary_string
+    #and-ing with the biggest number in this bit size returns positive 
+    #numbers unchanged and the two's compliment form of negative numbers
+    return ((1 << size) - 1) & decimal
+
+def decimal_to_binary(decimal, size=12):
+    """Takes a decimal number (as int or string) and returns the 
+        binary representation with number of bits equal to `size`. 
+        Uses the two's compliment representation for negative numbers."""
+    
+    return format(decimal_to_field(decimal, size), "0%sb" % size)
 
 def join_binary_string_into_groups_of_four(inst_list):
     """Takes a list of binary strings and joins them together 
@@ -929,6 +1462,27 @@ def join_binary_string_into_groups_of_four(inst_list):
     binary_string = " ".join(binary_string[i:i+4] for i in range(0, 32, 4))
     return binary_string
 
+#list mapping every byte value to its binary string, grouped in 4s
+byte_to_binary = ["%s %s" % (format(b >> 4, "04b"), format(b & 0xf, "04b")) for b in range(256)]
+"""List mapping every byte value to its binary string, grouped in 4s"""
+
+def word_to_binary(word):
+    """Takes a 32-bit machine word (as an int) and returns the binary string
+        with bits in groups of four separated by spaces."""
+    return "%s %s %s %s" % (byte_to_binary[word >> 24], 
+                            byte_to_binary[(word >> 16) & 0xff], 
+                            byte_to_binary[(word >> 8) & 0xff],
+                            byte_to_binary[word & 0xff])
+
+def halfword_to_binary(halfword):
+    """Takes a 16-bit compressed instruction (as an int) and returns the binary
+        string with bits in groups of four separated by spaces."""
+    return "%s %s" % (byte_to_binary[halfword >> 8], byte_to_binary[halfword & 0xff])
+
+def word_to_hex(word):
+    """Takes a 32-bit machine word (as an int) and returns an 8 character hex string."""
+    return "%08x" % word
+
 def bin_to_hex(bin_string):
     """Takes a binary string and converts it into a hex string."""
     #the [2:] here string off the leading '0x' of the hex string
@@ -989,7 +1543,8 @@ def parse_args():
     parser.add_argument("asm", type=argparse.FileType('r'), help="An asm file containing RISC-V code. \
                         Whitespace will be ignored. Text after a ; is treated as comments. \
                         Labels are identified by a trailing :, they can be on their own line or share a \
-                        line with an instruction.")
+                        line with an instruction. Lines after .data hold .word, .half, .byte, .space and .align \
+                        directives (written after the text) until .text, see data_segment.py.")
     parser.add_argument("--out", "-o", type=argparse.FileType('w'), help="The name of the output file that\
                          the assembled machine code will be written to.")
     parser.add_argument("--mode", "-m", choices=["bin","hex"], default="bin", help="The output mode for the\
@@ -998,8 +1553,7 @@ def parse_args():
                          include comments listing the RISC-V command that was disassembled on each line, \
                         along with both binary and hex translations.")
     parser.add_argument("--pseudos", "-p", type=argparse.FileType('r'), help="An optional file that defines\
-                         pseudoinstructions that this assembler should support.\
-                        You should ignore and not use this option unless you talk to an instructor about it.\
+                         pseudoinstructions that this assembler should support, next to the built in ones.\
                         Pseudoinstruction names and arguments should be listed with a trailing = on one line\
                         then the instructions that define this pseudoinstruction should follow using the argument\
                          names defined on the first line in place of register operands.\
@@ -1007,10 +1561,74 @@ def parse_args():
                         This assumes any register names or numbers (e.g. at, x31, or 31) are constant and should not be\
                          replaced, so dont use register names in the definition. An example:\n\
                         \t double r1, r2 =\
-                        \t add r1, r2, r2")
+                        \t add r1, r2, r2\
+                        Parameters can also be used in base-offset operands (e.g. 0(r1)) and a definition can use\
+                         the pseudoinstructions defined before it.")
+    parser.add_argument("--format", "-f", choices=["raw", "ihex", "elf"], help="Write the machine code as\
+                         a binary object instead of text: a raw little-endian image, Intel HEX, or a minimal ELF32\
+                         executable. The text segment starts at 0x00400000. Overrides --mode and --verbose.")
+    parser.add_argument("--jobs", "-j", type=int, default=1, help="Number of worker processes used to\
+                         translate large programs to machine code. Defaults to 1 (no workers).")
+    parser.add_argument("--cache", "-c", help="A directory used to cache machine code. Sources that were \
+                        assembled before (with the same pseudoinstructions and output options) are read from the \
+                        cache instead of being assembled again.")
+    parser.add_argument("--cache-size", type=int, default=256, help="Size limit of the cache directory in MB,\
+                         the least recently used entries are removed past it. Defaults to 256.")
+    parser.add_argument("--stream", "-s", action="store_true", help="Assemble the input one line at a time \
+                        instead of reading the whole file first, writing each instruction as soon as its labels \
+                        are known. Use this for very large programs or input from a pipe (pass - as the asm file).")
+    parser.add_argument("--stats", nargs="?", const="text", choices=["text", "json"], help="Write the time spent \
+                        in each pass, the lines going in and out of it, the pseudoinstructions expanded, the \
+                        instruction types and the peak memory to stderr, as a table or (--stats=json) as JSON.")
+    parser.add_argument("--optimize", "-O", action="store_true", help="Replace wasteful instruction sequences \
+                        (instructions that do nothing, back to back stack adjustments, branches over jumps) with \
+                        shorter ones after expanding the pseudoinstructions, and report how many were removed.")
+    parser.add_argument("--pipeline", nargs="?", const="blocks", choices=["blocks", "hazards"], help="Write the \
+                        estimated cycles, CPI and stalls of each basic block on a 5-stage pipeline, with and \
+                        without forwarding, to stderr. --pipeline=hazards also lists every hazard. See \
+                        pipeline_analysis.py for the model.")
+    parser.add_argument("--pool", action="store_true", help="Load the li constants used often enough from a \
+                        constant pool in the data segment (at 0x10010000, written after the text) addressed off \
+                        gp, instead of building them with lui and addi every time. See constant_pool.py.")
+    parser.add_argument("--relax", action="store_true", help="Replace every branch that can not reach its \
+                        target with the inverted branch over a jal x0, so large programs assemble, and report how \
+                        many were replaced. See relaxation.py.")
+    parser.add_argument("--schedule", nargs="?", const="forwarding", choices=["forwarding", "no-forwarding"],
+                        help="Reorder the independent instructions of each basic block to avoid load-use and \
+                        data stalls on a 5-stage pipeline with forwarding (or --schedule=no-forwarding without \
+                        it). Labels and branch offsets do not change. See scheduler.py.")
+    parser.add_argument("--compress", action="store_true", help="Write the 16-bit RV32C instruction (c.addi, \
+                        c.lw, c.j, c.beqz, ...) for every instruction that has one, moving the labels and \
+                        branch targets to the new addresses, and report the size of the text. See compressor.py.")
+    parser.add_argument("--prune", action="store_true", help="Remove the code that can not be reached from the \
+                        first instruction (following branches, jumps and calls), and report how many \
+                        instructions were removed. See control_flow.py for the control flow graph.")
+    parser.add_argument("--watch", "-w", action="store_true", help="Keep running and update the output file \
+                        every time the asm file is saved. Only the edited lines (and the branches whose offsets \
+                        they moved) are assembled again. Needs --out, stop with Ctrl-C.")
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if(args.format and args.stream):
+        parser.error("--format can not be combined with --stream")
+    if(args.watch and args.stream):
+        parser.error("--watch can not be combined with --stream")
+    if(args.stats and (args.stream or args.watch)):
+        parser.error("--stats can not be combined with --stream or --watch")
+    if((args.optimize or args.prune or args.relax or args.pool or args.schedule) and (args.stream or args.watch)):
+        parser.error("--optimize, --prune, --relax, --pool and --schedule can not be combined with --stream or --watch")
+    if(args.pool and args.format == "raw"):
+        parser.error("--format raw only holds the text segment, use ihex or elf with --pool")
+    if((args.pipeline or args.compress) and (args.stream or args.watch)):
+        parser.error("--pipeline and --compress can not be combined with --stream or --watch")
+    if(args.watch and not args.out):
+        parser.error("--watch needs --out")
+    if(args.format in ["raw", "elf"] and not args.out):
+        parser.error("--format %s writes binary data and needs --out" % args.format)
+    return args
 
 
 if __name__== "__main__":
-    main(parse_args())
+    #run through the imported module so that this script and the pseudoinstruction
+    #handler (which imports `assembler`) share the same classes and tables
+    import assembler
+    assembler.main(assembler.parse_args())
@@ -0,0 +1,140 @@
+"""
+
+ Assembler Client
+
+ Thin command line client for the CSSE232 Assembler daemon (see
+ `assembler_daemon`). It sends the source to the daemon over a Unix
+ domain socket and writes the machine code it gets back, so small files
+ do not pay for building the assembler tables on every run. If no
+ daemon is listening the source is assembled in this process instead.
+
+ Requests and responses are frames: a 4-byte big-endian length followed
+ by that many bytes. A request is one JSON frame with the `source` and
+ the `mode`, `format` and `pseudos` options. The response is a JSON
+ frame with the result (`ok`, and the `error` class name, `message` and
+ `line` if it failed) followed by a frame with the output.
+
+ Usage:
+    python3 assembler_client.py program.asm -o program.txt -m hex
+
+"""
+
+import os, sys, json, socket, struct, argparse
+
+LENGTH = struct.Struct(">I")
+
+MAX_FRAME = 64 * 1024 * 1024
+"""Largest frame that is accepted, in bytes"""
+
+def default_socket_path():
+    """Returns the socket path used when none is given, one per user."""
+    return os.path.join(os.environ.get("TMPDIR", "/tmp"), "risc_v_assembler-%s.sock" % os.getuid())
+
+##############
+#
+# Framing
+#
+##############
+
+def write_frame(out, data):
+    """Writes `data` (bytes) to the binary file `out` as one frame."""
+    out.write(LENGTH.pack(len(data)) + data)
+
+def read_frame(file):
+    """Reads one frame from the binary file `file` and returns its data, or
+        `None` at the end of the file. Raises EOFError if the file ends in the
+        middle of a frame and ValueError if the frame is too big."""
+    header = file.read(LENGTH.size)
+    if not header:
+        return None
+    if len(header) != LENGTH.size:
+        raise EOFError("Connection closed in a frame header")
+    (size,) = LENGTH.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError("Frame of %s bytes is over the limit of %s" % (size, MAX_FRAME))
+    data = file.read(size)
+    if len(data) != size:
+        raise EOFError("Connection closed in a frame")
+    return data
+
+##############
+#
+# Requests
+#
+##############
+
+def assemble(source, mode = "bin", format = None, pseudos = None, path = None, timeout = 30):
+    """Sends `source` (a string of assembly code) to the daemon listening on
+        `path` and returns a tuple of the result dictionary and the output
+        (bytes, empty if it failed). `mode` and `format` are the same as for
+        `assembler.py`, `pseudos` is the text of a pseudoinstruction file.
+
+        Raises OSError if the daemon can not be reached."""
+    request = json.dumps({"source":source, "mode":mode, "format":format, "pseudos":pseudos}).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.settimeout(timeout)
+        connection.connect(path or default_socket_path())
+        with connection.makefile("rwb") as stream:
+            write_frame(stream, request)
+            stream.flush()
+            result = read_frame(stream)
+            data = read_frame(stream)
+    if result == None or data == None:
+        raise ConnectionError("The daemon closed the connection without a response")
+    return (json.loads(result), data)
+
+def assemble_anywhere(source, mode = "bin", format = None, pseudos = None, path = None):
+    """Same as `assemble`, but assembles in this process if the daemon can not
+        be reached."""
+    try:
+        return assemble(source, mode, format, pseudos, path)
+    except OSError:
+        #only imported when needed to keep start up short
+        import assembler_daemon
+        return assembler_daemon.assemble_source(source, mode, format, pseudos)
+
+##############
+#
+# Command line
+#
+##############
+
+def parse_args():
+    """Parses the arguments to the client and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Assembles 32-bit RISC-V code with the assembler daemon.")
+    parser.add_argument("asm", type=argparse.FileType('r'), help="An asm file, see assembler.py --help.")
+    parser.add_argument("--out", "-o", type=argparse.FileType('wb'), help="The output file, the console by\
+                        default.")
+    parser.add_argument("--mode", "-m", choices=["bin","hex"], default="bin", help="The output mode: binary or\
+                        hexadecimal.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Write both binary and hex.")
+    parser.add_argument("--format", "-f", choices=["raw", "ihex", "elf"], help="Write a binary object instead\
+                        of text, see assembler.py --help.")
+    parser.add_argument("--pseudos", "-p", type=argparse.FileType('r'), help="A file defining more\
+                        pseudoinstructions, see assembler.py --help.")
+    parser.add_argument("--socket", help="The socket of the daemon, %s by default." % default_socket_path())
+    parser.add_argument("--no-fallback", action="store_true", help="Fail instead of assembling in this process\
+                        when the daemon is not running.")
+    return parser.parse_args()
+
+def main(args):
+    source = args.asm.read()
+    pseudos = args.pseudos.read() if args.pseudos else None
+    mode = None if args.verbose else args.mode
+
+    if(args.no_fallback):
+        result, data = assemble(source, mode, args.format, pseudos, args.socket)
+    else:
+        result, data = assemble_anywhere(source, mode, args.format, pseudos, args.socket)
+
+    if not result["ok"]:
+        sys.stderr.write("%s: %s\n" % (result["error"], result["message"]))
+        sys.exit(1)
+    out = args.out or sys.stdout.buffer
+    out.write(data)
+    out.flush()
+
+
+if __name__== "__main__":
+    main(parse_args())
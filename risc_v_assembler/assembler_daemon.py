@@ -0,0 +1,202 @@
+"""
+
+ Assembler Daemon
+
+ Keeps warm CSSE232 Assembler processes listening on a Unix domain
+ socket, so a small program is assembled without paying for the
+ interpreter start up, the imports and the construction of the
+ assembler tables on every run.
+
+ Each connection is served by its own thread, which hands the work to
+ a pool of worker processes that already have the assembler loaded.
+ See `assembler_client` for the protocol and the command line client.
+
+ Usage:
+    python3 assembler_daemon.py --jobs 4 &
+    python3 assembler_client.py program.asm -o program.txt
+
+"""
+
+import os, io, re, sys, json, socket, signal, argparse, socketserver
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+import assembler, assembler_client, data_segment
+
+#line numbers in the messages of the assembler exceptions
+LINE_NUMBER = re.compile(r"\bline (\d+)")
+
+##############
+#
+# Assembling a request
+#
+##############
+
+def assemble_source(source, mode = "bin", format = None, pseudos = None):
+    """Assembles `source` (a string of assembly code) like `assembler.py` with
+        the same `mode` and `format`, and `pseudos` the text of a
+        pseudoinstruction file. Never raises, instead returns a tuple of a
+        result dictionary and the output as bytes (empty if it failed).
+
+        The result has whether it went `ok`, the `error` class name, the
+        `message` and the `line` it names if it did not, and the number of
+        `instructions`."""
+    result = {"ok":False, "error":None, "message":None, "line":None, "instructions":0}
+    try:
+        data = data_segment.DataSegment()
+        machine_words, clean_code, labels = assembler.assemble_program(source.splitlines(), load_pseudos(pseudos), data = data)
+        if format == "ihex" or format == None:
+            out = io.StringIO()
+        else:
+            out = io.BytesIO()
+
+        if format:
+            import object_formats
+            object_formats.write_object(machine_words, labels, format, out, data = data)
+        else:
+            assembler.output(machine_words, [line.instruction_text() for line in clean_code], labels, mode = mode, out = out)
+            if data:
+                assembler.output_data(data, labels, mode = mode, out = out)
+
+        output = out.getvalue()
+        result["ok"] = True
+        result["instructions"] = len(machine_words)
+        return (result, output.encode() if type(output) == str else output)
+
+    except Exception as error:
+        result["error"] = type(error).__name__
+        result["message"] = str(error).strip()
+        match = LINE_NUMBER.search(result["message"])
+        if match:
+            result["line"] = int(match.group(1))
+        return (result, b"")
+
+@lru_cache(maxsize=16)
+def load_pseudos(text):
+    """Returns the pseudoinstructions for the text of a pseudoinstruction file,
+        or `None` (the built in ones) if there is no text. Compiled definitions
+        are kept for the next request with the same file."""
+    if not text:
+        return None
+    import macro_engine
+    return macro_engine.load_pseudos(text.split("\n"))
+
+def warm_up():
+    """Runs in each worker process as it starts, loading everything a request
+        can need. Ctrl-C is left to the daemon, which shuts the pool down."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import object_formats, macro_engine
+    assemble_source("add x0, x0, x0")
+
+##############
+#
+# Server
+#
+##############
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Serves the requests of one connection, one after the other, until the
+    client closes it.
+    """
+    def handle(self):
+        while True:
+            try:
+                request = assembler_client.read_frame(self.rfile)
+            except (EOFError, ValueError, OSError):
+                return
+            if request == None:
+                return
+
+            try:
+                options = json.loads(request)
+                future = self.server.pool.submit(assemble_source, options["source"], options.get("mode", "bin"),
+                                                 options.get("format"), options.get("pseudos"))
+                result, data = future.result()
+            except Exception as error:
+                result = {"ok":False, "error":type(error).__name__, "message":str(error).strip(), "line":None,
+                          "instructions":0}
+                data = b""
+
+            try:
+                assembler_client.write_frame(self.wfile, json.dumps(result).encode())
+                assembler_client.write_frame(self.wfile, data)
+                self.wfile.flush()
+            except OSError:
+                return
+
+class AssemblerDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    A server listening on the Unix domain socket `path`, assembling with a
+    pool of `jobs` worker processes (one per CPU by default). Only the user
+    running it can connect.
+    """
+    daemon_threads = True
+    #connections waiting to be accepted, the default of 5 refuses bursts of clients
+    request_queue_size = 64
+
+    def __init__(self, path = None, jobs = None):
+        path = path or assembler_client.default_socket_path()
+        remove_stale_socket(path)
+        jobs = jobs or os.cpu_count()
+        self.pool = ProcessPoolExecutor(jobs, initializer=warm_up)
+        #start every worker now instead of on the first requests
+        list(self.pool.map(abs, range(jobs)))
+
+        socketserver.UnixStreamServer.__init__(self, path, RequestHandler)
+        os.chmod(path, 0o600)
+
+    def server_close(self):
+        socketserver.UnixStreamServer.server_close(self)
+        self.pool.shutdown()
+        try:
+            os.remove(self.server_address)
+        except OSError:
+            pass
+
+def remove_stale_socket(path):
+    """Removes the socket file at `path` left behind by a daemon that is no
+        longer running. Raises OSError if a daemon is still listening on it."""
+    if not os.path.exists(path):
+        return
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as probe:
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path)
+            return
+    raise OSError("A daemon is already listening on %s" % path)
+
+##############
+#
+# Command line
+#
+##############
+
+def parse_args():
+    """Parses the arguments to the daemon and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Serves the 32-bit RISC-V assembler on a Unix domain socket.")
+    parser.add_argument("--socket", help="The socket to listen on, %s by default." % assembler_client.default_socket_path())
+    parser.add_argument("--jobs", "-j", type=int, help="Number of worker processes, one per CPU by default.")
+    return parser.parse_args()
+
+def terminate(signal_number, frame):
+    """SIGTERM handler, stops the daemon the same way Ctrl-C does."""
+    raise SystemExit(0)
+
+def main(args):
+    server = AssemblerDaemon(args.socket, args.jobs)
+    #a daemon started in the background ignores Ctrl-C and is stopped with
+    #SIGTERM, installed after the workers started so they keep the default
+    signal.signal(signal.SIGTERM, terminate)
+    sys.stderr.write("Listening on %s\n" % server.server_address)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__== "__main__":
+    main(parse_args())
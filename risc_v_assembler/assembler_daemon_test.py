@@ -0,0 +1,128 @@
+"""
+    Tests for the daemon and client of the CSSE232 Risc-V Assembler
+"""
+import assembler, assembler_client, assembler_daemon
+import io, os, sys, time, signal, socket, tempfile, threading, subprocess, unittest
+from concurrent.futures import ThreadPoolExecutor
+
+program = """start: addi t0, x0, 5
+             loop: addi t0, t0, -1
+             bne t0, x0, loop
+             push t0"""
+
+def expected_output(mode = "bin"):
+    out = io.StringIO()
+    words, clean_code, labels = assembler.assemble_program(program.split("\n"))
+    assembler.output(words, [line.instruction_text() for line in clean_code], labels, mode = mode, out = out)
+    return out.getvalue().encode()
+
+class TestAssembleSource(unittest.TestCase):
+    def test_output(self):
+        result, data = assembler_daemon.assemble_source(program, "hex")
+        self.assertTrue(result["ok"])
+        self.assertEqual(5, result["instructions"])
+        self.assertEqual(expected_output("hex"), data)
+        result, data = assembler_daemon.assemble_source(program, format = "raw")
+        self.assertEqual(20, len(data))
+
+    def test_errors(self):
+        result, data = assembler_daemon.assemble_source("add t0, t0, t0\nadd t9, t0, t0")
+        self.assertEqual(("BadRegister", 2, b""), (result["error"], result["line"], data))
+        self.assertFalse(result["ok"])
+
+    def test_pseudos(self):
+        result, data = assembler_daemon.assemble_source("pop a0", "hex", pseudos = "pop r =\n lw r, 0(sp)\n addi sp, sp, 4")
+        self.assertEqual(2, result["instructions"])
+
+class TestShutdown(unittest.TestCase):
+    def test_sigterm_closes_the_daemon(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "assembler.sock")
+            daemon = subprocess.Popen([sys.executable, assembler_daemon.__file__, "--socket", path, "--jobs", "1"],
+                                      stderr=subprocess.DEVNULL)
+            try:
+                for attempt in range(200):
+                    if os.path.exists(path):
+                        break
+                    time.sleep(0.05)
+                result, data = assembler_client.assemble(program, path = path)
+                self.assertTrue(result["ok"])
+                daemon.send_signal(signal.SIGTERM)
+                self.assertEqual(0, daemon.wait(timeout = 30))
+            finally:
+                daemon.kill()
+            self.assertFalse(os.path.exists(path))
+
+class TestDaemon(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, "assembler.sock")
+        cls.server = assembler_daemon.AssemblerDaemon(cls.path, jobs = 2)
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+        cls.server.server_close()
+        cls.directory.cleanup()
+
+    def test_round_trip(self):
+        result, data = assembler_client.assemble(program, path = self.path)
+        self.assertTrue(result["ok"])
+        self.assertEqual(expected_output(), data)
+        result, data = assembler_client.assemble("start: beq t0, x0, nowhere", path = self.path)
+        self.assertEqual("BadLabel", result["error"])
+
+    def test_concurrent_clients(self):
+        with ThreadPoolExecutor(8) as pool:
+            results = list(pool.map(lambda mode: assembler_client.assemble(program, mode, path = self.path),
+                                    ["bin", "hex"] * 10))
+        for (result, data), mode in zip(results, ["bin", "hex"] * 10):
+            self.assertEqual(expected_output(mode), data)
+
+    def test_bad_request(self):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+            connection.connect(self.path)
+            with connection.makefile("rwb") as stream:
+                assembler_client.write_frame(stream, b"not json")
+                stream.flush()
+                result = assembler_client.read_frame(stream)
+                self.assertIn(b'"ok": false', result)
+                self.assertEqual(b"", assembler_client.read_frame(stream))
+
+    def test_second_daemon_refused(self):
+        with self.assertRaises(OSError):
+            assembler_daemon.remove_stale_socket(self.path)
+
+class TestClient(unittest.TestCase):
+    def test_fallback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "missing.sock")
+            with self.assertRaises(OSError):
+                assembler_client.assemble(program, path = path)
+            result, data = assembler_client.assemble_anywhere(program, path = path)
+            self.assertEqual(expected_output(), data)
+
+    def test_stale_socket(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "stale.sock")
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            listener.bind(path)
+            listener.close()
+            assembler_daemon.remove_stale_socket(path)
+            self.assertFalse(os.path.exists(path))
+
+    def test_frames(self):
+        stream = io.BytesIO()
+        assembler_client.write_frame(stream, b"abc")
+        assembler_client.write_frame(stream, b"")
+        stream.seek(0)
+        self.assertEqual([b"abc", b"", None], [assembler_client.read_frame(stream) for i in range(3)])
+        with self.assertRaises(EOFError):
+            assembler_client.read_frame(io.BytesIO(b"\0\0\0\5ab"))
+
+if __name__ == "__main__":
+    unittest.main()
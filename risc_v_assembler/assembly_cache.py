@@ -0,0 +1,208 @@
+"""
+
+ Assembly Cache
+
+ A persistent, content-addressed cache for the CSSE232 Assembler. Entries
+ are keyed by a hash of the source, the pseudoinstruction definitions, the
+ encoder version and the output mode, and hold the machine code in a
+ compact binary form, so assembling a source that has been seen before
+ costs a single file read.
+
+ Entries are written atomically (to a temporary file which is then
+ renamed) and the least recently used ones are removed once the cache
+ grows past its size limit.
+
+"""
+
+import os, sys, struct, hashlib, tempfile
+from array import array
+import assembler
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+"""Default size limit of a cache directory"""
+
+#magic, number of words, size of the text block, size of the labels block,
+#size of the data segment
+HEADER = struct.Struct("<4sIIII")
+MAGIC = b"RVC2"
+ENTRY_SUFFIX = ".rvc"
+
+#typecode of an unsigned 32-bit array, 'I' is 4 bytes on every common platform
+WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+def assemble_cached(asm_lines, cache, mode = None, pseudos = None, optimize = False, prune = False, schedule = None,
+                    relax = False, pool = False, data = None):
+    """Same as `assembler.assemble_program` but looks the source up in `cache`
+        (an `AssemblyCache`) first, and stores the result on a miss. `mode`
+        names the output the result is for and becomes part of the key, it has
+        to tell optimized, pruned, relaxed, pooled, scheduled and plain results
+        apart. The data segment of the program is added to `data` (a
+        `data_segment.DataSegment`) if there is one.
+
+        Returns a tuple of the machine words, the text of each instruction and
+        the labels dictionary."""
+    if pseudos == None:
+        pseudos = assembler.ph.get_pseudoinstruction_defs()
+
+    key = cache.key(asm_lines, pseudos, mode)
+    entry = cache.get(key)
+    if entry:
+        machine_words, clean_text, labels, data_bytes = entry
+        if data != None:
+            data.buffer.extend(data_bytes)
+        return (machine_words, clean_text, labels)
+
+    start = len(data) if data != None else 0
+    machine_words, clean_code, labels = assembler.assemble_program(asm_lines, pseudos, optimize = optimize, prune = prune,
+                                                                       schedule = schedule, relax = relax, pool = pool,
+                                                                       data = data)
+    clean_text = [line.instruction_text() for line in clean_code]
+    cache.put(key, machine_words, clean_text, labels, bytes(data.buffer[start:]) if data != None else b"")
+    return (machine_words, clean_text, labels)
+
+def pseudo_fingerprint(pseudos):
+    """Returns bytes identifying a dictionary of pseudoinstruction definitions,
+        built from each name and the compiled code of its function, so editing a
+        definition changes every key that depends on it."""
+    digest = hashlib.sha256()
+    for name in sorted(pseudos):
+        definition = pseudos[name]
+        digest.update(name.encode() + b"\0")
+        code = getattr(definition, "__code__", None)
+        if code != None:
+            digest.update(code.co_code)
+            digest.update(repr(code.co_consts).encode())
+            digest.update(repr(code.co_names).encode())
+        else:
+            digest.update(repr(definition).encode())
+        digest.update(b"\0")
+    return digest.digest()
+
+class AssemblyCache():
+    """
+    A cache directory holding one file per assembled source, at most
+    `max_bytes` in total.
+    """
+    def __init__(self, directory, max_bytes = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, asm_lines, pseudos, mode = None):
+        """Returns the hex key of a list of source lines assembled with `pseudos`
+            for the output `mode`."""
+        digest = hashlib.sha256()
+        digest.update(("%s\0%s\0%s\0" % (assembler.ENCODER_VERSION, assembler.PC, mode)).encode())
+        digest.update(pseudo_fingerprint(pseudos))
+        for line in asm_lines:
+            digest.update(line.rstrip("\n").encode())
+            digest.update(b"\n")
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Returns the `(machine_words, clean_text, labels, data)` stored for `key`, or
+            `None` on a miss. Unreadable entries are removed and count as misses."""
+        path = self.path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        try:
+            entry = unpack_entry(data)
+        except (ValueError, struct.error, UnicodeDecodeError):
+            self.remove(path)
+            self.misses += 1
+            return None
+
+        #mark the entry as recently used for eviction
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def put(self, key, machine_words, clean_text, labels, data = b""):
+        """Stores an entry atomically, then evicts old entries if the cache is
+            over its size limit. `data` is the bytes of the data segment."""
+        data = pack_entry(machine_words, clean_text, labels, data)
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(descriptor, "wb") as f:
+                f.write(data)
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            self.remove(temporary)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache fits in
+            `max_bytes`."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(ENTRY_SUFFIX):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for mtime, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+def pack_entry(machine_words, clean_text, labels, data = b""):
+    """Packs a cache entry: a header, the words as little-endian 32-bit
+        integers, the instruction text one per line, the labels as
+        `label address` lines and the bytes of the data segment."""
+    words = array(WORD_TYPECODE, machine_words)
+    if sys.byteorder == "big":
+        words.byteswap()
+    text = "\n".join(clean_text).encode()
+    label_text = "\n".join("%s %s" % item for item in labels.items()).encode()
+    return (HEADER.pack(MAGIC, len(words), len(text), len(label_text), len(data)) + words.tobytes() + text + label_text
+            + bytes(data))
+
+def unpack_entry(data):
+    """Reverses `pack_entry`. Raises ValueError if `data` is not a valid entry."""
+    magic, count, text_size, label_size, data_size = HEADER.unpack_from(data)
+    start = HEADER.size
+    if magic != MAGIC or len(data) != start + 4 * count + text_size + label_size + data_size:
+        raise ValueError("Not a cache entry")
+
+    words = array(WORD_TYPECODE)
+    words.frombytes(data[start:start + 4 * count])
+    if sys.byteorder == "big":
+        words.byteswap()
+    start += 4 * count
+
+    clean_text = data[start:start + text_size].decode().split("\n") if count else []
+    start += text_size
+
+    labels = {}
+    if label_size:
+        for line in data[start:start + label_size].decode().split("\n"):
+            label, address = line.split(" ")
+            labels[label] = int(address)
+    start += label_size
+
+    return (words.tolist(), clean_text, labels, data[start:])
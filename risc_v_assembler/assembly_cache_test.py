@@ -0,0 +1,62 @@
+"""
+    Tests for the assembly cache of the CSSE232 Risc-V Assembler
+"""
+import assembler, assembly_cache, data_segment, pseudoinstruction_handler as ph
+import os, tempfile, unittest
+
+program = ["L: addi t0, t0, 1", "push t0", "bne t0, x0, L", "END:"]
+
+class TestAssemblyCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = assembly_cache.AssemblyCache(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_hit_returns_the_same_code(self):
+        first = assembly_cache.assemble_cached(program, self.cache, "hex")
+        self.assertEqual((0, 1), (self.cache.hits, self.cache.misses))
+        second = assembly_cache.assemble_cached(program, self.cache, "hex")
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        self.assertEqual(first, second)
+
+        machine_words, clean_code, labels = assembler.assemble_program(program)
+        self.assertEqual((machine_words, [c.instruction_text() for c in clean_code], labels), second)
+
+    def test_data_segment_is_cached(self):
+        pooled = ["li a0, 305419896"] * 4
+        results = []
+        for count in range(2):
+            data = data_segment.DataSegment()
+            results.append((assembly_cache.assemble_cached(pooled, self.cache, "hex/pool", pool = True, data = data),
+                            bytes(data.buffer)))
+        self.assertEqual((1, 1), (self.cache.hits, self.cache.misses))
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(b"\x78\x56\x34\x12", results[1][1])
+
+    def test_key_depends_on_inputs(self):
+        pseudos = ph.get_pseudoinstruction_defs()
+        key = self.cache.key(program, pseudos, "hex")
+        self.assertEqual(key, self.cache.key([line + "\n" for line in program], pseudos, "hex"))
+        self.assertNotEqual(key, self.cache.key(program, pseudos, "bin"))
+        self.assertNotEqual(key, self.cache.key(program[:-1], pseudos, "hex"))
+        self.assertNotEqual(key, self.cache.key(program, {"double":ph.double}, "hex"))
+
+    def test_corrupt_entries_are_misses(self):
+        key = self.cache.key(program, ph.get_pseudoinstruction_defs(), None)
+        with open(self.cache.path(key), "wb") as f:
+            f.write(b"RVC1 not really")
+        self.assertEqual(None, self.cache.get(key))
+        self.assertFalse(os.path.exists(self.cache.path(key)))
+
+    def test_least_recently_used_are_evicted(self):
+        entry_size = len(assembly_cache.pack_entry([0] * 10, ["nop"] * 10, {}))
+        self.cache.max_bytes = entry_size * 2
+        for i, key in enumerate(["a", "b"]):
+            self.cache.put(key, [0] * 10, ["nop"] * 10, {})
+            os.utime(self.cache.path(key), (i, i))
+        #reading "a" makes "b" the oldest
+        self.assertNotEqual(None, self.cache.get("a"))
+        self.cache.put("c", [0] * 10, ["nop"] * 10, {})
+        self.assertEqual(["a", "c"], sorted(name[:-4] for name in os.listdir(self.directory.name)))
@@ -0,0 +1,138 @@
+"""
+
+ Assembly Stats
+
+ Instrumentation for the CSSE232 Assembler: the wall time and the number
+ of lines going in and out of each pass, how many times each
+ pseudoinstruction was expanded, a histogram of the instruction types in
+ the final program and the peak memory of the process.
+
+ Pass an `AssemblyStats` to `assembler.assemble_program` (or use
+ `--stats` on the command line) to collect them. Hooks added to it are
+ called as each pass finishes, e.g. to feed a progress bar or a log.
+
+"""
+
+import sys, json, time
+from collections import Counter
+
+try:
+    import resource
+except ImportError:
+    #not available on Windows, peak memory is reported as unknown
+    resource = None
+
+class PassStats():
+    """
+    Measurements of one pass: its `name`, wall time in `seconds`, the
+    number of lines (or records) it took in and gave out, and the peak
+    memory of the process in KB when it finished (`None` if unknown).
+    """
+    __slots__ = ("name", "seconds", "lines_in", "lines_out", "peak_memory")
+
+    def __init__(self, name, seconds, lines_in, lines_out, peak_memory = None):
+        self.name = name
+        self.seconds = seconds
+        self.lines_in = lines_in
+        self.lines_out = lines_out
+        self.peak_memory = peak_memory
+
+    def to_dict(self):
+        return {"name":self.name, "seconds":self.seconds, "lines_in":self.lines_in,
+                "lines_out":self.lines_out, "peak_memory_kb":self.peak_memory}
+
+    def __repr__(self):
+        return "PassStats(%r, %r, %r, %r, %r)" % (self.name, self.seconds, self.lines_in, self.lines_out, self.peak_memory)
+
+class AssemblyStats():
+    """
+    Collects the measurements of one assembly. `passes` is the list of
+    `PassStats` in the order the passes ran, `pseudo_expansions` maps each
+    pseudoinstruction to the number of times it was expanded and
+    `instruction_types` maps each type name (see `assembler.Types`) to the
+    number of instructions of that type.
+
+    Every callable in `hooks` is called with the `PassStats` of each pass
+    as soon as it finishes.
+    """
+    def __init__(self, hooks = None):
+        self.hooks = list(hooks or [])
+        self.passes = []
+        self.pseudo_expansions = Counter()
+        self.instruction_types = Counter()
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def start(self):
+        """Returns the time to pass to `end_pass` once the pass is done."""
+        return time.perf_counter()
+
+    def end_pass(self, name, started, lines_in, lines_out):
+        """Records a pass that started at `started` (from `start`) and calls the hooks."""
+        record = PassStats(name, time.perf_counter() - started, lines_in, lines_out, process_peak_memory())
+        self.passes.append(record)
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+    def count_pseudos(self, records, pseudos):
+        """Counts the `assembler.AsmLine` records using one of the `pseudos`, call
+            this before they are expanded."""
+        self.pseudo_expansions.update(record.command for record in records if record.command in pseudos)
+
+    def count_types(self, records):
+        """Counts the instruction types of the expanded `assembler.AsmLine` records."""
+        import assembler
+        for command, count in Counter(record.command for record in records).items():
+            instruction_type = assembler.instructions_to_types.get(command)
+            self.instruction_types[instruction_type.name if instruction_type else command] += count
+
+    def total_seconds(self):
+        return sum(record.seconds for record in self.passes)
+
+    def peak_memory(self):
+        """Returns the peak memory in KB after the last pass, or `None` if unknown."""
+        return self.passes[-1].peak_memory if self.passes else None
+
+    def to_dict(self):
+        return {"passes":[record.to_dict() for record in self.passes],
+                "total_seconds":self.total_seconds(),
+                "pseudo_expansions":dict(self.pseudo_expansions),
+                "instruction_types":dict(self.instruction_types),
+                "peak_memory_kb":self.peak_memory()}
+
+    def write(self, format = "text", out = None):
+        """Writes a report to `out` (stderr by default, so it does not mix with
+            output written to stdout). `format` is "text" or "json"."""
+        out = out or sys.stderr
+        if format == "json":
+            json.dump(self.to_dict(), out, indent=2)
+            out.write("\n")
+            return
+
+        out.write("%-20s %10s %10s %10s\n" % ("pass", "ms", "lines in", "lines out"))
+        for record in self.passes:
+            out.write("%-20s %10.3f %10s %10s\n" % (record.name, record.seconds * 1000, record.lines_in, record.lines_out))
+        out.write("%-20s %10.3f\n" % ("total", self.total_seconds() * 1000))
+
+        if self.pseudo_expansions:
+            out.write("pseudoinstructions: %s\n" % format_counts(self.pseudo_expansions))
+        if self.instruction_types:
+            out.write("instruction types: %s\n" % format_counts(self.instruction_types))
+        if self.peak_memory() != None:
+            out.write("peak memory: %s KB\n" % self.peak_memory())
+
+def format_counts(counts):
+    """Formats a Counter as `name count` pairs, most common first."""
+    return ", ".join("%s %s" % item for item in counts.most_common())
+
+def process_peak_memory():
+    """Returns the peak resident memory of this process in KB, or `None` if unknown."""
+    if resource == None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #macOS reports bytes, Linux KB
+    if sys.platform == "darwin":
+        peak //= 1024
+    return peak
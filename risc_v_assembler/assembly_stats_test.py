@@ -0,0 +1,56 @@
+"""
+    Tests for the instrumentation of the CSSE232 Risc-V Assembler
+"""
+import assembler, assembly_stats
+import io, json, unittest
+
+program = """start: addi t0, x0, 5   ; comment
+            beq t0, x0, done
+
+            loop: push t0
+            push t1
+            jalif t0, x0, start
+            done: sub t1, t1, t0""".split("\n")
+
+class TestAssemblyStats(unittest.TestCase):
+    def test_passes_are_measured(self):
+        stats = assembly_stats.AssemblyStats()
+        words, code, labels = assembler.assemble_program(program, stats=stats)
+        self.assertEqual((words, labels), assembler.assemble_program(program)[::2])
+
+        self.assertEqual(["lex", "pseudoinstructions", "labels", "machine code"], [p.name for p in stats.passes])
+        self.assertEqual([(7, 6), (6, 10), (10, 9), (9, 9)], [(p.lines_in, p.lines_out) for p in stats.passes])
+        for record in stats.passes:
+            self.assertGreaterEqual(record.seconds, 0)
+
+    def test_counters(self):
+        stats = assembly_stats.AssemblyStats()
+        assembler.assemble_program(program, stats=stats)
+        self.assertEqual({"push":2, "jalif":1}, dict(stats.pseudo_expansions))
+        self.assertEqual({"I":3, "S":2, "SB":2, "UJ":1, "R":1}, dict(stats.instruction_types))
+
+    def test_hooks(self):
+        seen = []
+        stats = assembly_stats.AssemblyStats([lambda record: seen.append(record.name)])
+        stats.add_hook(lambda record: seen.append(record.lines_out))
+        assembler.assemble_program(program, stats=stats)
+        self.assertEqual(["lex", 6, "pseudoinstructions", 10, "labels", 9, "machine code", 9], seen)
+
+    def test_reports(self):
+        stats = assembly_stats.AssemblyStats()
+        assembler.assemble_program(program, stats=stats)
+
+        out = io.StringIO()
+        stats.write("json", out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(4, len(report["passes"]))
+        self.assertEqual(2, report["pseudo_expansions"]["push"])
+        self.assertAlmostEqual(stats.total_seconds(), report["total_seconds"])
+
+        out = io.StringIO()
+        stats.write("text", out)
+        self.assertIn("pseudoinstructions: push 2, jalif 1", out.getvalue())
+        self.assertIn("machine code", out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
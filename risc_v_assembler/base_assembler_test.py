@@ -443,4 +443,106 @@ class TestFileAssembly(unittest.TestCase):
         self.assertEqual(len(machine), len(assembled))
         #check each instruction is right
         for m,a in zip(machine, assembled):
-            self.assertEqual(m, a)
\ No newline at end of file
+            self.assertEqual(m, a)
+
+class TestWordEncoding(unittest.TestCase):
+    #@weight(1)
+    def test_words_match_binary_strings(self):
+        instructions = ["add t0, s0, sp", "addi t5, s0, -256", "srai t5, s0, 2",
+                        "lw a0, -4(sp)", "jalr ra, a0, 4", "sw a0, -4(sp)", "lui t0, 1"]
+        for inst in instructions:
+            word = assembler.encode_instruction(inst)
+            self.assertEqual(assembler.Assemble(inst), assembler.word_to_binary(word))
+            self.assertEqual(int(assembler.Assemble(inst).replace(" ", ""), 2), word)
+
+    #@weight(1)
+    def test_sw_immediate_bit_5(self):
+        #sw a2, 408(x21): imm[11:5] = 0001100, imm[4:0] = 11000
+        inst = "sw a2, 408(x21)"
+        machine = "0001 1000 1100 1010 1010 1100 0010 0011"
+        Assembler_method_testing_helper(self.assertEqual, assembler.Assemble_S_Type, inst, machine)
+
+    #@weight(1)
+    def test_x27_is_s11(self):
+        self.assertEqual(27, assembler.get_register_number("x27"))
+        self.assertEqual(assembler.Assemble("add s11, s11, s11"), assembler.Assemble("add x27, x27, x27"))
+
+    #@weight(1)
+    def test_word_formatting(self):
+        self.assertEqual("1111 0000 0000 0100 0000 1111 0001 0011", assembler.word_to_binary(0xf0040f13))
+        self.assertEqual("f0040f13", assembler.word_to_hex(0xf0040f13))
+        self.assertEqual("0000 0000 0000 0000 0000 0000 0000 0001", assembler.word_to_binary(1))
+
+class TestInstructionCache(unittest.TestCase):
+    #@weight(1)
+    def test_hits_and_misses(self):
+        cache = assembler.InstructionCache()
+        for i in range(3):
+            self.assertEqual(assembler.encode_instruction("add t0, t1, t2"), cache.encode("add t0, t1, t2"))
+            self.assertEqual(assembler.word_to_binary(assembler.encode_instruction("lw a0, -4(sp)")), cache.assemble("lw a0, -4(sp)"))
+        self.assertEqual((4, 2), (cache.hits, cache.misses))
+        self.assertEqual(2 / 3, cache.info()["hit_rate"])
+
+    #@weight(1)
+    def test_labels_are_recomputed(self):
+        cache = assembler.InstructionCache()
+        labels = {"L1":assembler.PC, "L2":assembler.PC + 40}
+        for line_number in range(12):
+            for inst in ["beq t0, x0, L1", "jal ra, L2", "bne t0, x0, -8"]:
+                self.assertEqual(assembler.encode_instruction(inst, line_number, labels), cache.encode(inst, line_number, labels))
+        self.assertEqual(3, cache.misses)
+
+    #@weight(1)
+    def test_bounded(self):
+        cache = assembler.InstructionCache(2)
+        for inst in ["add t0, t0, t0", "add t1, t1, t1", "add t0, t0, t0", "add t2, t2, t2", "add t0, t0, t0"]:
+            cache.encode(inst)
+        self.assertEqual(["add t2, t2, t2", "add t0, t0, t0"], list(cache.entries))
+        self.assertEqual(2, cache.hits)
+        cache.clear()
+        self.assertEqual({"hits":0, "misses":0, "size":0, "max_size":2, "hit_rate":0.0}, cache.info())
+
+    #@weight(1)
+    def test_errors_are_not_cached(self):
+        cache = assembler.InstructionCache()
+        for i in range(2):
+            with self.assertRaises(assembler.BadRegister):
+                cache.encode("add t0, t1, t9")
+            with self.assertRaises(assembler.BadLabel):
+                cache.encode("beq t0, x0, L3", 0, {"L1":assembler.PC})
+        self.assertEqual(0, len(cache.entries))
+
+class TestLexer(unittest.TestCase):
+    #@weight(1)
+    def test_lex_pass(self):
+        instructions = """; comment line
+                        L1: add x1, x1, x1 ; end of line comment
+
+                        L2:
+                        jalr ra, 4 (a0)"""
+        result = assembler.lex_pass(instructions.split("\n"))
+        self.assertEqual(3, len(result))
+        self.assertEqual(("L1", "add", ("x1", "x1", "x1"), 2), 
+                         (result[0].label, result[0].command, result[0].operands, result[0].line_number))
+        self.assertEqual(("L2", None, 4), (result[1].label, result[1].command, result[1].line_number))
+        self.assertEqual(("jalr", ("ra", "4", "(a0)"), 5), (result[2].command, result[2].operands, result[2].line_number))
+
+    #@weight(1)
+    def test_errors_report_source_lines(self):
+        instructions = """add x1, x1, x1
+                        ; comment line
+
+                        push t0
+                        sub z1, x1, x1"""
+        with self.assertRaisesRegex(assembler.BadRegister, "line 5"):
+            assembler.assemble_asm(instructions.split("\n"))
+
+    #@weight(1)
+    def test_label_only_lines(self):
+        instructions = """L1:
+                        add x1, x1, x1
+                        beq x0, x0, L1
+                        L2:"""
+        assembled = assembler.assemble_asm(instructions.split("\n"))
+        self.assertEqual(2, len(assembled))
+        self.assertEqual(assembler.Assemble("beq x0, x0, -4"), assembled[1])
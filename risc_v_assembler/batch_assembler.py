@@ -0,0 +1,194 @@
+"""
+
+ Batch Assembler
+
+ Assembles many .asm files in one run of the CSSE232 Assembler, e.g. every
+ submission for an assignment. Files are assembled concurrently by a pool
+ of worker processes, so the interpreter start up and module imports are
+ paid once per worker instead of once per file.
+
+ Usage:
+    python3 batch_assembler.py submissions/ --out-dir machine/ --jobs 8
+    python3 batch_assembler.py "hw3/*/main.asm" --manifest extra.txt --summary summary.json
+
+"""
+
+import os, sys, glob, json, time, argparse
+from concurrent.futures import ProcessPoolExecutor
+import assembler, data_segment
+
+OUTPUT_EXTENSIONS = {None:".txt", "raw":".bin", "ihex":".hex", "elf":".elf"}
+"""Dictionary mapping an object format (`None` for text) to the output file extension"""
+
+def main(args):
+    files = find_inputs(args.inputs, args.manifest)
+    tasks = plan_outputs(files, args.out_dir, args.format)
+    mode = assembler.output_mode(args)
+
+    started = time.perf_counter()
+    results = assemble_files(tasks, mode, args.format, args.jobs, args.cache)
+    elapsed = time.perf_counter() - started
+
+    print_summary(results, elapsed)
+    if(args.summary):
+        json.dump({"seconds":elapsed, "files":results}, args.summary, indent=2)
+
+    if any(not result["ok"] for result in results):
+        sys.exit(1)
+
+def find_inputs(inputs, manifest = None):
+    """Takes a list of directories, glob patterns and file names, and an optional
+        manifest (an open file listing one input per line, optionally followed
+        by the output path). Returns a list of `(path, output)` tuples where
+        `output` is `None` unless the manifest gave one. Directories are searched
+        recursively for .asm files."""
+    files = []
+    for entry in inputs:
+        if os.path.isdir(entry):
+            paths = sorted(glob.glob(os.path.join(entry, "**", "*.asm"), recursive=True))
+        elif glob.has_magic(entry):
+            paths = sorted(glob.glob(entry, recursive=True))
+        else:
+            paths = [entry]
+        files.extend((path, None) for path in paths)
+
+    if manifest:
+        for line in manifest:
+            line = line.split("#")[0].strip()
+            if not line:
+                continue
+            parts = line.split(None, 1)
+            files.append((parts[0], parts[1].strip() if len(parts) > 1 else None))
+
+    return files
+
+def plan_outputs(files, out_dir = None, format = None):
+    """Takes the `(path, output)` tuples from `find_inputs` and fills in every
+        missing output path. Outputs go next to their input, or into `out_dir`
+        keeping the layout of the inputs below their common directory, with the
+        extension for `format` from `OUTPUT_EXTENSIONS`."""
+    extension = OUTPUT_EXTENSIONS[format]
+    root = None
+    if out_dir and files:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path, _ in files])
+
+    tasks = []
+    for path, output in files:
+        if output == None:
+            output = os.path.splitext(path)[0] + extension
+            if root != None:
+                relative = os.path.relpath(os.path.abspath(path), root)
+                output = os.path.join(out_dir, os.path.splitext(relative)[0] + extension)
+        tasks.append((path, output))
+    return tasks
+
+def assemble_files(tasks, mode = "bin", format = None, jobs = None, cache = None):
+    """Assembles every `(path, output)` task with a pool of `jobs` worker
+        processes (one per CPU by default). Returns a list of result
+        dictionaries, in the same order as `tasks`, see `assemble_file`.
+        
+        If `cache` names a directory, sources are looked up in an
+        `assembly_cache.AssemblyCache` there first."""
+    work = [(path, output, mode, format, cache) for path, output in tasks]
+    if jobs == 1 or len(work) <= 1:
+        return [assemble_file(task) for task in work]
+
+    jobs = jobs or os.cpu_count()
+    chunk_size = max(1, len(work) // (jobs * 4))
+    with ProcessPoolExecutor(jobs) as pool:
+        return list(pool.map(assemble_file, work, chunksize=chunk_size))
+
+def assemble_file(task):
+    """Assembles one `(path, output, mode, format, cache)` task and writes the 
+        output file. Never raises, instead returns a dictionary with the `path`, the
+        `output` path, whether it went `ok`, the `error` class name and
+        `message` if it did not, the number of `instructions` and the wall
+        time in `seconds`."""
+    path, output, mode, format, cache = task
+    result = {"path":path, "output":output, "ok":False, "error":None, "message":None,
+              "instructions":0, "seconds":0.0}
+    started = time.perf_counter()
+    try:
+        with open(path) as asm:
+            asm_lines = asm.readlines()
+
+        data = data_segment.DataSegment()
+        if cache:
+            import assembly_cache
+            machine_words, clean_text, labels = assembly_cache.assemble_cached(
+                asm_lines, assembly_cache.AssemblyCache(cache), "%s/%s" % (mode, format), data = data)
+        else:
+            machine_words, clean_code, labels = assembler.assemble_program(asm_lines, data = data)
+            clean_text = [line.instruction_text() for line in clean_code]
+
+        directory = os.path.dirname(output)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        if format:
+            import object_formats
+            with open(output, "w" if format == "ihex" else "wb") as out:
+                object_formats.write_object(machine_words, labels, format, out, data = data)
+        else:
+            with open(output, "w") as out:
+                assembler.output(machine_words, clean_text, labels, mode = mode, out = out)
+                if data:
+                    assembler.output_data(data, labels, mode = mode, out = out)
+
+        result["ok"] = True
+        result["instructions"] = len(machine_words)
+    except Exception as error:
+        result["error"] = type(error).__name__
+        result["message"] = str(error).strip()
+
+    result["seconds"] = time.perf_counter() - started
+    return result
+
+def print_summary(results, elapsed, out = None):
+    """Prints one line per file followed by the totals and a count of each
+        error class."""
+    out = out or sys.stdout
+    errors = {}
+    for result in results:
+        if result["ok"]:
+            out.write("ok    %8.4fs  %s -> %s\n" % (result["seconds"], result["path"], result["output"]))
+        else:
+            errors[result["error"]] = errors.get(result["error"], 0) + 1
+            message = result["message"].replace("\n", " ").replace("\t", "")
+            out.write("FAIL  %8.4fs  %s: %s: %s\n" % (result["seconds"], result["path"], result["error"], message))
+
+    failed = sum(errors.values())
+    out.write("\n%s files, %s ok, %s failed in %.2fs\n" % (len(results), len(results) - failed, failed, elapsed))
+    for error, count in sorted(errors.items()):
+        out.write("  %s: %s\n" % (error, count))
+
+def parse_args():
+    """Parses the arguments to the batch assembler and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Assembles many 32-bit RISC-V asm files at once.")
+    parser.add_argument("inputs", nargs="*", help="Directories (searched recursively for .asm files),\
+                        glob patterns, or asm files to assemble.")
+    parser.add_argument("--manifest", type=argparse.FileType('r'), help="A file listing one asm file per\
+                        line, optionally followed by the path of its output file. Text after a # is ignored.")
+    parser.add_argument("--out-dir", "-o", help="Directory the outputs are written to, keeping the layout of\
+                        the inputs. By default each output is written next to its input.")
+    parser.add_argument("--mode", "-m", choices=["bin","hex"], default="bin", help="The output mode for\
+                        text output: binary or hexadecimal.")
+    parser.add_argument("--verbose", "-v", action="store_true", help="Write both binary and hex in the\
+                        text output.")
+    parser.add_argument("--format", "-f", choices=["raw", "ihex", "elf"], help="Write binary objects instead\
+                        of text, see assembler.py --help.")
+    parser.add_argument("--jobs", "-j", type=int, help="Number of worker processes, one per CPU by default.")
+    parser.add_argument("--cache", "-c", help="A directory used to cache machine code between runs,\
+                        see assembler.py --help.")
+    parser.add_argument("--summary", type=argparse.FileType('w'), help="Also write the summary as JSON to\
+                        this file.")
+
+    args = parser.parse_args()
+    if(not args.inputs and not args.manifest):
+        parser.error("no inputs given")
+    return args
+
+
+if __name__== "__main__":
+    main(parse_args())
@@ -0,0 +1,56 @@
+"""
+    Tests for the batch mode of the CSSE232 Risc-V Assembler
+"""
+import assembler, batch_assembler
+import io, os, tempfile, unittest
+
+class TestBatchAssembler(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.root = self.directory.name
+        self.write("a/main.asm", "L: addi t0, t0, 1\nbne t0, x0, L\n")
+        self.write("b/main.asm", "add t0, t0, 4\n")
+        self.write("b/notes.txt", "not assembly\n")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def write(self, name, text):
+        path = os.path.join(self.root, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            f.write(text)
+        return path
+
+    def test_find_inputs(self):
+        manifest = io.StringIO("# comment\n%s  %s\n" % (os.path.join(self.root, "b", "main.asm"), "out.txt"))
+        files = batch_assembler.find_inputs([self.root, os.path.join(self.root, "*", "main.asm")], manifest)
+        names = [os.path.relpath(path, self.root) for path, output in files]
+        self.assertEqual([os.path.join("a", "main.asm"), os.path.join("b", "main.asm")] * 2 + [os.path.join("b", "main.asm")], names)
+        self.assertEqual("out.txt", files[-1][1])
+
+    def test_outputs_keep_layout(self):
+        files = batch_assembler.find_inputs([self.root])
+        out_dir = os.path.join(self.root, "out")
+        tasks = batch_assembler.plan_outputs(files, out_dir, "elf")
+        self.assertEqual([os.path.join(out_dir, "a", "main.elf"), os.path.join(out_dir, "b", "main.elf")],
+                         [output for path, output in tasks])
+        tasks = batch_assembler.plan_outputs(files)
+        self.assertEqual(os.path.join(self.root, "a", "main.txt"), tasks[0][1])
+
+    def test_assemble_files(self):
+        tasks = batch_assembler.plan_outputs(batch_assembler.find_inputs([self.root]), os.path.join(self.root, "out"))
+        results = batch_assembler.assemble_files(tasks, "hex", jobs=2)
+        self.assertEqual([True, False], [result["ok"] for result in results])
+        self.assertEqual(2, results[0]["instructions"])
+        self.assertEqual("BadRegister", results[1]["error"])
+
+        with open(results[0]["output"]) as f:
+            lines = f.readlines()
+        self.assertEqual(2, len(lines))
+        self.assertTrue(lines[0].startswith(assembler.word_to_hex(assembler.encode_instruction("addi t0, t0, 1"))))
+
+        summary = io.StringIO()
+        batch_assembler.print_summary(results, 0.5, summary)
+        self.assertIn("2 files, 1 ok, 1 failed", summary.getvalue())
+        self.assertIn("BadRegister: 1", summary.getvalue())
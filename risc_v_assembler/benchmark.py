@@ -0,0 +1,263 @@
+"""
+
+ Benchmark
+
+ Speed benchmarks for the CSSE232 Assembler. Generates reproducible
+ synthetic programs of any size and instruction mix (every core
+ instruction, labels with forward and backward branches and every
+ pseudoinstruction), times each pass of the assembler on them and saves
+ the results as a JSON baseline that later runs are compared against.
+
+ Usage:
+    python3 benchmark.py --save baseline.json
+    python3 benchmark.py --sizes 1000 100000 --compare baseline.json
+
+"""
+
+import io, sys, json, random, platform, argparse
+import assembler, assembly_stats
+import pseudoinstruction_handler as ph
+
+DEFAULT_SIZES = [1000, 100000, 1000000]
+"""Program sizes (in source lines) benchmarked by default"""
+
+DEFAULT_MIX = {"R":25, "I":25, "S":8, "SB":12, "U":5, "UJ":5, "PSEUDO":20}
+"""Default weight of each instruction type (names of `assembler.Types`) in generated programs"""
+
+REGISTERS = ["t0", "t1", "t2", "t3", "t4", "t5", "s0", "s1", "s2", "a0", "a1", "a2", "a3", "ra", "sp", "x0"]
+"""Registers used in generated programs"""
+
+LABEL_REACH = 8
+"""Branches go to labels at most this many label blocks away, so they always fit in 12 bits"""
+
+##############
+#
+# Program generator
+#
+##############
+
+def generate_program(size, seed = 0, mix = None, label_every = 16, comment_every = 20, pseudos = None):
+    """Returns a list of `size` lines of valid assembly code, the same for a
+        given `seed`. `mix` maps instruction type names to weights, see
+        `DEFAULT_MIX`. A label is defined every `label_every` lines and branches
+        and jumps go both forwards and backwards to nearby labels. Every
+        `comment_every` lines there is a comment or a blank line.
+
+        Only the pseudoinstructions in `pseudos` (`usable_pseudos()` by default)
+        are generated."""
+    if mix == None:
+        mix = DEFAULT_MIX
+    if pseudos == None:
+        pseudos = usable_pseudos()
+    if not pseudos:
+        mix = dict(mix, PSEUDO=0)
+
+    generator = random.Random(seed)
+    types = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in types]
+    commands = {}
+    for command, instruction_type in assembler.instructions_to_types.items():
+        commands.setdefault(instruction_type.name, []).append(command)
+    commands["PSEUDO"] = sorted(pseudos)
+
+    blocks = -(-size // label_every)
+    lines = []
+    for i in range(size):
+        block = i // label_every
+        if comment_every and i % comment_every == comment_every - 1:
+            lines.append(generator.choice(["", "; filler comment", "    ; indented comment"]))
+            continue
+
+        instruction_type = generator.choices(types, weights)[0]
+        command = generator.choice(commands[instruction_type])
+        target = "L%s" % min(blocks - 1, max(0, block + generator.randint(-LABEL_REACH, LABEL_REACH)))
+        line = generate_instruction(generator, command, target)
+
+        if i % label_every == 0:
+            line = "L%s: %s" % (block, line)
+        if generator.random() < 0.05:
+            line += "  ; trailing comment"
+        lines.append(line)
+
+    #a label block that starts on a comment line still needs its label
+    for block in range(blocks):
+        i = block * label_every
+        if not lines[i].startswith("L"):
+            lines[i] = "L%s: %s" % (block, generate_instruction(generator, "add", None))
+    return lines
+
+def generate_instruction(generator, command, target):
+    """Returns the text of one random, valid `command`. `target` is the label
+        used by branches and jumps."""
+    register = lambda: generator.choice(REGISTERS)
+    immediate = lambda bits: generator.randint(-2**(bits - 1), 2**(bits - 1) - 1)
+
+    instruction_type = assembler.instructions_to_types.get(command)
+    if command in ["lw", "jalr"] or instruction_type == assembler.Types.S:
+        return "%s %s, %s(%s)" % (command, register(), immediate(12), register())
+    if assembler.is_shift_immediate_instance(command):
+        return "%s %s, %s, %s" % (command, register(), register(), generator.randint(0, 31))
+    if instruction_type == assembler.Types.R:
+        return "%s %s, %s, %s" % (command, register(), register(), register())
+    if instruction_type == assembler.Types.I:
+        return "%s %s, %s, %s" % (command, register(), register(), immediate(12))
+    if instruction_type == assembler.Types.SB:
+        return "%s %s, %s, %s" % (command, register(), register(), target)
+    if instruction_type == assembler.Types.U:
+        return "%s %s, %s" % (command, register(), generator.randint(0, 2**20 - 1))
+    if instruction_type == assembler.Types.UJ:
+        return "%s %s, %s" % (command, register(), target)
+    return PSEUDO_TEMPLATES[command](register, immediate, target)
+
+PSEUDO_TEMPLATES = {"double":lambda register, immediate, target: "double %s, %s" % (register(), register()),
+                    "diffsums":lambda register, immediate, target: "diffsums %s, %s, %s, %s, %s" % tuple(register() for i in range(5)),
+                    "push":lambda register, immediate, target: "push %s" % register(),
+                    "li":lambda register, immediate, target: "li %s, %s" % (register(), immediate(32)),
+                    "beqz":lambda register, immediate, target: "beqz %s, %s" % (register(), target),
+                    "jalif":lambda register, immediate, target: "jalif %s, %s, %s" % (register(), register(), target)}
+"""Dictionary mapping each pseudoinstruction to a function returning a random call of it"""
+
+def usable_pseudos(pseudos = None, out = None):
+    """Returns the names of the pseudoinstructions in `pseudos` (the built in
+        ones by default) that the generator knows and that expand without
+        errors. The others are reported to `out` (stderr by default) and left
+        out of generated programs."""
+    if pseudos == None:
+        pseudos = ph.get_pseudoinstruction_defs()
+    out = out or sys.stderr
+
+    generator = random.Random(0)
+    usable = []
+    for name in sorted(pseudos):
+        if name not in PSEUDO_TEMPLATES:
+            out.write("benchmark: no generator for pseudoinstruction %s, skipping it\n" % name)
+            continue
+        try:
+            for i in range(16):
+                lines = ["L0: " + generate_instruction(generator, name, "L0")]
+                assembler.assemble_program(lines, pseudos)
+        except Exception as error:
+            out.write("benchmark: pseudoinstruction %s fails (%s: %s), skipping it\n" % (name, type(error).__name__, str(error).strip()))
+            continue
+        usable.append(name)
+    return usable
+
+##############
+#
+# Timing
+#
+##############
+
+def time_program(asm_lines, repeat = 3):
+    """Assembles `asm_lines` `repeat` times and returns a dictionary with the
+        best time of each pass (including writing the text output) in
+        `passes`, the best `total` time, the number of `instructions` and the
+        `peak_memory_kb`."""
+    best = {}
+    best_total = None
+    stats = None
+    for i in range(repeat):
+        stats = assembly_stats.AssemblyStats()
+        words, clean_code, labels = assembler.assemble_program(asm_lines, stats = stats)
+        started = stats.start()
+        assembler.output(words, [line.instruction_text() for line in clean_code], labels, out = io.StringIO())
+        stats.end_pass("output", started, len(words), len(words))
+
+        for record in stats.passes:
+            best[record.name] = min(best.get(record.name, record.seconds), record.seconds)
+        total = stats.total_seconds()
+        best_total = total if best_total == None else min(best_total, total)
+
+    return {"passes":best, "total":best_total, "instructions":stats.passes[-1].lines_out,
+            "peak_memory_kb":stats.peak_memory()}
+
+def run(sizes = None, repeat = 3, seed = 0, mix = None, out = None):
+    """Benchmarks a generated program of each size and returns the results
+        as a dictionary, ready to be saved as a baseline. Progress is written
+        to `out` (stderr by default)."""
+    if sizes == None:
+        sizes = DEFAULT_SIZES
+    out = out or sys.stderr
+    pseudos = usable_pseudos(out = out)
+
+    results = {"python":platform.python_version(), "machine":platform.machine(),
+               "encoder_version":assembler.ENCODER_VERSION, "seed":seed, "repeat":repeat,
+               "mix":mix or DEFAULT_MIX, "pseudos":pseudos, "sizes":{}}
+    for size in sizes:
+        lines = generate_program(size, seed, mix, pseudos = pseudos)
+        result = time_program(lines, repeat)
+        result["lines_per_second"] = size / result["total"] if result["total"] else None
+        results["sizes"][str(size)] = result
+        out.write("%9s lines  %9.3f s  %12.0f lines/s\n" % (size, result["total"], result["lines_per_second"] or 0))
+    return results
+
+def compare(results, baseline, tolerance = 0.10):
+    """Compares two results dictionaries from `run`. Returns a list of
+        `(size, name, old_seconds, new_seconds)` tuples for every pass (and the
+        `total`) that got more than `tolerance` slower, for the sizes in both."""
+    regressions = []
+    for size, result in results["sizes"].items():
+        old = baseline["sizes"].get(size)
+        if old == None:
+            continue
+        timings = dict(result["passes"], total=result["total"])
+        old_timings = dict(old["passes"], total=old["total"])
+        for name, seconds in timings.items():
+            if name in old_timings and seconds > old_timings[name] * (1 + tolerance):
+                regressions.append((size, name, old_timings[name], seconds))
+    return regressions
+
+def print_results(results, baseline = None, out = None):
+    """Prints a table with the time of every pass for each size, and the
+        change from `baseline` if given."""
+    out = out or sys.stdout
+    for size, result in results["sizes"].items():
+        old = baseline["sizes"].get(size) if baseline else None
+        out.write("\n%s lines, %s instructions\n" % (size, result["instructions"]))
+        timings = dict(result["passes"], total=result["total"])
+        for name, seconds in timings.items():
+            line = "  %-20s %10.4f s" % (name, seconds)
+            old_seconds = dict(old["passes"], total=old["total"]).get(name) if old else None
+            if old_seconds:
+                line += "  %+7.1f%%" % ((seconds / old_seconds - 1) * 100)
+            out.write(line + "\n")
+
+def parse_args():
+    """Parses the arguments to the benchmark and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Benchmarks the assembler on generated programs.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Program sizes in lines.\
+                        Defaults to 1000 100000 1000000.")
+    parser.add_argument("--repeat", "-r", type=int, default=3, help="Times each program is assembled, the best\
+                        time is kept. Defaults to 3.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the program generator.")
+    parser.add_argument("--save", type=argparse.FileType('w'), help="Save the results as a JSON baseline.")
+    parser.add_argument("--compare", type=argparse.FileType('r'), help="A JSON baseline to compare against.\
+                        Exits with status 1 if any pass got slower by more than --tolerance.")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed slow down before a pass counts\
+                        as a regression, as a fraction. Defaults to 0.10.")
+    parser.add_argument("--generate", type=int, metavar="LINES", help="Only print a generated program of\
+                        this many lines, e.g. to benchmark the command line tools.")
+    return parser.parse_args()
+
+def main(args):
+    if(args.generate):
+        sys.stdout.write("\n".join(generate_program(args.generate, args.seed)) + "\n")
+        return
+
+    baseline = json.load(args.compare) if args.compare else None
+    results = run(args.sizes, args.repeat, args.seed)
+    print_results(results, baseline)
+
+    if(args.save):
+        json.dump(results, args.save, indent=2)
+    if(baseline):
+        regressions = compare(results, baseline, args.tolerance)
+        for size, name, old_seconds, seconds in regressions:
+            print("REGRESSION  %s lines  %s: %.4f s -> %.4f s" % (size, name, old_seconds, seconds))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__== "__main__":
+    main(parse_args())
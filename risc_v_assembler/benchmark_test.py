@@ -0,0 +1,61 @@
+"""
+    Tests for the benchmark of the CSSE232 Risc-V Assembler
+"""
+import assembler, benchmark
+import io, unittest
+
+class TestProgramGenerator(unittest.TestCase):
+    def test_reproducible(self):
+        pseudos = benchmark.usable_pseudos(out=io.StringIO())
+        self.assertEqual(benchmark.generate_program(500, 3, pseudos=pseudos),
+                         benchmark.generate_program(500, 3, pseudos=pseudos))
+        self.assertNotEqual(benchmark.generate_program(500, 3, pseudos=pseudos),
+                            benchmark.generate_program(500, 4, pseudos=pseudos))
+
+    def test_programs_assemble(self):
+        pseudos = benchmark.usable_pseudos(out=io.StringIO())
+        for seed in range(5):
+            lines = benchmark.generate_program(2000, seed, pseudos=pseudos)
+            self.assertEqual(2000, len(lines))
+            words, code, labels = assembler.assemble_program(lines)
+            self.assertEqual(-(-2000 // 16), len(labels))
+
+    def test_every_instruction_is_used(self):
+        pseudos = benchmark.usable_pseudos(out=io.StringIO())
+        lines = benchmark.generate_program(5000, pseudos=pseudos)
+        commands = set(record.command for record in assembler.lex_pass(lines))
+        self.assertLessEqual(set(assembler.instructions_to_types), commands)
+        self.assertLessEqual(set(pseudos), commands)
+
+    def test_mix(self):
+        lines = benchmark.generate_program(300, mix={"R":1}, comment_every=0, pseudos=[])
+        for record in assembler.lex_pass(lines):
+            self.assertEqual(assembler.Types.R, assembler.instructions_to_types[record.command])
+
+    def test_broken_pseudos_are_skipped(self):
+        def broken(instruction, line_number):
+            raise assembler.BadOperands("broken")
+        out = io.StringIO()
+        pseudos = dict(assembler.ph.get_pseudoinstruction_defs(), push=broken, unknown=broken)
+        usable = benchmark.usable_pseudos(pseudos, out)
+        self.assertNotIn("push", usable)
+        self.assertNotIn("unknown", usable)
+        self.assertIn("double", usable)
+        self.assertIn("push fails", out.getvalue())
+
+class TestTiming(unittest.TestCase):
+    def test_run_and_compare(self):
+        results = benchmark.run([200], repeat=1, out=io.StringIO())
+        result = results["sizes"]["200"]
+        self.assertEqual(["lex", "pseudoinstructions", "labels", "machine code", "output"], list(result["passes"]))
+        self.assertGreater(result["instructions"], 0)
+        self.assertEqual([], benchmark.compare(results, results))
+
+        faster = {"sizes":{"200":{"passes":{name:seconds / 2 for name, seconds in result["passes"].items()},
+                                  "total":result["total"] / 2}}}
+        regressions = benchmark.compare(results, faster)
+        self.assertEqual(6, len(regressions))
+        self.assertEqual(("200", "lex"), regressions[0][:2])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,283 @@
+"""
+
+ Compressor
+
+ Rewrites the machine code of the CSSE232 Assembler with the 16-bit
+ instructions of the RV32C extension wherever an instruction has a
+ compressed equivalent (`--compress`). The instructions used are:
+
+    c.li  c.addi  c.addi16sp  c.addi4spn  c.lui  c.mv  c.add
+    c.sub  c.xor  c.or  c.and  c.andi  c.slli  c.srli  c.srai
+    c.lw  c.sw  c.lwsp  c.swsp  c.j  c.jal  c.jr  c.jalr  c.beqz  c.bnez
+
+ Each needs its registers and immediate in a smaller range, e.g. `c.lw`
+ only takes x8-x15 and offsets 0 to 124. Compressing works on the
+ 32-bit words (so every error is reported as usual first): the fields
+ are read back from each word, branch and jump targets are found from
+ their offsets, and every instruction gets a size of 2 or 4 bytes. A
+ compressed branch or jump that is out of range once the addresses are
+ known goes back to 4 bytes, until nothing changes. The offsets of
+ every branch and jump, and the labels, are then computed from the new
+ addresses.
+
+ Code computing an address in a register (other than the return address
+ written by `jal`/`jalr`) is not adjusted, and neither are branches and
+ jumps to somewhere outside the program.
+
+"""
+
+import struct
+import assembler, disassembler
+
+HALFWORD = struct.Struct("<H")
+WORD = struct.Struct("<I")
+
+#registers that fit the 3-bit register fields, x8 to x15
+COMPRESSED_REGISTERS = range(8, 16)
+
+#ranges of the offsets of compressed branches and jumps, in bytes
+BRANCH_RANGE = (-256, 254)
+JUMP_RANGE = (-2048, 2046)
+
+##############
+#
+# Compressing
+#
+##############
+
+def compress(machine_words):
+    """Takes the 32-bit machine words of a program starting at `assembler.PC`
+        and returns a tuple of the list of `(value, size)` tuples for each
+        instruction, where `size` is 2 for a compressed instruction and 4
+        otherwise, and the list of the new address of each instruction
+        followed by the address of the end of the program."""
+    size = len(machine_words)
+    fixed = [None] * size
+    relative = {}
+    targets = {}
+    for index, word in enumerate(machine_words):
+        name = disassembler.instruction_name(word)
+        offset = None
+        if name in ["beq", "bne", "blt", "bge"]:
+            offset = disassembler.SB_offset(word)
+        elif name == "jal":
+            offset = disassembler.UJ_offset(word)
+        if offset != None:
+            #branches and jumps leaving the program keep their word and offset
+            if offset % 4 or not 0 <= index + offset // 4 <= size:
+                continue
+            targets[index] = index + offset // 4
+        candidate = compressed_form(name, word)
+        if candidate == None:
+            continue
+        if index in targets:
+            relative[index] = candidate
+        else:
+            fixed[index] = candidate
+
+    #start with every branch and jump that can be compressed compressed, and
+    #give back the 2 bytes of those out of range until nothing changes
+    sizes = [2 if fixed[index] != None or index in relative else 4 for index in range(size)]
+    while True:
+        addresses = layout(sizes)
+        changed = False
+        for index, (encoder, arguments) in relative.items():
+            if sizes[index] == 2:
+                low, high = BRANCH_RANGE if encoder == encode_CB else JUMP_RANGE
+                if not low <= addresses[targets[index]] - addresses[index] <= high:
+                    sizes[index] = 4
+                    changed = True
+        if not changed:
+            break
+
+    parcels = []
+    for index, word in enumerate(machine_words):
+        if sizes[index] == 2:
+            if index in relative:
+                encoder, arguments = relative[index]
+                parcels.append((encoder(*arguments, addresses[targets[index]] - addresses[index]), 2))
+            else:
+                parcels.append((fixed[index], 2))
+        elif index in targets:
+            offset = addresses[targets[index]] - addresses[index]
+            name = disassembler.instruction_name(word)
+            parcels.append((with_jump_offset(word, offset) if name == "jal" else with_branch_offset(word, offset), 4))
+        else:
+            parcels.append((word, 4))
+    return (parcels, addresses)
+
+def layout(sizes):
+    """Returns the address of each instruction of the given sizes, followed by
+        the address of the end of the program."""
+    addresses = [assembler.PC]
+    for size in sizes:
+        addresses.append(addresses[-1] + size)
+    return addresses
+
+def compress_labels(labels, addresses):
+    """Returns the labels dictionary with the addresses from `compress`."""
+    compressed = {}
+    for label, address in labels.items():
+        index = (address - assembler.PC) // 4
+        if 0 <= index < len(addresses) and address % 4 == 0:
+            address = addresses[index]
+        compressed[label] = address
+    return compressed
+
+def to_bytes(parcels):
+    """Returns the `(value, size)` parcels from `compress` as little-endian bytes."""
+    return b"".join(HALFWORD.pack(value) if size == 2 else WORD.pack(value) for value, size in parcels)
+
+def compressed_size(parcels):
+    """Returns the size in bytes of the parcels."""
+    return sum(size for value, size in parcels)
+
+##############
+#
+# Recognizing instructions
+#
+##############
+
+def compressed_form(name, word):
+    """Returns the 16-bit encoding of the instruction `word` (named `name`), or
+        for branches and jumps a tuple of the encoder and a tuple of its
+        arguments besides the offset, or `None` if it has no compressed form."""
+    rd = (word >> 7) & 0x1f
+    rs1 = (word >> 15) & 0x1f
+    rs2 = (word >> 20) & 0x1f
+    immediate = disassembler.sign_extend(word >> 20, 12)
+
+    if name == "addi":
+        if rd != 0 and rs1 == 0 and fits(immediate, 6):
+            return encode_CI(0b010, rd, immediate, 0b01)                                      #c.li
+        if rd != 0 and rd == rs1 and immediate != 0 and fits(immediate, 6):
+            return encode_CI(0b000, rd, immediate, 0b01)                                      #c.addi
+        if rd == 2 and rs1 == 2 and immediate != 0 and immediate % 16 == 0 and -512 <= immediate <= 496:
+            return encode_addi16sp(immediate)
+        if rd in COMPRESSED_REGISTERS and rs1 == 2 and 0 < immediate <= 1020 and immediate % 4 == 0:
+            return encode_addi4spn(rd, immediate)
+        if rd != 0 and rs1 != 0 and immediate == 0:
+            return encode_CR(0b1000, rd, rs1)                                                 #c.mv
+    elif name == "add" and rd != 0:
+        if rs1 == 0 and rs2 != 0:
+            return encode_CR(0b1000, rd, rs2)                                                 #c.mv
+        if rd == rs1 and rs2 != 0:
+            return encode_CR(0b1001, rd, rs2)                                                 #c.add
+        if rd == rs2 and rs1 != 0:
+            return encode_CR(0b1001, rd, rs1)                                                 #c.add
+    elif name in ARITHMETIC:
+        if rd == rs1 and rd in COMPRESSED_REGISTERS and rs2 in COMPRESSED_REGISTERS:
+            return encode_CA(ARITHMETIC[name], rd, rs2)
+    elif name == "andi":
+        if rd == rs1 and rd in COMPRESSED_REGISTERS and fits(immediate, 6):
+            return encode_CB_immediate(0b10, rd, immediate)                                   #c.andi
+    elif name == "slli":
+        if rd == rs1 and rd != 0 and rs2 != 0:
+            return encode_CI(0b000, rd, rs2, 0b10)                                            #c.slli
+    elif name in ["srli", "srai"]:
+        if rd == rs1 and rd in COMPRESSED_REGISTERS and rs2 != 0:
+            return encode_CB_immediate(0b00 if name == "srli" else 0b01, rd, rs2)
+    elif name == "lui":
+        upper = disassembler.sign_extend(word >> 12, 20)
+        if rd not in [0, 2] and upper != 0 and fits(upper, 6):
+            return encode_CI(0b011, rd, upper, 0b01)                                          #c.lui
+    elif name == "lw":
+        if rs1 == 2 and rd != 0 and 0 <= immediate <= 252 and immediate % 4 == 0:
+            return encode_lwsp(rd, immediate)
+        if rd in COMPRESSED_REGISTERS and rs1 in COMPRESSED_REGISTERS and 0 <= immediate <= 124 and immediate % 4 == 0:
+            return encode_CL(0b010, rd, rs1, immediate)                                       #c.lw
+    elif name == "sw":
+        offset = disassembler.sign_extend(((word >> 25) << 5) | ((word >> 7) & 0x1f), 12)
+        if rs1 == 2 and 0 <= offset <= 252 and offset % 4 == 0:
+            return encode_swsp(rs2, offset)
+        if rs2 in COMPRESSED_REGISTERS and rs1 in COMPRESSED_REGISTERS and 0 <= offset <= 124 and offset % 4 == 0:
+            return encode_CL(0b110, rs2, rs1, offset)                                         #c.sw
+    elif name == "jalr":
+        if immediate == 0 and rs1 != 0 and rd in [0, 1]:
+            return encode_CR(0b1000 if rd == 0 else 0b1001, rs1, 0)                           #c.jr, c.jalr
+    elif name == "jal":
+        if rd in [0, 1]:
+            return (encode_CJ, (0b101 if rd == 0 else 0b001,))                                #c.j, c.jal
+    elif name in ["beq", "bne"]:
+        register = rs1 if rs2 == 0 else rs2 if rs1 == 0 else None
+        if register in COMPRESSED_REGISTERS:
+            return (encode_CB, (0b110 if name == "beq" else 0b111, register))                 #c.beqz, c.bnez
+    return None
+
+ARITHMETIC = {"sub":0b00, "xor":0b01, "or":0b10, "and":0b11}
+"""Dictionary mapping the instructions with a CA format equivalent to their funct2"""
+
+def fits(value, bits):
+    """Returns True if `value` fits in a signed field of `bits` bits."""
+    return -(1 << (bits - 1)) <= value < 1 << (bits - 1)
+
+##############
+#
+# Encoding
+#
+# One function per RV32C format, `register` arguments are register
+# numbers and the 3-bit fields are filled with `register - 8`.
+#
+##############
+
+def encode_CR(funct4, rd, rs2):
+    return (funct4 << 12) | (rd << 7) | (rs2 << 2) | 0b10
+
+def encode_CI(funct3, rd, immediate, opcode):
+    immediate &= 0x3f
+    return (funct3 << 13) | ((immediate >> 5) << 12) | (rd << 7) | ((immediate & 0x1f) << 2) | opcode
+
+def encode_addi16sp(immediate):
+    immediate &= 0x3ff
+    bits = (((immediate >> 4) & 1) << 6) | (((immediate >> 6) & 1) << 5) | (((immediate >> 7) & 0x3) << 3) | (((immediate >> 5) & 1) << 2)
+    return (0b011 << 13) | ((immediate >> 9) << 12) | (2 << 7) | bits | 0b01
+
+def encode_addi4spn(rd, immediate):
+    bits = (((immediate >> 4) & 0x3) << 11) | (((immediate >> 6) & 0xf) << 7) | (((immediate >> 2) & 1) << 6) | (((immediate >> 3) & 1) << 5)
+    return bits | ((rd - 8) << 2)
+
+def encode_lwsp(rd, offset):
+    return (0b010 << 13) | (((offset >> 5) & 1) << 12) | (rd << 7) | (((offset >> 2) & 0x7) << 4) | (((offset >> 6) & 0x3) << 2) | 0b10
+
+def encode_swsp(rs2, offset):
+    return (0b110 << 13) | (((offset >> 2) & 0xf) << 9) | (((offset >> 6) & 0x3) << 7) | (rs2 << 2) | 0b10
+
+def encode_CL(funct3, register, base, offset):
+    #c.lw and c.sw share the layout, `register` is rd or rs2
+    return ((funct3 << 13) | (((offset >> 3) & 0x7) << 10) | ((base - 8) << 7) | (((offset >> 2) & 1) << 6)
+            | (((offset >> 6) & 1) << 5) | ((register - 8) << 2))
+
+def encode_CA(funct2, rd, rs2):
+    return (0b100011 << 10) | ((rd - 8) << 7) | (funct2 << 5) | ((rs2 - 8) << 2) | 0b01
+
+def encode_CB_immediate(funct2, rd, immediate):
+    #c.srli, c.srai and c.andi
+    immediate &= 0x3f
+    return (0b100 << 13) | ((immediate >> 5) << 12) | (funct2 << 10) | ((rd - 8) << 7) | ((immediate & 0x1f) << 2) | 0b01
+
+def encode_CB(funct3, rs1, offset):
+    offset &= 0x1ff
+    bits = ((((offset >> 8) & 1) << 12) | (((offset >> 3) & 0x3) << 10) | (((offset >> 6) & 0x3) << 5)
+            | (((offset >> 1) & 0x3) << 3) | (((offset >> 5) & 1) << 2))
+    return (funct3 << 13) | bits | ((rs1 - 8) << 7) | 0b01
+
+def encode_CJ(funct3, offset):
+    offset &= 0xfff
+    bits = ((((offset >> 11) & 1) << 12) | (((offset >> 4) & 1) << 11) | (((offset >> 8) & 0x3) << 9)
+            | (((offset >> 10) & 1) << 8) | (((offset >> 6) & 1) << 7) | (((offset >> 7) & 1) << 6)
+            | (((offset >> 1) & 0x7) << 3) | (((offset >> 5) & 1) << 2))
+    return (funct3 << 13) | bits | 0b01
+
+def with_branch_offset(word, offset):
+    """Returns the branch `word` with its offset replaced, imm[12|10:5] and imm[4:1|11]."""
+    offset &= 0x1fff
+    word &= 0x01fff07f
+    return (word | ((offset >> 12) << 31) | (((offset >> 5) & 0x3f) << 25)
+            | (((offset >> 1) & 0xf) << 8) | (((offset >> 11) & 1) << 7))
+
+def with_jump_offset(word, offset):
+    """Returns the `jal` `word` with its offset replaced, imm[20|10:1|11|19:12]."""
+    offset &= 0x1fffff
+    word &= 0xfff
+    return (word | ((offset >> 20) << 31) | (((offset >> 1) & 0x3ff) << 21)
+            | (((offset >> 11) & 1) << 20) | (((offset >> 12) & 0xff) << 12))
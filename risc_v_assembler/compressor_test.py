@@ -0,0 +1,92 @@
+"""
+    Tests for the RV32C compressor of the CSSE232 Risc-V Assembler
+"""
+import assembler, assembly_stats, compressor
+import io, sys, unittest
+
+def compressed(lines):
+    machine_words, clean_code, labels = assembler.assemble_program(lines)
+    parcels, addresses = compressor.compress(machine_words)
+    return (parcels, addresses, compressor.compress_labels(labels, addresses))
+
+class TestCompressor(unittest.TestCase):
+    def test_encodings(self):
+        cases = [("addi a0, x0, 0", 0x4501), ("lw ra, 12(sp)", 0x40b2), ("sw ra, 12(sp)", 0xc606),
+                 ("jalr x0, ra, 0", 0x8082), ("add a0, x0, a1", 0x852e), ("add a0, a0, a1", 0x952e),
+                 ("lw a0, 0(a0)", 0x4108), ("sw a0, 0(a1)", 0xc188), ("lui a0, 1", 0x6505),
+                 ("slli a0, a0, 1", 0x0506), ("srli a0, a0, 1", 0x8105), ("srai a0, a0, 1", 0x8505),
+                 ("andi a0, a0, 1", 0x8905), ("sub a0, a0, a1", 0x8d0d), ("xor a0, a0, a1", 0x8d2d),
+                 ("or a0, a0, a1", 0x8d4d), ("and a0, a0, a1", 0x8d6d), ("addi a0, sp, 4", 0x0048),
+                 ("jalr ra, a0, 0", 0x9502), ("addi a0, a0, 1", 0x0505), ("addi a0, x0, -1", 0x557d),
+                 ("addi sp, sp, -16", 0x1141), ("addi sp, sp, -64", 0x7139)]
+        for line, expected in cases:
+            parcels, addresses, labels = compressed([line])
+            self.assertEqual(parcels, [(expected, 2)], line)
+
+    def test_not_compressible(self):
+        for line in ["addi t0, t1, 5", "lw t0, 256(sp)", "sw t0, 0(t1)", "lui t0, 74565", "addi a0, a0, 40",
+                     "sub t0, t0, t1", "slt a0, a0, a1"]:
+            machine_words = assembler.assemble_program([line])[0]
+            parcels, addresses = compressor.compress(machine_words)
+            self.assertEqual(parcels, [(machine_words[0], 4)], line)
+
+    def test_branches_and_labels(self):
+        lines = ["main: addi s0, x0, 10", "loop: addi s0, s0, -1", "bne s0, x0, loop", "jal ra, func",
+                 "jal x0, main", "func: jalr x0, ra, 0"]
+        parcels, addresses, labels = compressed(lines)
+        self.assertEqual([size for value, size in parcels], [2] * 6)
+        self.assertEqual(addresses, [assembler.PC + 2 * index for index in range(7)])
+        self.assertEqual(labels, {"main":assembler.PC, "loop":assembler.PC + 2, "func":assembler.PC + 10})
+        #c.bnez s0, -2 and c.jal +4
+        self.assertEqual(parcels[2][0], compressor.encode_CB(0b111, 8, -2))
+        self.assertEqual(parcels[3][0], compressor.encode_CJ(0b001, 4))
+
+    def test_out_of_range_branch_stays_long(self):
+        lines = ["start: beq s0, x0, end"] + ["slt t0, t0, t1"] * 100 + ["end: addi s0, s0, 1"]
+        parcels, addresses, labels = compressed(lines)
+        self.assertEqual(parcels[0][1], 4)
+        self.assertEqual(parcels[-1][1], 2)
+        self.assertEqual(labels["end"], assembler.PC + 4 + 400)
+
+    def test_long_branch_offset_recomputed(self):
+        #the branch can not be compressed but the code it jumps over shrinks
+        lines = ["beq t0, x0, end", "addi a0, a0, 1", "addi a1, a1, 1", "end: slt t0, t0, t1"]
+        parcels, addresses, labels = compressed(lines)
+        self.assertEqual([size for value, size in parcels], [4, 2, 2, 4])
+        self.assertEqual(parcels[0][0], assembler.assemble_program(["beq t0, x0, 8"])[0][0])
+
+    def test_targets_outside_the_program(self):
+        #left 32-bit with the offsets they were written with
+        for lines in [["addi s0, x0, 1", "jal x0, 400"], ["beq x0, x0, -8", "addi s0, x0, 1"],
+                      ["addi s0, x0, 1", "bne s0, x0, 12"]]:
+            words = assembler.assemble_program(lines)[0]
+            parcels, addresses = compressor.compress(words)
+            branch = 1 if lines[1].startswith(("jal", "bne")) else 0
+            self.assertEqual((words[branch], 4), parcels[branch])
+            self.assertEqual(2, parcels[1 - branch][1])
+
+    def test_to_bytes(self):
+        parcels = [(0x4501, 2), (0x123452b7, 4)]
+        self.assertEqual(compressor.to_bytes(parcels), b"\x01\x45\xb7\x52\x34\x12")
+        self.assertEqual(compressor.compressed_size(parcels), 6)
+
+    def test_smaller_program(self):
+        lines = ["addi sp, sp, -16", "sw ra, 12(sp)", "sw s0, 8(sp)", "addi s0, x0, 0", "loop: lw a0, 0(s0)",
+                 "add a1, a1, a0", "addi s0, s0, 4", "blt s0, a2, loop", "lw s0, 8(sp)", "lw ra, 12(sp)",
+                 "addi sp, sp, 16", "jalr x0, ra, 0"]
+        parcels, addresses, labels = compressed(lines)
+        self.assertLess(compressor.compressed_size(parcels), 0.7 * 4 * len(lines))
+
+    def test_report(self):
+        #the compress pass is measured in bytes of text
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            assembler.report_removed(assembly_stats.PassStats("compress", 0.0, 48, 40))
+            report = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual("compress: 4 of 12 instructions compressed, 40 bytes of text instead of 48\n", report)
+
+if __name__ == '__main__':
+    unittest.main()
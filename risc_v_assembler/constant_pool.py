@@ -0,0 +1,141 @@
+"""
+
+ Constant Pool
+
+ An optional pass of the CSSE232 Assembler (`--pool`) that runs before
+ the pseudoinstructions are expanded and loads the constants `li` uses
+ over and over from memory instead of building them every time:
+
+    li a0, 0x12345678       lui a0, 74565          lw a0, 0(gp)
+                     ->     addi a0, a0, 1656  ->
+
+ Every constant is counted across the program, and `worth_pooling`
+ decides for each one if a word in a literal pool in the data segment
+ (see `data_segment`) costs less than the `lui`/`addi` of each use. The
+ pool is addressed off `gp`, which is set once before the first
+ instruction (to the address of the pool, or just its upper 20 bits if
+ that is enough), so it holds at most `POOL_ENTRIES` constants. Constants that `li` loads with a single instruction are
+ never pooled.
+
+ Programs that use `gp` themselves are left unchanged, and so are
+ programs with a numeric branch or jump offset, since shorter `li`s and
+ the setup of `gp` would move the code it lands on.
+
+"""
+
+import assembler, data_segment
+import pseudoinstruction_handler as ph
+
+BASE_REGISTER = "gp"
+
+#constants a 12-bit offset from the base register reaches
+POOL_ENTRIES = 2048 // 4
+
+#costs of the cost model, in bytes: each instruction and each pool entry
+#is a word, and a load may stall the instruction after it for a cycle,
+#counted as a fraction of an instruction
+INSTRUCTION_COST = 4
+ENTRY_COST = 4
+LOAD_COST = 1
+
+##############
+#
+# Pooling
+#
+##############
+
+def pool_constants(records, data):
+    """Takes a list of `assembler.AsmLine` records before the pseudoinstructions
+        are expanded and a `data_segment.DataSegment`, and returns a tuple of
+        the new records, where `li` of the constants worth pooling are loads
+        from a pool added to `data`, the number of instructions the `li`s took
+        before and the number they take now (setting `gp` included).
+
+        `li` with invalid operands are left alone, the pseudoinstruction pass
+        reports those."""
+    uses = {}
+    lengths = {}
+    for record in records:
+        if uses_base_register(record) or has_numeric_offset(record):
+            return (records, 0, 0)
+        value = constant(record)
+        if value != None:
+            uses[value] = uses.get(value, 0) + 1
+            lengths[value] = len(ph.materialize_constant("x0", value))
+
+    before = sum(uses[value] * lengths[value] for value in uses)
+    savings = dict((value, uses[value] * (lengths[value] - 1) * INSTRUCTION_COST - uses[value] * LOAD_COST - ENTRY_COST)
+                   for value in uses)
+    pooled = sorted([value for value in uses if worth_pooling(uses[value], lengths[value])],
+                    key=lambda value: (-savings[value], value))[:POOL_ENTRIES]
+    #setting the base register is paid once, the pool starts at the next word of
+    #data. The lui of its address alone is enough if the offsets still fit after it
+    start = data.address() + (-len(data) % 4)
+    lower = data_segment.split_address(start)[1]
+    if lower + 4 * (len(pooled) - 1) > 2047:
+        lower = 0
+    setup = ph.materialize_constant(BASE_REGISTER, start - lower)
+    if sum(savings[value] for value in pooled) <= len(setup) * INSTRUCTION_COST:
+        return (records, before, before)
+
+    data.add_words(pooled)
+    offsets = dict((value, lower + 4 * index) for index, value in enumerate(pooled))
+    after = len(setup)
+
+    first = records[0].line_number if records else 0
+    new_records = [assembler.AsmLine(None, command, operands, first) for command, operands in setup]
+    for record in records:
+        value = constant(record)
+        if value in offsets:
+            record = assembler.AsmLine(record.label, "lw", (record.operands[0], "%s(%s)" % (offsets[value], BASE_REGISTER)),
+                                       record.line_number)
+            after += 1
+        elif value != None:
+            after += lengths[value]
+        new_records.append(record)
+    return (new_records, before, after)
+
+def worth_pooling(uses, length):
+    """Returns True if loading a constant used by `uses` `li`s, each `length`
+        instructions long, from the pool costs less than building it each time."""
+    inline = uses * length * INSTRUCTION_COST
+    pooled = uses * (INSTRUCTION_COST + LOAD_COST) + ENTRY_COST
+    return pooled < inline
+
+##############
+#
+# Helpers
+#
+##############
+
+def constant(record):
+    """Returns the value (as an unsigned 32-bit int) a valid `li` record loads
+        into a register other than x0, or `None`."""
+    if record.command != "li" or len(record.operands) != 2 or not assembler.register_name_to_num.get(record.operands[0]):
+        return None
+    if assembler.is_register_name(record.operands[1]):
+        return None
+    try:
+        value = assembler.parse_immediate(record.operands[1])
+    except assembler.BadImmediate:
+        return None
+    if not -2**31 <= value <= 2**32 - 1:
+        return None
+    return value & 0xffffffff
+
+def has_numeric_offset(record):
+    """Returns True if `record` is a branch or `jal` with a numeric offset, or a
+        pseudoinstruction ending in a number that may expand into one."""
+    if record.command == "li" or not record.operands or not assembler.is_int(record.operands[-1]):
+        return False
+    kind = assembler.instructions_to_types.get(record.command)
+    return kind == None or kind in [assembler.Types.SB, assembler.Types.UJ]
+
+def uses_base_register(record):
+    """Returns True if any operand of `record` names the base register."""
+    number = assembler.register_name_to_num[BASE_REGISTER]
+    for operand in record.operands:
+        operand = operand.replace(")", "").split("(")[-1].strip()
+        if assembler.register_name_to_num.get(operand) == number:
+            return True
+    return False
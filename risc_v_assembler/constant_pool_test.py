@@ -0,0 +1,95 @@
+"""
+    Tests for the constant pool of the CSSE232 Risc-V Assembler
+"""
+import assembler, constant_pool, data_segment, simulator
+import random, unittest
+
+REGISTERS = ["t0", "t1", "t2", "a0", "a1", "a2", "s1"]
+
+def pooled(lines):
+    data = data_segment.DataSegment()
+    records, before, after = constant_pool.pool_constants(assembler.lex_pass(lines), data)
+    return ([record.instruction_text() for record in records if record.command], data, before, after)
+
+def final_registers(lines, pool):
+    data = data_segment.DataSegment()
+    words = assembler.assemble_program(lines, pool = pool, data = data)[0]
+    machine = simulator.Simulator(words, data = data)
+    machine.run(max_steps = 100000)
+    return [machine.get_register(register) for register in REGISTERS]
+
+class TestConstantPool(unittest.TestCase):
+    def test_cost_model(self):
+        self.assertFalse(constant_pool.worth_pooling(1, 2))
+        self.assertTrue(constant_pool.worth_pooling(2, 2))
+        self.assertFalse(constant_pool.worth_pooling(1000, 1))
+
+    def test_repeated_constants(self):
+        lines = ["start: li a0, 305419896", "li a1, 305419896", "li a2, 5", "li t0, -559038737", "li t1, -559038737",
+                 "li t2, -559038737", "li s1, 4096", "li s1, 4096", "li a2, 305419896"]
+        text, data, before, after = pooled(lines)
+        self.assertEqual(text, ["lui gp, 65552", "lw a0, 0(gp)", "lw a1, 0(gp)", "li a2, 5", "lw t0, 4(gp)", "lw t1, 4(gp)",
+                                "lw t2, 4(gp)", "li s1, 4096", "li s1, 4096", "lw a2, 0(gp)"])
+        self.assertEqual(data.words(), [0x12345678, 0xdeadbeef])
+        self.assertEqual((before, after), (15, 10))
+
+    def test_break_even(self):
+        #two constants used twice cost as much either way once gp is set
+        lines = ["li a0, 305419896", "li a1, 305419896", "li t0, -559038737", "li t1, -559038737"]
+        self.assertEqual(pooled(lines)[0], lines)
+
+    def test_labels_stay(self):
+        lines = ["li a0, 305419896", "loop: li a1, 305419896", "li a2, 305419896", "addi a0, a0, -1", "bne a0, x0, loop"]
+        records = constant_pool.pool_constants(assembler.lex_pass(lines), data_segment.DataSegment())[0]
+        self.assertEqual([record.label for record in records], [None, None, "loop", None, None, None])
+
+    def test_not_worth_it(self):
+        lines = ["li a0, 305419896", "li a1, 5", "li a2, 5"]
+        text, data, before, after = pooled(lines)
+        self.assertEqual(text, lines)
+        self.assertEqual(len(data), 0)
+
+    def test_programs_using_gp_are_left_alone(self):
+        for line in ["addi gp, gp, 4", "lw t0, 0(gp)", "add t0, x3, t0"]:
+            lines = ["li a0, 305419896", "li a1, 305419896", line]
+            self.assertEqual(pooled(lines)[0], lines)
+
+    def test_numeric_offsets_are_left_alone(self):
+        #the beq lands on the last addi, pooling would move it past the end
+        lines = ["li t1, 305419896"] * 3 + ["li a0, 1", "beq x0, x0, 16", "li t0, 305419896", "addi a0, x0, 7",
+                                            "addi a1, x0, 9"]
+        text, data, before, after = pooled(lines)
+        self.assertEqual((lines, 0), (text, len(data)))
+        self.assertEqual(final_registers(lines, False), final_registers(lines, True))
+        self.assertEqual(9, final_registers(lines, True)[REGISTERS.index("a1")])
+        for lines in [["li t1, 305419896"] * 3 + ["jal x0, 8"], ["li t1, 305419896"] * 3 + ["beqz t1, 8"]]:
+            self.assertEqual(lines, pooled(lines)[0])
+
+    def test_pool_size_limit(self):
+        #twice as many repeated constants as fit, the most used ones win
+        lines = []
+        for index in range(2 * constant_pool.POOL_ENTRIES):
+            lines += ["li a0, %s" % (0x10000001 + (index << 12))] * (3 if index % 2 else 2)
+        text, data, before, after = pooled(lines)
+        self.assertEqual(len(data.words()), constant_pool.POOL_ENTRIES)
+        self.assertEqual(set(data.words()), set(0x10000001 + (index << 12) for index in range(1, 2 * constant_pool.POOL_ENTRIES, 2)))
+        self.assertIn("lw a0, 2044(gp)", text)
+
+    def test_same_result_when_run(self):
+        generator = random.Random(24)
+        constants = [generator.randrange(-2**31, 2**32) for count in range(6)] + [7, -3]
+        lines = []
+        for count in range(60):
+            rd = generator.choice(REGISTERS)
+            if generator.random() < 0.6:
+                lines.append("li %s, %s" % (rd, generator.choice(constants)))
+            else:
+                lines.append("add %s, %s, %s" % (rd, generator.choice(REGISTERS), generator.choice(REGISTERS)))
+        self.assertEqual(final_registers(lines, True), final_registers(lines, False))
+
+    def test_needs_data_segment(self):
+        with self.assertRaises(ValueError):
+            assembler.assemble_program(["li a0, 305419896"], pool = True)
+
+if __name__ == '__main__':
+    unittest.main()
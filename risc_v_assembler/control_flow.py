@@ -0,0 +1,351 @@
+"""
+
+ Control Flow Graph
+
+ Splits the clean code of the CSSE232 Assembler (after
+ `assembler.parse_labels`) into basic blocks and links them into a
+ control flow graph. A block starts at the first instruction, at every
+ labelled instruction, at every branch or jump target and after every
+ branch, `jal` and `jalr`, and it ends at the next of those.
+
+ The graph can be written in the DOT language of Graphviz, and
+ `remove_unreachable` drops the blocks that can not be reached from the
+ first instruction (the `--prune` option of the assembler).
+
+ `jalr x0, ra, 0` (and `jalr x0, 0(ra)`) is taken to be a return, which
+ goes back to the instruction after a call that is already a successor
+ of the call. Any other `jalr` may go to any labelled block. A branch
+ comparing a register with itself (`beq x0, x0, target`) is known to
+ always or never be taken.
+
+ Usage:
+    python3 control_flow.py program.asm -o program.dot
+    dot -Tsvg program.dot -o program.svg
+
+"""
+
+import sys, argparse
+import assembler
+
+BRANCHES = ["beq", "bne", "blt", "bge"]
+
+#branches that are always taken when both registers are the same
+ALWAYS_TAKEN = ["beq", "bge"]
+
+#kinds of edges, the names are used as the edge labels of the DOT output
+BRANCH = "taken"
+FALLTHROUGH = "fallthrough"
+JUMP = "jump"
+CALL = "call"
+
+##############
+#
+# Graph
+#
+##############
+
+class BasicBlock():
+    """
+    The instructions `records[start:end]` of a program, which always run
+    from the first to the last. `labels` are the labels naming the first
+    instruction, `successors` and `predecessors` are lists of tuples of a
+    block number (`None` for the end of the program) and the kind of edge.
+    `indirect` is True if the block ends in a `jalr` that may also go to any
+    of the `ControlFlowGraph.indirect_targets`, which are not listed as
+    successors.
+    """
+    def __init__(self, number, start, end):
+        self.number = number
+        self.start = start
+        self.end = end
+        self.labels = []
+        self.successors = []
+        self.predecessors = []
+        self.indirect = False
+
+    def __len__(self):
+        return self.end - self.start
+
+    def __repr__(self):
+        return "BasicBlock(%s, %s, %s)" % (self.number, self.start, self.end)
+
+class ControlFlowGraph():
+    """
+    The basic blocks of a list of `assembler.AsmLine` records (with no labels
+    or pseudoinstructions) and its labels dictionary. `targets` maps the index
+    of each branch and jump whose target is known to the index of the target
+    instruction (the number of instructions for the end of the program).
+    `block_of` maps each instruction index to its block number and
+    `indirect_targets` lists the numbers of the labelled blocks, where a
+    `jalr` may go.
+
+    Targets that are not labels or offsets to an instruction are left out,
+    the machine code pass reports those.
+    """
+    def __init__(self, records, labels):
+        self.records = records
+        self.labels = labels
+        self.targets = {}
+        size = len(records)
+
+        #index of the instruction each label names
+        label_indices = {}
+        for label, address in labels.items():
+            index = (address - assembler.PC) // 4
+            if 0 <= index <= size and address % 4 == 0:
+                label_indices.setdefault(index, []).append(label)
+
+        leaders = {0} | set(index for index in label_indices if index < size)
+        for index, record in enumerate(records):
+            if is_control_transfer(record):
+                leaders.add(index + 1)
+                target = jump_target(record, labels, index, size)
+                if target != None:
+                    self.targets[index] = target
+                    leaders.add(target)
+        leaders = sorted(leader for leader in leaders if leader < size)
+
+        self.blocks = []
+        self.block_of = [0] * size
+        for number, start in enumerate(leaders):
+            end = leaders[number + 1] if number + 1 < len(leaders) else size
+            block = BasicBlock(number, start, end)
+            block.labels = label_indices.get(start, [])
+            self.blocks.append(block)
+            self.block_of[start:end] = [number] * (end - start)
+
+        self.indirect_targets = [block.number for block in self.blocks if block.labels]
+        for block in self.blocks:
+            for successor, kind in self.edges(block):
+                block.successors.append((successor, kind))
+                if successor != None:
+                    self.blocks[successor].predecessors.append((block.number, kind))
+
+    def block_at(self, index):
+        """Returns the block number of the instruction index `index`, `None`
+            for the end of the program."""
+        return self.block_of[index] if index < len(self.records) else None
+
+    def edges(self, block):
+        """Returns the list of `(successor, kind)` tuples leaving `block`, and
+            sets `block.indirect`."""
+        last = block.end - 1
+        record = self.records[last]
+        following = self.block_at(block.end)
+        known = last in self.targets
+        target = self.block_at(self.targets[last]) if known else None
+
+        if record.command in BRANCHES:
+            #comparing a register with itself always goes the same way
+            same = len(record.operands) == 3 and register_number(record.operands[0]) == register_number(record.operands[1]) != None
+            edges = [] if same and record.command in ALWAYS_TAKEN else [(following, FALLTHROUGH)]
+            if known and not (same and record.command not in ALWAYS_TAKEN):
+                edges.insert(0, (target, BRANCH))
+        elif record.command == "jal":
+            links = link_register(record) != 0
+            edges = [(target, CALL if links else JUMP)] if known else []
+            if links:
+                edges.append((following, FALLTHROUGH))
+        elif record.command == "jalr":
+            block.indirect = not is_return(record)
+            edges = []
+            if link_register(record) != 0:
+                edges.append((following, FALLTHROUGH))
+        else:
+            edges = [(following, FALLTHROUGH)]
+
+        #a branch to the next instruction is a single edge
+        if len(edges) == 2 and edges[0][0] == edges[1][0]:
+            return edges[:1]
+        return edges
+
+    def reachable(self, entry = 0):
+        """Returns the set of block numbers that can be reached from block `entry`."""
+        if not self.blocks:
+            return set()
+        seen = {entry}
+        work = [entry]
+        indirect = False
+        while work:
+            block = self.blocks[work.pop()]
+            successors = [successor for successor, kind in block.successors]
+            if block.indirect and not indirect:
+                indirect = True
+                successors += self.indirect_targets
+            for successor in successors:
+                if successor != None and successor not in seen:
+                    seen.add(successor)
+                    work.append(successor)
+        return seen
+
+    def to_dot(self, name = "cfg"):
+        """Returns the graph in the DOT language. Unreachable blocks are dashed,
+            indirect jumps go through a node to the labelled blocks."""
+        reachable = self.reachable()
+        lines = ["digraph %s {" % name, '\tnode [shape=box, fontname="monospace"];', '\texit [shape=oval];']
+        for block in self.blocks:
+            text = ["%s:" % label for label in block.labels]
+            for index in range(block.start, block.end):
+                text.append("0x%08x  %s" % (assembler.index_to_address(index), self.records[index].instruction_text()))
+            style = "" if block.number in reachable else ", style=dashed"
+            lines.append('\tb%s [label="%s\\l"%s];' % (block.number, "\\l".join(dot_escape(line) for line in text), style))
+        for block in self.blocks:
+            for successor, kind in block.successors:
+                lines.append('\tb%s -> %s [label="%s"];' % (block.number, "exit" if successor == None else "b%s" % successor, kind))
+            if block.indirect:
+                lines.append('\tb%s -> indirect;' % block.number)
+        if any(block.indirect for block in self.blocks):
+            lines.append('\tindirect [shape=diamond];')
+            lines += ['\tindirect -> b%s [style=dotted];' % number for number in self.indirect_targets]
+        lines.append("}")
+        return "\n".join(lines) + "\n"
+
+def build_cfg(asm_lines, labels):
+    """Takes clean code (a list of `assembler.AsmLine` records or strings, see
+        `assembler.parse_labels`) and its labels dictionary and returns the
+        `ControlFlowGraph`."""
+    records, is_text = assembler.lex_if_text(asm_lines)
+    return ControlFlowGraph(records, labels)
+
+##############
+#
+# Unreachable code
+#
+##############
+
+def remove_unreachable(asm_lines, labels):
+    """Removes the blocks of clean code that can not be reached from the first
+        instruction. Returns a tuple of the new clean code (of the same kind as
+        `asm_lines`), the new labels dictionary and the number of instructions
+        removed.
+
+        Numeric branch offsets are computed again, and labels of removed blocks
+        name the next instruction that is kept. Blocks with an instruction that
+        does not assemble are kept, so the error is still reported."""
+    records, is_text = assembler.lex_if_text(asm_lines)
+    graph = ControlFlowGraph(records, labels)
+    reachable = graph.reachable()
+    for block in graph.blocks:
+        if block.number not in reachable and not assembles(records, labels, block):
+            reachable.add(block.number)
+    if len(reachable) == len(graph.blocks):
+        return (asm_lines, labels, 0)
+
+    #new index of every kept instruction, and of the first kept one at or after each index
+    new_index = [0] * (len(records) + 1)
+    kept = []
+    for block in graph.blocks:
+        if block.number in reachable:
+            for index in range(block.start, block.end):
+                new_index[index] = len(kept)
+                kept.append(index)
+        else:
+            new_index[block.start:block.end] = [None] * len(block)
+    new_index[len(records)] = len(kept)
+    for index in range(len(records) - 1, -1, -1):
+        if new_index[index] == None:
+            new_index[index] = new_index[index + 1]
+
+    new_records = []
+    for index in kept:
+        record = records[index]
+        if index in graph.targets and assembler.is_int(record.operands[-1]):
+            offset = 4 * (new_index[graph.targets[index]] - new_index[index])
+            record = assembler.AsmLine(record.label, record.command, record.operands[:-1] + (str(offset),), record.line_number)
+        new_records.append(record)
+
+    new_labels = {}
+    for label, address in labels.items():
+        index = (address - assembler.PC) // 4
+        if 0 <= index <= len(records) and address % 4 == 0:
+            address = assembler.index_to_address(new_index[index])
+        new_labels[label] = address
+
+    if is_text:
+        new_records = assembler.records_to_text(new_records)
+    return (new_records, new_labels, len(records) - len(kept))
+
+def assembles(records, labels, block):
+    """Returns True if every instruction of `block` assembles without errors."""
+    for index in range(block.start, block.end):
+        record = records[index]
+        try:
+            assembler.encode(record.command, record.operands, record.line_number, labels, index)
+        except Exception:
+            return False
+    return True
+
+##############
+#
+# Helpers
+#
+##############
+
+def is_control_transfer(record):
+    """Returns True if `record` is a branch, `jal` or `jalr`."""
+    return record.command in BRANCHES or record.command == "jal" or record.command == "jalr"
+
+def jump_target(record, labels, index, size):
+    """Returns the index of the instruction a branch or `jal` at `index` goes
+        to (`size` for the end of the program), or `None` if it is not known."""
+    if not ((record.command in BRANCHES and len(record.operands) == 3) or (record.command == "jal" and len(record.operands) == 2)):
+        return None
+    target = record.operands[-1]
+    if assembler.is_int(target):
+        offset = int(target)
+    elif assembler.is_register_name(target) or (labels and target not in labels):
+        return None
+    else:
+        offset = assembler.label_to_offset(labels, target, index)
+    if offset % 4:
+        return None
+    destination = index + offset // 4
+    return destination if 0 <= destination <= size else None
+
+def link_register(record):
+    """Returns the number of the register a `jal` or `jalr` writes, `None` if it is invalid."""
+    return register_number(record.operands[0]) if record.operands else None
+
+def register_number(name):
+    """Returns the number of the register `name`, `None` if it is not one."""
+    return assembler.register_name_to_num.get(name)
+
+def is_return(record):
+    """Returns True for `jalr x0, ra, 0` and `jalr x0, 0(ra)`."""
+    operands = record.operands
+    registers = assembler.register_name_to_num
+    if len(operands) == 3:
+        return registers.get(operands[0]) == 0 and registers.get(operands[1]) == 1 and operands[2] == "0"
+    if len(operands) == 2:
+        return registers.get(operands[0]) == 0 and operands[1].replace(" ", "") in ["0(ra)", "0(x1)"]
+    return False
+
+def dot_escape(text):
+    return text.replace("\\", "\\\\").replace('"', '\\"')
+
+##############
+#
+# Command line
+#
+##############
+
+def parse_args():
+    """Parses the arguments to the control flow graph tool and returns them
+        as a argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Writes the control flow graph of a 32-bit RISC-V program in\
+                                     the DOT language.")
+    parser.add_argument("asm", type=argparse.FileType('r'), help="An asm file, see assembler.py --help.")
+    parser.add_argument("--out", "-o", type=argparse.FileType('w'), help="The output file, the console by\
+                        default.")
+    parser.add_argument("--pseudos", "-p", type=argparse.FileType('r'), help="A file defining more\
+                        pseudoinstructions, see assembler.py --help.")
+    return parser.parse_args()
+
+def main(args):
+    machine_words, clean_code, labels = assembler.assemble_program(args.asm.readlines(), assembler.load_pseudos(args))
+    out = args.out or sys.stdout
+    out.write(build_cfg(clean_code, labels).to_dot())
+
+
+if __name__== "__main__":
+    main(parse_args())
@@ -0,0 +1,113 @@
+"""
+    Tests for the control flow graph of the CSSE232 Risc-V Assembler
+"""
+import assembler, control_flow, simulator
+import unittest
+
+PROGRAM = """main: addi t0, x0, 3
+             loop: addi t0, t0, -1
+             bne t0, x0, loop
+             jal ra, func
+             jal x0, end
+             dead: addi t1, t1, 1
+             addi t1, t1, 2
+             func: addi a0, x0, 7
+             jalr x0, ra, 0
+             more_dead: add t2, t2, t2
+             beq x0, x0, -4
+             end: addi t3, x0, 1""".split("\n")
+
+def clean(lines):
+    core = assembler.pseudoinstruction_pass(assembler.lex_pass(lines), assembler.ph.get_pseudoinstruction_defs())
+    return assembler.parse_labels(core)
+
+def successors(graph):
+    return [[successor for successor, kind in block.successors] for block in graph.blocks]
+
+class TestControlFlowGraph(unittest.TestCase):
+    def test_blocks(self):
+        graph = control_flow.build_cfg(*clean(PROGRAM))
+        self.assertEqual([(0, 1), (1, 3), (3, 4), (4, 5), (5, 7), (7, 9), (9, 11), (11, 12)],
+                         [(block.start, block.end) for block in graph.blocks])
+        self.assertEqual([["main"], ["loop"], [], [], ["dead"], ["func"], ["more_dead"], ["end"]],
+                         [block.labels for block in graph.blocks])
+        self.assertEqual([[1], [1, 2], [5, 3], [7], [5], [], [6], [None]], successors(graph))
+        self.assertEqual([(2, control_flow.CALL), (4, control_flow.FALLTHROUGH)], graph.blocks[5].predecessors)
+        self.assertEqual({0, 1, 2, 3, 5, 7}, graph.reachable())
+
+    def test_numeric_targets(self):
+        graph = control_flow.build_cfg(["beq t0, t1, 8", "addi t0, t0, 1", "jal x0, -8", "bne t0, t1, 4"], {})
+        self.assertEqual({0:2, 2:0, 3:4}, graph.targets)
+        self.assertEqual([[2, 1], [2], [0], [None]], successors(graph))
+
+        #offsets that do not land on an instruction are left to the machine code pass
+        graph = control_flow.build_cfg(["beq t0, t1, 6", "jal x0, 400"], {})
+        self.assertEqual({}, graph.targets)
+        self.assertEqual([[1], []], successors(graph))
+
+    def test_labels_without_dictionary(self):
+        #a label is the start of the program when no labels are defined, like in `assembler.label_to_offset`
+        graph = control_flow.build_cfg(["addi t0, t0, 1", "beq t0, t1, anything"], {})
+        self.assertEqual({1:0}, graph.targets)
+
+    def test_same_register_branches(self):
+        graph = control_flow.build_cfg(["beq x0, zero, 8", "bne t0, x5, 8", "bge t1, t1, 4", "blt t2, t2, -12"], {})
+        self.assertEqual([[2], [2], [3], [None]], successors(graph))
+
+    def test_indirect_jumps(self):
+        graph = control_flow.build_cfg(*clean(["jalr ra, 0(t0)", "jal x0, 12", "one: addi t0, x0, 1",
+                                               "two: jalr x0, 0(ra)"]))
+        self.assertEqual([[1], [None], [3], []], successors(graph))
+        self.assertEqual([True, False, False, False], [block.indirect for block in graph.blocks])
+        self.assertEqual([2, 3], graph.indirect_targets)
+        self.assertEqual({0, 1, 2, 3}, graph.reachable())
+        self.assertEqual({1}, graph.reachable(1))
+        self.assertIn("indirect -> b3 [style=dotted];", graph.to_dot())
+
+    def test_dot(self):
+        dot = control_flow.build_cfg(*clean(PROGRAM)).to_dot()
+        self.assertTrue(dot.startswith("digraph cfg {"))
+        self.assertIn('b2 -> b5 [label="call"];', dot)
+        self.assertIn('b7 -> exit [label="fallthrough"];', dot)
+        self.assertIn('b4 [label="dead:\\l0x00400014  addi t1, t1, 1\\l0x00400018  addi t1, t1, 2\\l", style=dashed];', dot)
+
+class TestRemoveUnreachable(unittest.TestCase):
+    def test_remove(self):
+        records, labels = clean(PROGRAM)
+        pruned, new_labels, removed = control_flow.remove_unreachable(records, labels)
+        self.assertEqual(4, removed)
+        self.assertEqual(["addi t0, x0, 3", "addi t0, t0, -1", "bne t0, x0, loop", "jal ra, func", "jal x0, end",
+                          "addi a0, x0, 7", "jalr x0, ra, 0", "addi t3, x0, 1"],
+                         ["%s %s" % (record.command, ", ".join(record.operands)) for record in pruned])
+        #labels of removed blocks name the next instruction that is kept
+        self.assertEqual({"main":0x400000, "loop":0x400004, "dead":0x400014, "func":0x400014, "more_dead":0x40001c,
+                          "end":0x40001c}, new_labels)
+
+    def test_numeric_offsets(self):
+        lines = ["beq x0, x0, 12", "addi t0, t0, 1", "addi t0, t0, 2", "addi t1, x0, 3", "bne t1, x0, -4"]
+        pruned, labels, removed = control_flow.remove_unreachable(lines, {})
+        self.assertEqual(["beq x0, x0, 4", "addi t1, x0, 3", "bne t1, x0, -4"], pruned)
+        self.assertEqual(2, removed)
+
+    def test_nothing_removed(self):
+        lines = ["beq t0, t1, 8", "addi t0, t0, 1", "addi t1, t1, 1"]
+        self.assertEqual((lines, {}, 0), control_flow.remove_unreachable(lines, {}))
+
+    def test_errors_not_hidden(self):
+        for line in ["addi t0, t0, 5000", "jal x0, nowhere"]:
+            lines = ["start: jal x0, end", line, "end: addi t0, x0, 1"]
+            self.assertRaises(Exception, assembler.assemble_program, lines, prune = True)
+
+    def test_same_results(self):
+        lines = PROGRAM + ["add t4, t3, a0"]
+        words = assembler.assemble_program(lines, prune = True)[0]
+        self.assertEqual(9, len(words))
+        results = []
+        for program in [assembler.assemble_program(lines)[0], words]:
+            machine = simulator.Simulator(program)
+            machine.run(max_steps = 1000)
+            results.append([machine.get_register(name) for name in ["t0", "t1", "t3", "t4", "a0"]])
+        self.assertEqual(results[0], results[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,251 @@
+"""
+
+ Data Segment
+
+ The data of a program assembled by the CSSE232 Assembler. It is loaded
+ at `DATA` (the default data segment address of RARS and MARS), apart
+ from the text segment at `assembler.PC`, so its addresses do not
+ depend on how many instructions the program has.
+
+ Values are packed into a single little-endian `bytearray` with `array`,
+ a whole run of values at a time.
+
+ `assemble_data` runs before the pseudoinstructions are expanded and
+ takes the `.data` sections out of the source:
+
+    .data                   (the following lines are data)
+    table: .word 1, -2, 3   (32-bit values, word aligned)
+    .half 7, 8              (16-bit values, half word aligned)
+    .byte 255, -1           (8-bit values)
+    buffer: .space 4096     (that many zero bytes)
+    .align 3                (up to the next multiple of 2**3 bytes)
+    .text                   (back to instructions)
+
+ Since the data segment does not move, the address of every data label
+ is known right away: `la rd, table`, `lw rd, table` and
+ `sw rs, table, rt` (`rt` holds the address) become core instructions
+ with the address as a constant.
+
+"""
+
+import sys
+from array import array
+import assembler
+import pseudoinstruction_handler as ph
+
+DATA = 0x10010000
+"""Address of the first byte of the data segment"""
+
+#typecode of an unsigned 32-bit array, 'I' is 4 bytes on every common platform
+WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+#typecodes of the unsigned arrays of each size in bytes
+TYPECODES = {1:"B", 2:"H", 4:WORD_TYPECODE}
+
+class DataSegment():
+    """
+    The bytes of a data segment loaded at `base`, in `buffer`.
+    """
+    def __init__(self, base = DATA):
+        self.base = base
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def address(self):
+        """Returns the address of the next byte added."""
+        return self.base + len(self.buffer)
+
+    def align(self, alignment):
+        """Adds zero bytes until the next address is a multiple of `alignment`."""
+        self.buffer.extend(bytes(-len(self.buffer) % alignment))
+
+    def add_values(self, values, size):
+        """Adds the `size` byte (1, 2 or 4) `values` (negative ones in two's
+            complement) at the next address aligned to `size`, and returns that
+            address. All of them are packed by a single `array`."""
+        self.align(size)
+        address = self.address()
+        if values and min(values) < 0:
+            mask = (1 << 8 * size) - 1
+            values = [value & mask for value in values]
+        packed = array(TYPECODES[size], values)
+        if size > 1 and sys.byteorder == "big":
+            packed.byteswap()
+        self.buffer.extend(packed.tobytes())
+        return address
+
+    def add_words(self, values):
+        """Adds the 32-bit `values` at the next word aligned address, and
+            returns that address."""
+        return self.add_values(values, 4)
+
+    def add_space(self, size):
+        """Adds `size` zero bytes, and returns the address of the first one."""
+        address = self.address()
+        self.buffer.extend(bytes(size))
+        return address
+
+    def words(self):
+        """Returns the data as a list of 32-bit words, the last one padded with zeros."""
+        words = array(WORD_TYPECODE)
+        words.frombytes(bytes(self.buffer) + bytes(-len(self.buffer) % 4))
+        if sys.byteorder == "big":
+            words.byteswap()
+        return words.tolist()
+
+##############
+#
+# Directives
+#
+##############
+
+SECTIONS = {".text":False, ".data":True}
+"""Dictionary mapping each section directive to whether it starts data"""
+
+VALUE_SIZES = {".word":4, ".half":2, ".byte":1}
+"""Dictionary mapping the directives listing values to the size of each value in bytes"""
+
+#the other directives of data sections
+DATA_DIRECTIVES = [".space", ".align"]
+
+#`.align` goes up to a page
+MAX_ALIGN = 12
+
+def assemble_data(records, data):
+    """Takes a list of `assembler.AsmLine` records before the pseudoinstructions
+        are expanded and a `DataSegment`. Adds the values of the `.data` sections
+        to `data` and returns a tuple of the records of the `.text` sections,
+        where the `la`, `lw` and `sw` of data labels are core instructions, and
+        the dictionary mapping each data label to its address.
+
+        The source starts in the `.text` section."""
+    text = []
+    labels = {}
+    text_labels = set()
+    pending = []
+    in_data = False
+
+    for record in records:
+        command = record.command
+        if command in SECTIONS:
+            in_data = SECTIONS[command]
+            if record.operands:
+                raise assembler.BadOperands("Found operands for %s on line %s with args:\n\t%s\n" % (command, record.line_number, record.instruction_text()))
+            if not record.label:
+                continue
+            #a label on the directive names the start of the new section
+            record = assembler.AsmLine(record.label, None, (), record.line_number)
+            command = None
+
+        if not in_data:
+            if command in VALUE_SIZES or command in DATA_DIRECTIVES:
+                raise assembler.BadInstruction("Found data directive %s in the text section on line %s" % (command, record.line_number))
+            if record.label:
+                text_labels.add(record.label)
+            text.append(record)
+            continue
+
+        if record.label:
+            if record.label in labels:
+                raise assembler.BadLabel("Duplicate label found on line %s: %s at line address" % (record.line_number, record.label), labels[record.label])
+            pending.append(record.label)
+        if command == None:
+            continue
+
+        if command in VALUE_SIZES:
+            values = parse_values(record, VALUE_SIZES[command])
+            data.align(VALUE_SIZES[command])
+            add_labels(labels, pending, data.address())
+            data.add_values(values, VALUE_SIZES[command])
+        elif command == ".space":
+            add_labels(labels, pending, data.add_space(parse_count(record, 0, 2**31)))
+        elif command == ".align":
+            data.align(1 << parse_count(record, 0, MAX_ALIGN))
+            add_labels(labels, pending, data.address())
+        elif command.startswith("."):
+            raise assembler.BadInstruction("Found unknown directive %s on line %s" % (command, record.line_number))
+        else:
+            raise assembler.BadInstruction("Found instruction %s in the data section on line %s" % (command, record.line_number))
+
+    add_labels(labels, pending, data.address())
+    for label in text_labels:
+        if label in labels:
+            raise assembler.BadLabel("Duplicate label found in the text and data sections: %s" % label, labels[label])
+
+    if not labels:
+        return (text, labels)
+    core = []
+    for record in text:
+        expanded = load_address(record, labels)
+        if expanded == None:
+            core.append(record)
+        else:
+            core.extend(expanded)
+    return (core, labels)
+
+def add_labels(labels, pending, address):
+    """Maps every label in `pending` to `address` in `labels`, and empties `pending`."""
+    for label in pending:
+        labels[label] = address
+    del pending[:]
+
+def parse_values(record, size):
+    """Returns the operands of a directive listing `size` byte values as a list
+        of ints, signed or unsigned."""
+    if not record.operands:
+        raise assembler.BadOperands("Found no values for %s on line %s" % (record.command, record.line_number))
+    try:
+        values = list(map(int, record.operands))
+    except ValueError:
+        raise assembler.BadImmediate("Found invalid value for %s on line %s with args:\n\t%s\n" % (record.command, record.line_number, record.instruction_text()))
+    bits = 8 * size
+    if min(values) < -(1 << (bits - 1)) or max(values) >= 1 << bits:
+        raise assembler.BadImmediate("Value out of range for %s on line %s with args:\n\t%s\n" % (record.command, record.line_number, record.instruction_text()))
+    return values
+
+def parse_count(record, low, high):
+    """Returns the single operand of a directive as an int from `low` to `high`."""
+    if len(record.operands) != 1:
+        raise assembler.BadOperands("Found invalid number of operands for %s on line %s with args:\n\t%s\n" % (record.command, record.line_number, record.instruction_text()))
+    count = assembler.parse_immediate(record.operands[0])
+    if not low <= count <= high:
+        raise assembler.BadImmediate("Value out of range for %s on line %s with args:\n\t%s\n" % (record.command, record.line_number, record.instruction_text()))
+    return count
+
+##############
+#
+# Data labels in the text
+#
+##############
+
+def load_address(record, labels):
+    """Returns the list of core instruction records replacing `record` if it is
+        a `la rd, label`, `lw rd, label` or `sw rs, label, rt` of a label in the
+        data `labels`, otherwise `None`. The first one keeps the label of `record`."""
+    operands = record.operands
+    if len(operands) < 2 or operands[1] not in labels:
+        return None
+    address = labels[operands[1]]
+    if record.command == "la" and len(operands) == 2:
+        steps = ph.materialize_constant(operands[0], address)
+    elif record.command in ["lw", "sw"] and len(operands) == (2 if record.command == "lw" else 3):
+        #lw uses its own destination to hold the address
+        base = operands[0] if record.command == "lw" else operands[2]
+        if assembler.register_name_to_num.get(base, 0) == 0:
+            raise assembler.BadRegister("Found invalid address register for %s on line %s with args:\n\t%s\n" % (record.command, record.line_number, record.instruction_text()))
+        upper, lower = split_address(address)
+        steps = [("lui", (base, str(upper))), (record.command, (operands[0], "%s(%s)" % (lower, base)))]
+    else:
+        return None
+    return [assembler.AsmLine(record.label if index == 0 else None, command, operands, record.line_number)
+            for index, (command, operands) in enumerate(steps)]
+
+def split_address(address):
+    """Returns a tuple of the upper 20 bits for `lui` and the signed 12-bit offset
+        that add up to `address`."""
+    lower = address & 0xfff
+    if lower >> 11:
+        lower -= 1 << 12
+    return (((address - lower) >> 12) & 0xfffff, lower)
@@ -0,0 +1,92 @@
+"""
+    Tests for the data segment and data directives of the CSSE232 Risc-V Assembler
+"""
+import assembler, data_segment, simulator
+import unittest
+
+DATA = data_segment.DATA
+
+def assembled(lines):
+    data = data_segment.DataSegment()
+    records, labels = data_segment.assemble_data(assembler.lex_pass(lines), data)
+    return ([record.instruction_text() for record in records if record.command], labels, data)
+
+class TestDataSegment(unittest.TestCase):
+    def test_packing(self):
+        data = data_segment.DataSegment()
+        self.assertEqual(DATA, data.add_values([1, 255, -1], 1))
+        self.assertEqual(DATA + 4, data.add_words([-2]))
+        self.assertEqual(DATA + 8, data.add_values([513, -1], 2))
+        self.assertEqual(DATA + 12, data.add_space(3))
+        self.assertEqual(bytes([1, 255, 255, 0, 254, 255, 255, 255, 1, 2, 255, 255, 0, 0, 0]), bytes(data.buffer))
+        self.assertEqual([0x00ffff01, 0xfffffffe, 0xffff0201, 0], data.words())
+
+class TestDirectives(unittest.TestCase):
+    def test_sections_and_labels(self):
+        lines = [".data", "table: .word 1, -2, 3", "flags: .byte 7", "halves:", ".half 300, -1", ".space 1",
+                 "aligned: .align 3", "end:", ".text", "main: addi a0, x0, 1", ".data", "more: .word 9"]
+        text, labels, data = assembled(lines)
+        self.assertEqual(["addi a0, x0, 1"], text)
+        self.assertEqual({"table":DATA, "flags":DATA + 12, "halves":DATA + 14, "aligned":DATA + 24, "end":DATA + 24,
+                          "more":DATA + 24}, labels)
+        self.assertEqual([1, 0xfffffffe, 3, 0x012c0007, 0x00ffff, 0, 9], data.words())
+
+    def test_text_is_the_default(self):
+        lines = ["addi a0, x0, 1", "loop: beq a0, x0, loop"]
+        text, labels, data = assembled(lines)
+        self.assertEqual(lines[:1] + ["beq a0, x0, loop"], text)
+        self.assertEqual(({}, 0), (labels, len(data)))
+
+    def test_data_labels_in_the_text(self):
+        lines = [".data", ".space 2052", "far: .word 1", ".text", "start: la t0, far", "lw a0, far", "sw a0, far, t1",
+                 "lw a1, 4(t0)", "beq a0, x0, start"]
+        text, labels, data = assembled(lines)
+        self.assertEqual(["lui t0, 65553", "addi t0, t0, -2044", "lui a0, 65553", "lw a0, -2044(a0)",
+                          "lui t1, 65553", "sw a0, -2044(t1)", "lw a1, 4(t0)", "beq a0, x0, start"], text)
+        records = data_segment.assemble_data(assembler.lex_pass(lines), data_segment.DataSegment())[0]
+        self.assertEqual("start", records[0].label)
+        self.assertEqual(5, records[0].line_number)
+
+    def test_bad_directives(self):
+        bad = [[".data", ".word"], [".data", ".word 1, x"], [".data", ".byte 256"], [".data", ".half -32769"],
+               [".data", ".word 4294967296"], [".data", ".space -1"], [".data", ".align 13"], [".data", ".ascii 1"],
+               [".data", "addi a0, x0, 1"], [".word 1"], [".data 5"], [".data", "a: .word 1", "a: .word 2"],
+               [".data", "a: .word 1", ".text", "a: addi a0, x0, 1"], [".data", "a: .word 1", ".text", "lw x0, a"]]
+        for lines in bad:
+            with self.assertRaises((assembler.BadOperands, assembler.BadImmediate, assembler.BadInstruction,
+                                    assembler.BadLabel, assembler.BadRegister), msg=lines):
+                assembled(lines)
+
+    def test_large_table(self):
+        values = list(range(-1000, 1000)) * 128
+        lines = [".data", "table: .word %s" % ", ".join(map(str, values)), "buffer: .space 1048576"]
+        text, labels, data = assembled(lines)
+        self.assertEqual(data.words()[:len(values)], [value & 0xffffffff for value in values])
+        self.assertEqual(4 * len(values) + 1048576, len(data))
+        self.assertEqual(DATA + 4 * len(values), labels["buffer"])
+
+    def test_assemble_program(self):
+        lines = [".data", "values: .word 5, 7", "sum: .space 4", ".text", "la t0, values", "lw t1, 0(t0)",
+                 "lw t2, 4(t0)", "add a0, t1, t2", "sw a0, sum, t3", "lw a1, sum"]
+        data = data_segment.DataSegment()
+        words, clean_code, labels = assembler.assemble_program(lines, data = data)
+        self.assertEqual(8, len(words))
+        self.assertEqual(DATA + 8, labels["sum"])
+
+        machine = simulator.Simulator(words, data = data)
+        machine.run()
+        self.assertEqual(12, machine.read_word(DATA + 8))
+        self.assertEqual(12, machine.get_register("a1"))
+
+        #the labels are there without a data segment, the values are not
+        self.assertEqual((words, labels), assembler.assemble_program(lines)[::2])
+
+    def test_constant_pool_goes_after_the_data(self):
+        lines = [".data", "value: .byte 1", ".text"] + ["li a0, 305419896"] * 4
+        data = data_segment.DataSegment()
+        words, clean_code, labels = assembler.assemble_program(lines, pool = True, data = data)
+        self.assertEqual([1, 0x12345678], data.words())
+        self.assertEqual(["lui gp, 65552", "lw a0, 4(gp)"], [record.instruction_text() for record in clean_code[:2]])
+
+if __name__ == '__main__':
+    unittest.main()
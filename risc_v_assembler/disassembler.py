@@ -0,0 +1,300 @@
+"""
+
+ Disassembler
+
+ Decodes 32-bit RISC-V machine words produced by the CSSE232 Assembler
+ back into assembly code that the assembler accepts again, so machine
+ code can be checked by a round trip through both.
+
+ Decoding is table driven: the lookup tables are derived once from
+ `assembler.instructions_to_fields` and `assembler.register_name_to_num`,
+ and each word is decoded with at most three dictionary lookups on its
+ opcode, func3 and func7 bits.
+
+ Usage:
+    python3 disassembler.py program.bin
+    python3 disassembler.py program.txt --text --labels
+
+"""
+
+import sys, argparse
+from array import array
+import assembler
+
+#typecode of an unsigned 32-bit array, 'I' is 4 bytes on every common platform
+WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+#masks of the bits that identify an instruction
+OPCODE_MASK = 0x7f
+FUNC3_MASK = 0x707f
+FUNC7_MASK = 0xfe00707f
+
+##############
+#
+# Decode tables
+#
+##############
+
+def register_names():
+    """Returns a list mapping each register number to the name the disassembler
+        uses for it: the ABI name, except x0."""
+    names = [None] * 32
+    for name, number in assembler.register_name_to_num.items():
+        if not name.startswith("x") and names[number] == None:
+            names[number] = name
+    names[0] = "x0"
+    return names
+
+REGISTER_NAMES = register_names()
+"""List mapping each register number to its name in disassembled code"""
+
+def sign_extend(value, bits):
+    """Interprets the lowest `bits` bits of `value` as a two's complement number."""
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+def format_R(command, word, address, labels):
+    return "%s %s, %s, %s" % (command, REGISTER_NAMES[(word >> 7) & 0x1f],
+                              REGISTER_NAMES[(word >> 15) & 0x1f], REGISTER_NAMES[(word >> 20) & 0x1f])
+
+def format_I(command, word, address, labels):
+    return "%s %s, %s, %s" % (command, REGISTER_NAMES[(word >> 7) & 0x1f],
+                              REGISTER_NAMES[(word >> 15) & 0x1f], sign_extend(word >> 20, 12))
+
+def format_I_shift(command, word, address, labels):
+    return "%s %s, %s, %s" % (command, REGISTER_NAMES[(word >> 7) & 0x1f],
+                              REGISTER_NAMES[(word >> 15) & 0x1f], (word >> 20) & 0x1f)
+
+def format_I_base_offset(command, word, address, labels):
+    return "%s %s, %s(%s)" % (command, REGISTER_NAMES[(word >> 7) & 0x1f],
+                              sign_extend(word >> 20, 12), REGISTER_NAMES[(word >> 15) & 0x1f])
+
+def format_S(command, word, address, labels):
+    immediate = ((word >> 25) << 5) | ((word >> 7) & 0x1f)
+    return "%s %s, %s(%s)" % (command, REGISTER_NAMES[(word >> 20) & 0x1f],
+                              sign_extend(immediate, 12), REGISTER_NAMES[(word >> 15) & 0x1f])
+
+def format_SB(command, word, address, labels):
+    return "%s %s, %s, %s" % (command, REGISTER_NAMES[(word >> 15) & 0x1f], REGISTER_NAMES[(word >> 20) & 0x1f],
+                              branch_target(SB_offset(word), address, labels))
+
+def format_U(command, word, address, labels):
+    return "%s %s, %s" % (command, REGISTER_NAMES[(word >> 7) & 0x1f], word >> 12)
+
+def format_UJ(command, word, address, labels):
+    return "%s %s, %s" % (command, REGISTER_NAMES[(word >> 7) & 0x1f],
+                          branch_target(UJ_offset(word), address, labels))
+
+def SB_offset(word):
+    """Returns the byte offset of a branch, gathered from imm[12|10:5] and imm[4:1|11]."""
+    return sign_extend(((word >> 31) << 12) | (((word >> 7) & 0x1) << 11)
+                       | (((word >> 25) & 0x3f) << 5) | (((word >> 8) & 0xf) << 1), 13)
+
+def UJ_offset(word):
+    """Returns the byte offset of a jump, gathered from imm[20|10:1|11|19:12]."""
+    return sign_extend(((word >> 31) << 20) | (((word >> 12) & 0xff) << 12)
+                       | (((word >> 20) & 0x1) << 11) | (((word >> 21) & 0x3ff) << 1), 21)
+
+def branch_target(offset, address, labels):
+    """Returns the label at `address + offset` if `labels` (a dictionary mapping
+        addresses to names) has one, otherwise the offset."""
+    if labels:
+        label = labels.get(address + offset)
+        if label != None:
+            return label
+    return offset
+
+def build_decode_tables():
+    """Returns three dictionaries mapping the identifying bits of a word (the
+        word and-ed with `FUNC7_MASK`, `FUNC3_MASK` or `OPCODE_MASK`) to a tuple of
+        the instruction name and the function formatting it. Instructions are
+        in the first table that has all the fields they use."""
+    func7_table = {}
+    func3_table = {}
+    opcode_table = {}
+    for command, fields in assembler.instructions_to_fields.items():
+        instruction_type = assembler.instructions_to_types[command]
+        base = fields.base
+        if instruction_type == assembler.Types.R:
+            func7_table[base] = (command, format_R)
+        elif assembler.is_shift_immediate_instance(command):
+            #the upper bits of the shift immediate select srai like a func7
+            func7_table[base | (0b0100000 << 25 if command == "srai" else 0)] = (command, format_I_shift)
+        elif command in ["lw", "jalr"]:
+            func3_table[base] = (command, format_I_base_offset)
+        elif instruction_type == assembler.Types.I:
+            func3_table[base] = (command, format_I)
+        elif instruction_type == assembler.Types.S:
+            func3_table[base] = (command, format_S)
+        elif instruction_type == assembler.Types.SB:
+            func3_table[base] = (command, format_SB)
+        elif instruction_type == assembler.Types.U:
+            opcode_table[base] = (command, format_U)
+        elif instruction_type == assembler.Types.UJ:
+            opcode_table[base] = (command, format_UJ)
+    return (func7_table, func3_table, opcode_table)
+
+FUNC7_TABLE, FUNC3_TABLE, OPCODE_TABLE = build_decode_tables()
+
+##############
+#
+# Decoding
+#
+##############
+
+def decode(word, address = None, labels = None):
+    """Takes a 32-bit machine word (as an int) and returns its assembly code.
+        `address` is where the word is (`assembler.PC` by default) and `labels` an
+        optional dictionary mapping addresses to label names, used for branch
+        and jump targets.
+
+        Raises `assembler.BadInstruction` if the word is not an instruction this
+        assembler supports."""
+    entry = FUNC7_TABLE.get(word & FUNC7_MASK) or FUNC3_TABLE.get(word & FUNC3_MASK) or OPCODE_TABLE.get(word & OPCODE_MASK)
+    if entry == None:
+        raise assembler.BadInstruction("Unknown instruction word at %s: 0x%08x" % (hex(assembler.PC if address == None else address), word))
+    command, formatter = entry
+    return formatter(command, word, assembler.PC if address == None else address, labels)
+
+def instruction_name(word):
+    """Returns the name of the instruction encoded in `word`, or `None` if it
+        is not an instruction this assembler supports."""
+    entry = FUNC7_TABLE.get(word & FUNC7_MASK) or FUNC3_TABLE.get(word & FUNC3_MASK) or OPCODE_TABLE.get(word & OPCODE_MASK)
+    return entry[0] if entry else None
+
+def to_words(data):
+    """Returns the words of `data` as an `array`. `data` can be bytes holding
+        little-endian words (as written by `object_formats.to_raw`), an array,
+        or any iterable of ints."""
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        if len(data) % 4:
+            raise ValueError("Machine code must be a multiple of 4 bytes long, got %s" % len(data))
+        words = array(WORD_TYPECODE)
+        words.frombytes(data)
+        if sys.byteorder == "big":
+            words.byteswap()
+        return words
+    if isinstance(data, array):
+        return data
+    return array(WORD_TYPECODE, data)
+
+def disassemble(data, base = None, labels = None):
+    """Decodes every word of `data` (see `to_words`) and returns a list of
+        strings of assembly code. The first word is at `base` (`assembler.PC` by
+        default). `labels` is an optional dictionary mapping label names to
+        addresses, like the one from `assembler.parse_labels`: branches and
+        jumps to those addresses use the names.
+
+        Raises `assembler.BadInstruction` on the first word that can not be decoded."""
+    if base == None:
+        base = assembler.PC
+    address_to_label = {v:k for (k,v) in labels.items()} if labels else None
+
+    func7_get = FUNC7_TABLE.get
+    func3_get = FUNC3_TABLE.get
+    opcode_get = OPCODE_TABLE.get
+    lines = []
+    address = base
+    for word in to_words(data):
+        entry = func7_get(word & FUNC7_MASK) or func3_get(word & FUNC3_MASK) or opcode_get(word & OPCODE_MASK)
+        if entry == None:
+            raise assembler.BadInstruction("Unknown instruction word at %s: 0x%08x" % (hex(address), word))
+        lines.append(entry[1](entry[0], word, address, address_to_label))
+        address += 4
+    return lines
+
+def find_branch_labels(data, base = None):
+    """Returns a labels dictionary (label name to address) with a made up
+        label for every address inside `data` that a branch or jump goes to."""
+    if base == None:
+        base = assembler.PC
+    words = to_words(data)
+    end = base + 4 * len(words)
+
+    targets = set()
+    for index, word in enumerate(words):
+        entry = FUNC3_TABLE.get(word & FUNC3_MASK) or OPCODE_TABLE.get(word & OPCODE_MASK)
+        if entry == None:
+            continue
+        if entry[1] == format_SB:
+            address = base + 4 * index + SB_offset(word)
+        elif entry[1] == format_UJ:
+            address = base + 4 * index + UJ_offset(word)
+        else:
+            continue
+        if base <= address < end:
+            targets.add(address)
+    return {"L%s" % hex(address)[2:]:address for address in sorted(targets)}
+
+def round_trip(data, base = None):
+    """Disassembles `data` and assembles the result again. Returns the list of
+        `(index, word, assembly, new_word)` tuples for every word that did not
+        come back the same (an empty list if the round trip is exact)."""
+    words = to_words(data)
+    mismatches = []
+    for index, (word, line) in enumerate(zip(words, disassemble(words, base))):
+        new_word = assembler.encode_instruction(line, index)
+        if new_word != word:
+            mismatches.append((index, word, line, new_word))
+    return mismatches
+
+##############
+#
+# Command line
+#
+##############
+
+def read_text_words(lines):
+    """Reads the machine words from the text output of the assembler (or any
+        file with one binary or hex word at the start of each line)."""
+    words = []
+    for line in lines:
+        code = line.split("//")[0].split(";")[0].replace(" ", "").strip()
+        if not code:
+            continue
+        words.append(int(code, 2) if len(code) == 32 else int(code, 16))
+    return words
+
+def print_listing(words, labels = None, base = None, out = None):
+    """Writes the disassembly of `words` with each address and word in a
+        comment. The listing can be assembled again as it is."""
+    if base == None:
+        base = assembler.PC
+    out = out or sys.stdout
+    address_to_label = {v:k for (k,v) in labels.items()} if labels else {}
+    for index, line in enumerate(disassemble(words, base, labels)):
+        address = base + 4 * index
+        label = address_to_label.get(address)
+        label = "\t" if label == None else label + ":\t"
+        out.write("%s%-28s ; %s %08x\n" % (label, line, hex(address), words[index]))
+
+def parse_args():
+    """Parses the arguments to the disassembler and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Disassembles 32-bit RISC-V machine code.")
+    parser.add_argument("input", type=argparse.FileType('rb'), help="A raw little-endian image, as written by\
+                        assembler.py --format raw.")
+    parser.add_argument("--text", "-t", action="store_true", help="The input is text with one binary or hex word\
+                        at the start of each line, like the output of assembler.py.")
+    parser.add_argument("--labels", "-l", action="store_true", help="Make up labels for branch and jump targets.")
+    parser.add_argument("--check", action="store_true", help="Assemble the disassembly again and report every\
+                        word that does not come back the same.")
+    return parser.parse_args()
+
+def main(args):
+    data = args.input.read()
+    words = to_words(read_text_words(data.decode().splitlines()) if args.text else data)
+
+    if(args.check):
+        mismatches = round_trip(words)
+        for index, word, line, new_word in mismatches:
+            print("0x%08x -> %s -> 0x%08x at %s" % (word, line, new_word, hex(assembler.index_to_address(index))))
+        print("%s words, %s mismatches" % (len(words), len(mismatches)))
+        if mismatches:
+            sys.exit(1)
+        return
+
+    print_listing(words, find_branch_labels(words) if args.labels else None)
+
+
+if __name__== "__main__":
+    main(parse_args())
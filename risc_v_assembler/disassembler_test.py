@@ -0,0 +1,87 @@
+"""
+    Tests for the disassembler of the CSSE232 Risc-V Assembler
+"""
+import assembler, disassembler, object_formats
+import io, random, unittest
+from array import array
+
+program = """start: addi t0, x0, -5
+            add t1, t2, s11
+            sub a0, a1, a2
+            srai t0, t1, 31
+            slli t0, t1, 1
+            lw s0, -8(sp)
+            sw ra, 2047(sp)
+            jalr ra, 0(a0)
+            lui t3, 1048575
+            loop: bne t0, x0, done
+            blt t0, t1, loop
+            jal ra, start
+            done: sra t1, t1, t0""".split("\n")
+
+class TestDisassembler(unittest.TestCase):
+    def test_decode(self):
+        self.assertEqual("addi t0, x0, -5", disassembler.decode(assembler.encode_instruction("addi t0, zero, -5")))
+        self.assertEqual("sw ra, -4(sp)", disassembler.decode(assembler.encode_instruction("sw x1, -4(x2)")))
+        self.assertEqual("srai s11, t1, 3", disassembler.decode(assembler.encode_instruction("srai x27, t1, 3")))
+        self.assertEqual("beq t0, t1, -8", disassembler.decode(assembler.encode_instruction("beq t0, t1, -8")))
+        self.assertEqual("jal ra, 2048", disassembler.decode(assembler.encode_instruction("jal ra, 2048")))
+
+    def test_unknown_words(self):
+        for word in [0, 0xffffffff, assembler.encode_instruction("add t0, t0, t0") | (1 << 31)]:
+            with self.assertRaises(assembler.BadInstruction):
+                disassembler.decode(word)
+
+    def test_program_round_trip(self):
+        words, code, labels = assembler.assemble_program(program)
+        lines = disassembler.disassemble(words)
+        self.assertEqual("bne t0, x0, 12", lines[9])
+        self.assertEqual(words, assembler.assemble_program(lines)[0])
+        self.assertEqual([], disassembler.round_trip(words))
+
+    def test_labels(self):
+        words, code, labels = assembler.assemble_program(program)
+        lines = disassembler.disassemble(words, labels=labels)
+        self.assertEqual(["bne t0, x0, done", "blt t0, t1, loop", "jal ra, start"], lines[9:12])
+        self.assertEqual(sorted(labels.values()), sorted(disassembler.find_branch_labels(words).values()))
+
+    def test_buffers(self):
+        words = assembler.assemble_program(program)[0]
+        expected = disassembler.disassemble(words)
+        self.assertEqual(expected, disassembler.disassemble(object_formats.to_raw(words)))
+        self.assertEqual(expected, disassembler.disassemble(array("I", words)))
+        with self.assertRaises(ValueError):
+            disassembler.disassemble(b"\x13\x00")
+
+    def test_random_words_round_trip(self):
+        #every word that decodes must assemble back to itself
+        generator = random.Random(232)
+        words = [generator.getrandbits(32) for i in range(20000)]
+        #make sure every opcode shows up
+        for fields in assembler.instructions_to_fields.values():
+            words.extend((generator.getrandbits(32) & ~disassembler.FUNC7_MASK) | fields.base for i in range(50))
+        decoded = 0
+        for word in words:
+            try:
+                line = disassembler.decode(word)
+            except assembler.BadInstruction:
+                continue
+            decoded += 1
+            self.assertEqual(word, assembler.encode_instruction(line), line)
+        self.assertGreater(decoded, 1000)
+
+    def test_listing(self):
+        words = assembler.assemble_program(program)[0]
+        out = io.StringIO()
+        disassembler.print_listing(words, disassembler.find_branch_labels(words), out=out)
+        self.assertEqual(words, assembler.assemble_program(out.getvalue().split("\n"))[0])
+
+    def test_read_text_words(self):
+        words, code, labels = assembler.assemble_program(program)
+        for mode in [None, "bin", "hex"]:
+            out = io.StringIO()
+            assembler.output(words, [c.instruction_text() for c in code], labels, mode=mode, out=out)
+            self.assertEqual(words, disassembler.read_text_words(out.getvalue().split("\n")))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,434 @@
+"""
+
+ Incremental Assembler
+
+ Keeps an assembled program of the CSSE232 Assembler in memory (the
+ tokenized lines, the labels and the machine words) so that after an edit
+ only the changed lines are assembled again, along with the branches and
+ jumps (SB and UJ types) whose label offsets actually moved. `watch` uses
+ this to keep an output file up to date while the source is edited,
+ rewriting only the part of the output that changed.
+
+"""
+
+import os, sys, time
+import assembler
+import pseudoinstruction_handler as ph
+
+class Change():
+    """
+    What an update changed: the `removed` instructions starting at index
+    `first` were replaced by `added` new ones, and the instructions listed
+    in `patched` (indices after the update) were encoded again because
+    their label offsets moved. `labels_changed` is True if any label was
+    added, removed or moved.
+    """
+    __slots__ = ("first", "removed", "added", "patched", "labels_changed")
+
+    def __init__(self, first, removed, added, patched, labels_changed):
+        self.first = first
+        self.removed = removed
+        self.added = added
+        self.patched = patched
+        self.labels_changed = labels_changed
+
+    def shifted(self):
+        """Returns True if the instructions after the edit moved."""
+        return self.added != self.removed
+
+class IncrementalAssembler():
+    """
+    An assembled program that can be updated in place. `code` holds the
+    `assembler.AsmLine` record of each instruction, `words` its machine
+    code and `labels` the usual labels dictionary.
+
+    Edits tend to follow each other in the same place, so the program keeps
+    a gap before source line `gap_line` (instruction `gap_index`). The line
+    numbers, label addresses and branch indices after the gap are stored
+    counting back from the end of the program, where an edit at the gap does
+    not move them, and only what lies between the old and new place of the
+    gap is converted when it moves. Use `line_number` for the source line of
+    an instruction.
+    """
+    def __init__(self, pseudos = None):
+        if pseudos == None:
+            pseudos = ph.get_pseudoinstruction_defs()
+        self.pseudos = pseudos
+        #one entry per source line
+        self.lines = []
+        self.blocks = []
+        self.line_labels = []
+        #one entry per instruction
+        self.code = []
+        self.words = []
+        #labels before the gap map to their address, the ones after it to
+        #their distance in bytes from the end of the program
+        self.labels_before = {}
+        self.labels_after = {}
+        self.labels_cache = {}
+        #sorted indices of the branches and jumps that use a label before the
+        #gap, and the distances from the end of those after it, nearest the gap last
+        self.branches = []
+        self.branches_after = []
+        self.gap_line = 0
+        self.gap_index = 0
+
+    @property
+    def labels(self):
+        """The labels dictionary, built again only after the labels changed."""
+        if self.labels_cache == None:
+            end = assembler.index_to_address(len(self.code))
+            self.labels_cache = dict(self.labels_before)
+            for label, distance in self.labels_after.items():
+                self.labels_cache[label] = end - distance
+        return self.labels_cache
+
+    def line_number(self, index):
+        """Returns the source line number of the instruction at `index`."""
+        if index < self.gap_index:
+            return self.code[index].line_number
+        return len(self.lines) - self.code[index].line_number
+
+    def update(self, new_lines):
+        """Takes the new contents of the source as a list of lines and assembles
+            whatever changed since the last update. Returns a `Change`.
+
+            Raises the usual assembler exceptions if the new source is invalid,
+            in which case nothing is updated."""
+        first = common_prefix_length(self.lines, new_lines)
+        last = len(self.lines) - common_suffix_length(self.lines, new_lines, first)
+        return self.edit(first, last, new_lines[first:len(new_lines) - (len(self.lines) - last)])
+
+    def edit(self, first, last, replacement):
+        """Replaces source lines `first` up to (not including) `last` with the
+            list of lines `replacement`. Use this directly when the edited range
+            is already known, it skips comparing the old and new source.
+            Returns a `Change`."""
+
+        line_delta = len(replacement) - (last - first)
+
+        #tokenize and expand only the new lines
+        new_blocks = []
+        new_line_labels = []
+        for offset, text in enumerate(replacement):
+            record = assembler.tokenize_line(text, first + offset + 1)
+            if record != None and assembler.has_directives([record]):
+                raise assembler.BadInstruction("Found directive %s on line %s, watching only assembles instructions "
+                                               "(assemble the file without --watch for .data sections)" % (record.command, first + offset + 1))
+            label = None
+            block = []
+            if record != None:
+                label = record.label
+                if record.command:
+                    block = [r for r in assembler.pseudoinstruction_pass([record], self.pseudos) if r.command]
+            new_blocks.append(block)
+            new_line_labels.append(label)
+
+        #the edited lines are right after the gap
+        self.move_gap(first)
+        size = len(self.code)
+        start = self.gap_index
+        removed = sum(map(len, self.blocks[first:last]))
+        added = sum(map(len, new_blocks))
+        delta = added - removed
+        end = assembler.index_to_address(size)
+
+        old_window_labels = {}
+        for line in range(first, last):
+            label = self.line_labels[line]
+            if label:
+                old_window_labels[label] = end - self.labels_after[label]
+
+        new_window_labels = {}
+        new_window_lines = {}
+        index = start
+        for offset, (label, block) in enumerate(zip(new_line_labels, new_blocks)):
+            if label:
+                if label in new_window_labels:
+                    raise assembler.BadLabel("Duplicate label found on line %s: %s at line address" % (first + offset + 1, label), new_window_labels[label])
+                new_window_labels[label] = assembler.index_to_address(index)
+                new_window_lines[label] = first + offset
+            index += len(block)
+
+        outside = LabelView(self.labels_before, self.labels_after, size + delta, removed = old_window_labels)
+        for label in new_window_labels:
+            if label in outside:
+                raise assembler.BadLabel("Duplicate label found on line %s: %s at line address" % (new_window_lines[label] + 1, label), outside[label])
+        old_labels = LabelView(self.labels_before, self.labels_after, size)
+        labels = LabelView(self.labels_before, self.labels_after, size + delta, new_window_labels, old_window_labels)
+        labels_changed = old_window_labels != new_window_labels or (delta != 0 and len(old_labels) > len(old_window_labels))
+
+        #encode the new instructions
+        new_code = [record for block in new_blocks for record in block]
+        new_words = []
+        new_branches = []
+        for offset, record in enumerate(new_code):
+            new_words.append(assembler.encode(record.command, record.operands, record.line_number, labels, start + offset))
+            if label_reference(record):
+                new_branches.append(start + offset)
+
+        #encode again the branches outside the edit whose offsets moved
+        patches = {}
+        window_end = start + removed
+        #when the instructions after the edit move, so do the branches between
+        #them and the labels up to the edit
+        if labels_changed or delta != 0:
+            #without any labels a branch goes to PC, like `assembler.label_to_offset`
+            had_labels = len(old_labels) != 0
+            has_labels = len(labels) != 0
+            after = [size - distance for distance in self.branches_after if size - distance >= window_end]
+            for index in self.branches + after:
+                new_index = index if index < start else index + delta
+                target = label_reference(self.code[index])
+                if has_labels and target not in labels:
+                    raise assembler.BadLabel("Label not found on line %s: %s" % (self.line_number(index) + (line_delta if index >= window_end else 0), target))
+                old_address = old_labels[target] if had_labels else assembler.PC
+                new_address = labels[target] if has_labels else assembler.PC
+                if old_address - assembler.index_to_address(index) != new_address - assembler.index_to_address(new_index):
+                    patches[new_index] = index
+
+            for new_index, index in patches.items():
+                record = self.code[index]
+                line_number = self.line_number(index) + (line_delta if index >= window_end else 0)
+                patches[new_index] = assembler.encode(record.command, record.operands, line_number, labels, new_index)
+
+        #everything is valid, commit the update. What follows the edit keeps
+        #its distances from the end, the new lines go before the gap
+        self.lines[first:last] = replacement
+        self.blocks[first:last] = new_blocks
+        self.line_labels[first:last] = new_line_labels
+        self.code[start:window_end] = new_code
+        self.words[start:window_end] = new_words
+        for index, word in patches.items():
+            self.words[index] = word
+
+        for label in old_window_labels:
+            del self.labels_after[label]
+        self.labels_before.update(new_window_labels)
+        if labels_changed:
+            self.labels_cache = None
+
+        while self.branches_after and size - self.branches_after[-1] < window_end:
+            self.branches_after.pop()
+        self.branches.extend(new_branches)
+        self.gap_line = first + len(replacement)
+        self.gap_index = start + added
+
+        return Change(start, removed, added, sorted(patches), labels_changed)
+
+    def move_gap(self, line):
+        """Moves the gap to just before source line `line`, converting the line
+            numbers, labels and branches between its old and new place."""
+        size = len(self.code)
+        end = assembler.index_to_address(size)
+        if line >= self.gap_line:
+            index = self.gap_index + sum(map(len, self.blocks[self.gap_line:line]))
+            for label in self.line_labels[self.gap_line:line]:
+                if label:
+                    self.labels_before[label] = end - self.labels_after.pop(label)
+            while self.branches_after and size - self.branches_after[-1] < index:
+                self.branches.append(size - self.branches_after.pop())
+            moved = self.code[self.gap_index:index]
+        else:
+            index = self.gap_index - sum(map(len, self.blocks[line:self.gap_line]))
+            for label in self.line_labels[line:self.gap_line]:
+                if label:
+                    self.labels_after[label] = end - self.labels_before.pop(label)
+            while self.branches and self.branches[-1] >= index:
+                self.branches_after.append(size - self.branches.pop())
+            moved = self.code[index:self.gap_index]
+
+        #line numbers on either side count from opposite ends
+        for record in moved:
+            record.line_number = len(self.lines) - record.line_number
+        self.gap_line = line
+        self.gap_index = index
+
+class LabelView():
+    """
+    The labels of an `IncrementalAssembler` as `assembler.encode` sees them,
+    which only counts and looks up labels: the labels `before` and `after`
+    the gap of a program of `size` instructions, with the labels `added` by
+    an edit at the gap in place of the `removed` ones.
+    """
+    def __init__(self, before, after, size, added = {}, removed = {}):
+        self.before = before
+        self.after = after
+        self.end = assembler.index_to_address(size)
+        self.added = added
+        self.removed = removed
+
+    def __len__(self):
+        return len(self.before) + len(self.after) + len(self.added) - len(self.removed)
+
+    def __contains__(self, label):
+        return label in self.added or label in self.before or (label in self.after and label not in self.removed)
+
+    def __getitem__(self, label):
+        if label in self.added:
+            return self.added[label]
+        if label in self.before:
+            return self.before[label]
+        if label in self.removed:
+            raise KeyError(label)
+        return self.end - self.after[label]
+
+def label_reference(record):
+    """Returns the label used by a branch or jump record, or `None`."""
+    instruction_type = assembler.instructions_to_types.get(record.command)
+    if instruction_type != assembler.Types.SB and instruction_type != assembler.Types.UJ:
+        return None
+    target = record.operands[-1] if record.operands else None
+    if target == None or assembler.is_int(target) or assembler.is_register_name(target):
+        return None
+    return target
+
+def common_prefix_length(a, b):
+    """Returns the number of equal items at the start of the lists `a` and `b`.
+        Compares slices of 1024 items at a time so most of the work happens in C."""
+    size = min(len(a), len(b))
+    i = 0
+    while i + 1024 <= size and a[i:i + 1024] == b[i:i + 1024]:
+        i += 1024
+    while i < size and a[i] == b[i]:
+        i += 1
+    return i
+
+def common_suffix_length(a, b, limit):
+    """Returns the number of equal items at the end of `a` and `b`, without
+        going into the first `limit` items of either list."""
+    size = min(len(a), len(b)) - limit
+    i = 0
+    while i + 1024 <= size and a[len(a) - i - 1024:len(a) - i] == b[len(b) - i - 1024:len(b) - i]:
+        i += 1024
+    while i < size and a[len(a) - i - 1] == b[len(b) - i - 1]:
+        i += 1
+    return i
+
+##############
+#
+# Output
+#
+##############
+
+class OutputFile():
+    """
+    An output file kept in step with an `IncrementalAssembler`. Text output
+    (`format` None, using `mode` like `assembler.output`) and raw images
+    are updated in place: only the changed lines are rewritten, unless an
+    edit moved the instructions after it, in which case the file is
+    rewritten from the edit onwards. Intel HEX and ELF are rewritten whole.
+    """
+    def __init__(self, path, mode = "bin", format = None):
+        self.path = path
+        self.mode = mode
+        self.format = format
+        #byte offset of each instruction in the file, plus the end of the file
+        self.offsets = [0]
+        self.address_to_label = {}
+
+    def chunk(self, program, index):
+        """Returns the bytes written for the instruction at `index`."""
+        word = program.words[index]
+        if self.format == "raw":
+            return word.to_bytes(4, "little")
+        address = assembler.index_to_address(index)
+        line = assembler.output_line(word, address, self.address_to_label.get(address),
+                                     program.code[index].instruction_text(), self.mode)
+        return (line + "\n").encode()
+
+    def write_all(self, program):
+        """Writes the whole program."""
+        self.address_to_label = {v:k for (k,v) in program.labels.items()}
+        if self.format in ["ihex", "elf"]:
+            import object_formats
+            with open(self.path, "w" if self.format == "ihex" else "wb") as out:
+                object_formats.write_object(program.words, program.labels, self.format, out)
+            return
+
+        with open(self.path, "wb") as out:
+            self.offsets = [0]
+            self.write_from(out, program, 0)
+
+    def apply(self, program, change):
+        """Rewrites the parts of the file affected by `change`."""
+        if self.format in ["ihex", "elf"]:
+            self.write_all(program)
+            return
+        if change.labels_changed:
+            self.address_to_label = {v:k for (k,v) in program.labels.items()}
+
+        with open(self.path, "r+b") as out:
+            if change.shifted():
+                #everything from the edit onwards is rewritten anyway
+                indices = [index for index in change.patched if index < change.first]
+            else:
+                indices = change.patched + list(range(change.first, change.first + change.added))
+                #a label at the end of the edit belongs to the next instruction
+                if change.labels_changed and change.first + change.added < len(program.words):
+                    indices.append(change.first + change.added)
+
+            for index in sorted(set(indices)):
+                data = self.chunk(program, index)
+                if len(data) != self.offsets[index + 1] - self.offsets[index]:
+                    self.write_from(out, program, index)
+                    return
+                out.seek(self.offsets[index])
+                out.write(data)
+
+            if change.shifted():
+                self.write_from(out, program, change.first)
+
+    def write_from(self, out, program, first):
+        """Rewrites the file from instruction `first` to the end."""
+        del self.offsets[first + 1:]
+        position = self.offsets[first]
+        chunks = []
+        for index in range(first, len(program.words)):
+            data = self.chunk(program, index)
+            chunks.append(data)
+            position += len(data)
+            self.offsets.append(position)
+        out.seek(self.offsets[first])
+        out.write(b"".join(chunks))
+        out.truncate()
+
+def watch(path, output_path, mode = "bin", format = None, interval = 0.25, pseudos = None):
+    """Assembles the file at `path` into `output_path`, then keeps watching the
+        source and updates the output whenever it changes, until interrupted.
+        Errors in the source are reported and the last good output is kept."""
+    program = IncrementalAssembler(pseudos)
+    output = OutputFile(output_path, mode, format)
+    modified = None
+    written = False
+
+    try:
+        while True:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                time.sleep(interval)
+                continue
+
+            if stat.st_mtime_ns != modified:
+                modified = stat.st_mtime_ns
+                with open(path) as asm:
+                    lines = asm.read().split("\n")
+
+                started = time.perf_counter()
+                try:
+                    change = program.update(lines)
+                except Exception as error:
+                    sys.stderr.write("%s: %s\n" % (type(error).__name__, str(error).strip()))
+                else:
+                    if written:
+                        output.apply(program, change)
+                    else:
+                        output.write_all(program)
+                        written = True
+                    sys.stderr.write("Updated %s instructions (%s patched) in %.1f ms\n" % (
+                        change.added, len(change.patched), (time.perf_counter() - started) * 1000))
+
+            time.sleep(interval)
+    except KeyboardInterrupt:
+        pass
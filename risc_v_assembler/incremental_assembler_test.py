@@ -0,0 +1,168 @@
+"""
+    Tests for the incremental (watch) mode of the CSSE232 Risc-V Assembler
+"""
+import assembler, incremental_assembler, object_formats
+import io, os, re, tempfile, unittest
+
+program = """start: addi t0, x0, 5
+            beq t0, x0, done     ; forward reference
+            jal ra, far
+            loop: addi t0, t0, -1
+            push t0
+            bne t0, x0, loop
+            jalif t0, x0, start
+            far:
+            add t1, t1, t1
+            done: sub t1, t1, t0""".split("\n")
+
+def text_output(words, code, labels, mode):
+    out = io.StringIO()
+    assembler.output(words, [c.instruction_text() for c in code], labels, mode=mode, out=out)
+    return out.getvalue()
+
+class TestIncrementalAssembler(unittest.TestCase):
+    def assertMatchesFullAssembly(self, incremental, lines):
+        words, code, labels = assembler.assemble_program(lines)
+        self.assertEqual(words, incremental.words)
+        self.assertEqual(labels, incremental.labels)
+        self.assertEqual([c.line_number for c in code], [incremental.line_number(i) for i in range(len(incremental.code))])
+
+    def test_first_update_assembles_everything(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        change = incremental.update(program)
+        self.assertEqual((0, 0, 11), (change.first, change.removed, change.added))
+        self.assertMatchesFullAssembly(incremental, program)
+
+    def test_edit_in_place(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        lines = list(program)
+        lines[3] = "loop: addi t0, t0, -2"
+        change = incremental.update(lines)
+        self.assertEqual((3, 1, 1), (change.first, change.removed, change.added))
+        self.assertEqual([], change.patched)
+        self.assertFalse(change.shifted())
+        self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_insert_patches_branches_across_the_edit(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        lines = list(program)
+        lines[4:4] = ["add t2, t2, t2", "addi t2, t2, 1"]
+        change = incremental.update(lines)
+        self.assertEqual((4, 0, 2), (change.first, change.removed, change.added))
+        self.assertTrue(change.shifted())
+        #every branch crosses the insertion, the jump of jalif is at index 10
+        self.assertEqual([1, 2, 8, 10], change.patched)
+        self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_delete_lines(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        lines = program[:4] + program[6:]
+        incremental.update(lines)
+        self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_move_label(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        lines = list(program)
+        lines[3] = "addi t0, t0, -1"
+        lines[4] = "loop: push t0"
+        change = incremental.update(lines)
+        self.assertTrue(change.labels_changed)
+        self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_errors_leave_the_program_unchanged(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        for bad in [program[:9] + ["start: sub t1, t1, t0"],
+                    program[:3] + program[4:],
+                    program[:2] + ["add t0, t0, nope"] + program[3:]]:
+            with self.assertRaises((assembler.BadLabel, assembler.BadRegister)):
+                incremental.update(bad)
+            self.assertEqual(program, incremental.lines)
+            self.assertMatchesFullAssembly(incremental, program)
+
+    def test_directives_refused(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        incremental.update(program)
+        with self.assertRaisesRegex(assembler.BadInstruction, "directive .word on line 2.*--watch"):
+            incremental.update(program[:1] + ["table: .word 1"] + program[1:])
+        self.assertEqual(program, incremental.lines)
+
+    def test_many_edits(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        lines = list(program)
+        incremental.update(lines)
+        edits = [(0, 0, ["add x0, x0, x0"] * 2), (6, 7, ["mid: add t2, t2, t2"]), (12, 12, ["beq t0, x0, mid"]),
+                 (0, 2, []), (1, 1, ["jal ra, done"] * 3), (8, 10, ["push t1", "addi t1, t1, 1"])]
+        for first, last, replacement in edits:
+            lines[first:last] = replacement
+            incremental.update(lines)
+            self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_shrinking_under_a_label(self):
+        #the label stays put, the jump after the edit still has to follow it
+        incremental = incremental_assembler.IncrementalAssembler()
+        lines = ["c: addi t0, t0, 1", "add t1, t1, t0", "jal ra, c"]
+        incremental.update(lines)
+        lines[0] = "c:"
+        change = incremental.update(lines)
+        self.assertEqual([1], change.patched)
+        self.assertMatchesFullAssembly(incremental, lines)
+
+    def test_edits_moving_back_and_forth(self):
+        incremental = incremental_assembler.IncrementalAssembler()
+        #20 copies of the program with their own labels
+        lines = [re.sub(r"\b(start|loop|far|done)\b", r"\g<1>%s" % (i // len(program)), line)
+                 for i, line in enumerate(program * 20)]
+        incremental.update(lines)
+        for first in [154, 1, 198, 84, 81, 4, 128]:
+            lines[first:first + 1] = ["add t2, t2, t2", "; note"]
+            incremental.update(lines)
+            self.assertMatchesFullAssembly(incremental, lines)
+            lines[first + 1:first + 2] = []
+            incremental.update(lines)
+            self.assertMatchesFullAssembly(incremental, lines)
+
+class TestOutputFile(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def check_edits(self, mode, format):
+        path = os.path.join(self.directory.name, "out")
+        incremental = incremental_assembler.IncrementalAssembler()
+        output = incremental_assembler.OutputFile(path, mode, format)
+        lines = list(program)
+        output.write_all(incremental)
+        incremental.update(lines)
+        output.write_all(incremental)
+
+        edits = [(3, 4, ["loop: addi t0, t0, -2"]), (4, 4, ["add t2, t2, t2", "addi t2, t2, 1"]),
+                 (0, 1, ["start: addi t0, x0, 6"]), (6, 8, []), (6, 6, ["mid:"])]
+        for first, last, replacement in edits:
+            lines[first:last] = replacement
+            change = incremental.update(lines)
+            output.apply(incremental, change)
+
+            words, code, labels = assembler.assemble_program(lines)
+            if format == "raw":
+                with open(path, "rb") as f:
+                    self.assertEqual(object_formats.to_raw(words), f.read())
+            else:
+                with open(path) as f:
+                    self.assertEqual(text_output(words, code, labels, mode), f.read())
+
+    def test_text_output(self):
+        for mode in [None, "bin", "hex"]:
+            self.check_edits(mode, None)
+
+    def test_raw_output(self):
+        self.check_edits("bin", "raw")
+
+if __name__ == "__main__":
+    unittest.main()
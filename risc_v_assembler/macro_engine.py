@@ -0,0 +1,236 @@
+"""
+
+ Macro Engine
+
+ Reads the pseudoinstruction definition file of the CSSE232 Assembler
+ (`--pseudos`) and compiles every definition into a template, so that
+ expanding a call is a single tuple substitution instead of splitting
+ and checking strings again for every line.
+
+ A definition is a header with the name and parameters of the
+ pseudoinstruction and a trailing `=`, followed by the core instructions
+ it stands for, using the parameter names as operands:
+
+    double r1, r2 =
+        add r1, r2, r2
+
+    store r1, offset, r2 =
+        sw r1, offset(r2)
+
+ The definition ends at the next header or at the end of the file. Any
+ operand that is not a parameter (register names, numbers) is a constant.
+ A body may use pseudoinstructions defined earlier in the file, those are
+ expanded when the file is read.
+
+"""
+
+import re
+from operator import itemgetter
+import assembler
+import pseudoinstruction_handler as ph
+
+#an operand of the form `offset(base)`
+BASE_OFFSET = re.compile(r"^([^()]*)\(([^()]*)\)$")
+
+class BadDefinition(Exception):
+    """Indicates that a pseudoinstruction definition file is malformed."""
+    pass
+
+##############
+#
+# Reading definition files
+#
+##############
+
+def load_pseudos(lines, pseudos = None):
+    """Reads the definitions in `lines` (an open file or a list of strings)
+        and returns a dictionary like `pseudoinstruction_handler.get_pseudoinstruction_defs()`,
+        holding the pseudoinstructions of `pseudos` (the built in ones by default)
+        and a `Macro` for every definition. Definitions replace the built in
+        pseudoinstruction of the same name."""
+    if pseudos == None:
+        pseudos = ph.get_pseudoinstruction_defs()
+    merged = dict(pseudos)
+    merged.update(parse_definitions(lines))
+    return merged
+
+def parse_definitions(lines):
+    """Reads the definitions in `lines` and returns a dictionary mapping each
+        pseudoinstruction name to its `Macro`, in the order they were defined.
+
+        Raises `BadDefinition` if the file is malformed."""
+    macros = {}
+    header = None
+    body = []
+    for line_number, line in enumerate(lines, 1):
+        code = assembler.remove_comments(line)
+        if code == None:
+            continue
+        code = code.strip()
+        if code.endswith("="):
+            if header:
+                add_macro(macros, header, body)
+            header = (code[:-1], line_number)
+            body = []
+        elif header == None:
+            raise BadDefinition("Found an instruction before the first pseudoinstruction header on line %s:\n\t%s\n" % (line_number, code))
+        else:
+            body.append((code, line_number))
+    if header:
+        add_macro(macros, header, body)
+    return macros
+
+def add_macro(macros, header, body):
+    """Compiles the definition with `header` (a tuple of its text and line
+        number) and `body` (a list of such tuples) and adds it to `macros`."""
+    text, line_number = header
+    tokens = text.replace(",", " ").split()
+    if not tokens:
+        raise BadDefinition("Found a pseudoinstruction header without a name on line %s\n" % line_number)
+    name, parameters = tokens[0], tuple(tokens[1:])
+
+    if name in assembler.instructions_to_types:
+        raise BadDefinition("Pseudoinstruction %s on line %s has the name of a core instruction\n" % (name, line_number))
+    if name in macros:
+        raise BadDefinition("Pseudoinstruction %s on line %s is already defined\n" % (name, line_number))
+    if not body:
+        raise BadDefinition("Pseudoinstruction %s on line %s has no instructions\n" % (name, line_number))
+    for parameter in parameters:
+        if assembler.is_register_name(parameter) or assembler.is_int(parameter):
+            raise BadDefinition("Parameter %s of pseudoinstruction %s on line %s is a register or number, so it\
+ can not be told apart from a constant\n" % (parameter, name, line_number))
+    if len(set(parameters)) != len(parameters):
+        raise BadDefinition("Pseudoinstruction %s on line %s repeats a parameter name\n" % (name, line_number))
+
+    slots = {parameter:index for index, parameter in enumerate(parameters)}
+    template = []
+    for code, body_line in body:
+        record = assembler.tokenize_line(code, body_line)
+        if record.label:
+            raise BadDefinition("Labels can not be used in pseudoinstruction %s, found one on line %s\n" % (name, body_line))
+        operands = tuple(operand_parts(operand, slots) for operand in record.operands)
+
+        if record.command in macros:
+            inner = macros[record.command]
+            if len(operands) != len(inner.parameters):
+                raise BadDefinition("Pseudoinstruction %s on line %s calls %s with %s operands instead of %s\n"
+                                    % (name, body_line, record.command, len(operands), len(inner.parameters)))
+            for command, inner_operands in inner.template:
+                template.append((command, tuple(substitute_parts(parts, operands) for parts in inner_operands)))
+        elif record.command in assembler.instructions_to_types:
+            template.append((record.command, operands))
+        else:
+            raise BadDefinition("Pseudoinstruction %s on line %s uses %s, which is neither a core instruction nor a\
+ pseudoinstruction defined before it\n" % (name, body_line, record.command))
+
+    macros[name] = Macro(name, parameters, template)
+
+def operand_parts(operand, slots):
+    """Splits an operand of a definition body into a tuple of parts: the
+        index of a parameter, or a constant string. `offset(base)` operands
+        are split around the parentheses."""
+    if operand in slots:
+        return (slots[operand],)
+    match = BASE_OFFSET.match(operand)
+    if match and (match.group(1) in slots or match.group(2) in slots):
+        offset, base = match.groups()
+        return (slots.get(offset, offset), "(", slots.get(base, base), ")")
+    return (operand,)
+
+def substitute_parts(parts, operands):
+    """Replaces the parameter indices in `parts` with the parts of the
+        matching entry of `operands`, merging neighbouring constants."""
+    result = []
+    for part in parts:
+        for piece in (operands[part] if type(part) == int else (part,)):
+            if type(piece) == str and result and type(result[-1]) == str:
+                result[-1] += piece
+            else:
+                result.append(piece)
+    return tuple(result)
+
+##############
+#
+# Compiled pseudoinstructions
+#
+##############
+
+class Macro():
+    """
+    A pseudoinstruction compiled from a definition. `template` is a list of
+    `(command, operands)` tuples where each operand is a tuple of parts (see
+    `operand_parts`).
+
+    Calling a macro expands a call the same way as the functions of
+    `pseudoinstruction_handler`: it takes a string or an `assembler.AsmLine`
+    record and the line number, and returns a list of the same kind.
+    """
+    def __init__(self, name, parameters, template):
+        self.name = name
+        self.parameters = parameters
+        self.template = template
+
+        #every constant operand gets a position after the call operands, so the
+        #operands of an expanded line are picked out of `operands + constants`
+        constants = {}
+        self.lines = []
+        for command, operands in template:
+            positions = []
+            for parts in operands:
+                if len(parts) == 1 and type(parts[0]) == int:
+                    positions.append(parts[0])
+                elif all(type(part) == str for part in parts):
+                    constant = "".join(parts)
+                    positions.append(len(parameters) + constants.setdefault(constant, len(constants)))
+                else:
+                    positions = None
+                    break
+            self.lines.append((command, make_getter(positions, operands)))
+        self.constants = tuple(constants)
+
+    def __call__(self, instruction, line_number):
+        if type(instruction) == assembler.AsmLine:
+            operands = instruction.operands
+            if len(operands) != len(self.parameters):
+                self.bad_operands(instruction.instruction_text(), line_number)
+            values = operands + self.constants
+            line_number = instruction.line_number
+            return [assembler.AsmLine(None, command, getter(values), line_number) for command, getter in self.lines]
+
+        operands = tuple(ph.split_instruction(instruction)[1:])
+        if len(operands) != len(self.parameters):
+            self.bad_operands(instruction, line_number)
+        values = operands + self.constants
+        return [assembler.AsmLine(None, command, getter(values)).instruction_text() for command, getter in self.lines]
+
+    def bad_operands(self, instruction, line_number):
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction %s on line %s with args:\n\t%s\n"
+                                    % (self.name, line_number, instruction))
+
+    def definition(self):
+        """Returns the text of the definition, with nested pseudoinstructions
+            expanded."""
+        lines = ["%s %s =" % (self.name, ", ".join(self.parameters))]
+        for command, operands in self.template:
+            text = ["".join(self.parameters[part] if type(part) == int else part for part in parts) for parts in operands]
+            lines.append("\t%s %s" % (command, ", ".join(text)))
+        return "\n".join(lines)
+
+    def __repr__(self):
+        #stable across runs, so assembly cache keys depend on the definition
+        return "Macro(%r)" % self.definition()
+
+def make_getter(positions, operands):
+    """Returns a function taking the call operands followed by the constants
+        of a macro and returning the operands of one expanded line. `positions`
+        lists where each operand is, or is `None` if some operand has to be
+        put together from parts."""
+    if positions == None:
+        return lambda values: tuple("".join(values[part] if type(part) == int else part for part in parts)
+                                    for parts in operands)
+    if len(positions) == 0:
+        return lambda values: ()
+    if len(positions) == 1:
+        position = positions[0]
+        return lambda values: (values[position],)
+    return itemgetter(*positions)
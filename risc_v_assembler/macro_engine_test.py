@@ -0,0 +1,88 @@
+"""
+    Tests for the macro engine of the CSSE232 Risc-V Assembler
+"""
+import assembler, macro_engine
+import pseudoinstruction_handler as ph
+import unittest
+
+definitions = """
+; pseudoinstructions for the tests
+double r1, r2 =
+    add r1, r2, r2
+
+triple r1, r2 =
+    double at, r2       ; at is a constant
+    add r1, at, r2
+
+store value, offset, base =
+    sw value, offset(base)
+
+pop r1 =
+    lw r1, 0(sp)
+    addi sp, sp, 4
+
+clear r1 =
+    add r1, x0, x0
+""".split("\n")
+
+class TestParsing(unittest.TestCase):
+    def test_definitions(self):
+        macros = macro_engine.parse_definitions(definitions)
+        self.assertEqual(["double", "triple", "store", "pop", "clear"], list(macros))
+        self.assertEqual(("value", "offset", "base"), macros["store"].parameters)
+        self.assertEqual("triple r1, r2 =\n\tadd at, r2, r2\n\tadd r1, at, r2", macros["triple"].definition())
+
+    def test_merged_with_builtins(self):
+        pseudos = macro_engine.load_pseudos(definitions)
+        self.assertEqual(ph.li, pseudos["li"])
+        self.assertIsInstance(pseudos["double"], macro_engine.Macro)
+        self.assertNotIn("pop", ph.get_pseudoinstruction_defs())
+
+    def test_bad_definitions(self):
+        bad = ["add r1 =\n add r1, r1, r1",
+               "add r1, r1, r1\nfoo r1 =\n add r1, r1, r1",
+               "foo r1 =\nbar r1 =\n add r1, r1, r1",
+               "foo t0 =\n add t0, t0, t0",
+               "foo a, a =\n add a, a, a",
+               "foo a =\n push a",
+               "foo a =\nloop: add a, a, a",
+               "foo a =\n add a, a, a\nfoo a =\n add a, a, a",
+               "foo a =\n add a, a, a\nbar a =\n foo a, a"]
+        for text in bad:
+            with self.assertRaises(macro_engine.BadDefinition, msg=text):
+                macro_engine.parse_definitions(text.split("\n"))
+
+class TestExpansion(unittest.TestCase):
+    def setUp(self):
+        self.pseudos = macro_engine.load_pseudos(definitions)
+
+    def test_strings(self):
+        self.assertEqual(["sw t0, 8(sp)"], self.pseudos["store"]("store t0, 8, sp", 1))
+        self.assertEqual(["lw a0, 0(sp)", "addi sp, sp, 4"], self.pseudos["pop"]("pop a0", 1))
+        self.assertEqual(["add at, t1, t1", "add t0, at, t1"], self.pseudos["triple"]("triple t0 t1", 1))
+
+    def test_records(self):
+        record = assembler.tokenize_line("clear s1", 7)
+        expanded = self.pseudos["clear"](record, 7)
+        self.assertEqual(1, len(expanded))
+        self.assertEqual(("add", ("s1", "x0", "x0"), 7), (expanded[0].command, expanded[0].operands, expanded[0].line_number))
+
+    def test_same_as_builtin(self):
+        program = ["double t0, t1", "loop: double s0, a1", "beqz t0, loop"]
+        self.assertEqual(assembler.assemble_program(program)[0],
+                         assembler.assemble_program(program, self.pseudos)[0])
+
+    def test_assemble(self):
+        words = assembler.assemble_program(["store t0, -4, sp", "start: pop a0", "triple t2, t1", "beqz a0, start"], self.pseudos)[0]
+        expected = [assembler.encode_instruction(line) for line in ["sw t0, -4(sp)", "lw a0, 0(sp)", "addi sp, sp, 4",
+                                                                    "add at, t1, t1", "add t2, at, t1"]]
+        self.assertEqual(expected, words[:5])
+
+    def test_bad_calls(self):
+        with self.assertRaises(assembler.BadOperands):
+            assembler.assemble_program(["double t0"], self.pseudos)
+        with self.assertRaises(assembler.BadRegister):
+            assembler.assemble_program(["pop t9"], self.pseudos)
+
+if __name__ == "__main__":
+    unittest.main()
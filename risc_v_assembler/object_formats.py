@@ -0,0 +1,188 @@
+"""
+
+ Object Formats
+
+ Binary output for the CSSE232 Assembler. Packs the machine words
+ produced by `assembler.machine_words_pass` into a raw little-endian
+ image, an Intel HEX file or a minimal ELF32 executable, so tools that
+ need bytes do not have to re-parse the text output.
+
+ The text segment starts at `assembler.PC`. The data segment (see
+ `data_segment`), if the program has one, goes in the Intel HEX records
+ at its own address or in a `.data` section of the ELF file.
+
+"""
+
+import sys, struct
+from array import array
+import assembler
+
+#typecode of an unsigned 32-bit array, 'I' is 4 bytes on every common platform
+WORD_TYPECODE = "I" if array("I").itemsize == 4 else "L"
+
+FORMATS = ["raw", "ihex", "elf"]
+"""Names of the supported object formats"""
+
+def write_object(machine_words, labels, format, out, base = None, data = None):
+    """Writes `machine_words` (a list of 32-bit integers, or the bytes of the
+        text when it mixes in compressed instructions) to `out` in the given
+        format ("raw", "ihex" or "elf") with a single write. `labels` is the
+        dictionary from `assembler.parse_labels`, it is used for the ELF
+        symbol table. `base` is the address of the first word, `assembler.PC`
+        by default. `data` is the `data_segment.DataSegment` of the program,
+        or `None`. A raw image can not hold it.
+
+        Intel HEX is text and is written as is. The other formats are written
+        to `out.buffer` if `out` is a text file."""
+
+    if base == None:
+        base = assembler.PC
+
+    if format == "raw":
+        if data:
+            raise ValueError("A raw image only holds the text segment, the program has data")
+        image = to_raw(machine_words)
+    elif format == "ihex":
+        out.write(to_ihex(machine_words, base, data = data))
+        return
+    elif format == "elf":
+        image = to_elf(machine_words, labels, base, data)
+    else:
+        raise ValueError("Unknown object format: %s" % format)
+
+    if hasattr(out, "buffer"):
+        out.flush()
+        out = out.buffer
+    out.write(image)
+
+def to_raw(machine_words):
+    """Returns the machine words packed into little-endian bytes, bytes are
+        returned as they are."""
+    if type(machine_words) in [bytes, bytearray]:
+        return bytes(machine_words)
+    words = array(WORD_TYPECODE, machine_words)
+    if sys.byteorder == "big":
+        words.byteswap()
+    return words.tobytes()
+
+def to_ihex(machine_words, base = None, record_size = 16, data = None):
+    """Returns the machine words as an Intel HEX string, `record_size` bytes
+        per data record, followed by the bytes of the `data_segment.DataSegment`
+        `data` if it is given. Extended linear address records are emitted
+        whenever the upper 16 bits of the address change and the start address
+        record points at `base`."""
+
+    if base == None:
+        base = assembler.PC
+
+    segments = [(base, to_raw(machine_words))]
+    if data:
+        segments.append((data.base, bytes(data.buffer)))
+    records = []
+    upper = None
+    for start, image in segments:
+        offset = 0
+        while offset < len(image):
+            address = start + offset
+            if address >> 16 != upper:
+                upper = address >> 16
+                records.append(ihex_record(0, 0x04, struct.pack(">H", upper)))
+
+            #a record can not cross a 64K boundary
+            size = min(record_size, 0x10000 - (address & 0xffff))
+            records.append(ihex_record(address & 0xffff, 0x00, image[offset:offset + size]))
+            offset += size
+
+    records.append(ihex_record(0, 0x05, struct.pack(">I", base)))
+    records.append(ihex_record(0, 0x01, b""))
+    return "\n".join(records) + "\n"
+
+def ihex_record(address, record_type, data):
+    """Formats one Intel HEX record, including the checksum."""
+    record = struct.pack(">BHB", len(data), address, record_type) + data
+    checksum = (-sum(record)) & 0xff
+    return ":%s%02X" % (record.hex().upper(), checksum)
+
+#sizes of the ELF32 structures
+ELF_HEADER_SIZE = 52
+PROGRAM_HEADER_SIZE = 32
+SECTION_HEADER_SIZE = 40
+SYMBOL_SIZE = 16
+
+#section names, in section header order (index 0 is the null section),
+#`.data` is only there if the program has data
+ELF_SECTIONS = ["", ".text", ".symtab", ".strtab", ".shstrtab", ".data"]
+
+#e_flags bit telling disassemblers the text has RVC (16-bit) instructions
+EF_RISCV_RVC = 0x1
+
+def to_elf(machine_words, labels = None, base = None, data = None):
+    """Returns a minimal little-endian ELF32 RISC-V executable holding the
+        machine words in a `.text` section loaded at `base`, with the entry
+        point at `base`, and the `data_segment.DataSegment` `data` (if given)
+        in a `.data` section loaded at its address. Every label becomes a local
+        symbol in `.symtab`, in the section its address is in. Text given as
+        bytes holds compressed instructions and is flagged `EF_RISCV_RVC`."""
+
+    if base == None:
+        base = assembler.PC
+    if labels == None:
+        labels = {}
+
+    text = to_raw(machine_words)
+    flags = EF_RISCV_RVC if type(machine_words) in [bytes, bytearray] else 0
+    data_bytes = bytes(data.buffer) if data else b""
+    section_names = ELF_SECTIONS if data_bytes else ELF_SECTIONS[:-1]
+
+    #symbol names and the symbol table, the first entry is the null symbol
+    strtab = bytearray(b"\0")
+    symbols = [struct.pack("<IIIBBH", 0, 0, 0, 0, 0, 0)]
+    for label, address in labels.items():
+        section = 5 if data_bytes and data.base <= address <= data.base + len(data_bytes) else 1
+        symbols.append(struct.pack("<IIIBBH", len(strtab), address, 0, 0, 0, section))
+        strtab += label.encode() + b"\0"
+    symtab = b"".join(symbols)
+
+    shstrtab = bytearray()
+    name_offsets = []
+    for name in section_names:
+        name_offsets.append(len(shstrtab))
+        shstrtab += name.encode() + b"\0"
+
+    #lay out the file: headers, text, data, symbols, strings, section headers
+    segments = 2 if data_bytes else 1
+    text_offset = ELF_HEADER_SIZE + segments * PROGRAM_HEADER_SIZE
+    data_offset = align(text_offset + len(text), 4)
+    symtab_offset = align(data_offset + len(data_bytes), 4)
+    strtab_offset = symtab_offset + len(symtab)
+    shstrtab_offset = strtab_offset + len(strtab)
+    section_offset = align(shstrtab_offset + len(shstrtab), 4)
+
+    header = struct.pack("<4sBBBBB7sHHIIIIIHHHHHH",
+                         b"\x7fELF", 1, 1, 1, 0, 0, b"",  #32-bit, little-endian, version 1
+                         2, 243, 1,                       #executable, RISC-V, version 1
+                         base, ELF_HEADER_SIZE, section_offset, flags,
+                         ELF_HEADER_SIZE, PROGRAM_HEADER_SIZE, segments,
+                         SECTION_HEADER_SIZE, len(section_names), 4)
+
+    #one loadable, readable and executable segment holding the text, and a
+    #readable and writable one holding the data
+    program_header = struct.pack("<IIIIIIII", 1, text_offset, base, base, len(text), len(text), 5, 4)
+    if data_bytes:
+        program_header += struct.pack("<IIIIIIII", 1, data_offset, data.base, data.base, len(data_bytes), len(data_bytes), 6, 4)
+
+    sections = [struct.pack("<10I", *[0] * 10),
+                struct.pack("<10I", name_offsets[1], 1, 6, base, text_offset, len(text), 0, 0, 4, 0),
+                struct.pack("<10I", name_offsets[2], 2, 0, 0, symtab_offset, len(symtab), 3, len(symbols), 4, SYMBOL_SIZE),
+                struct.pack("<10I", name_offsets[3], 3, 0, 0, strtab_offset, len(strtab), 0, 0, 1, 0),
+                struct.pack("<10I", name_offsets[4], 3, 0, 0, shstrtab_offset, len(shstrtab), 0, 0, 1, 0)]
+    if data_bytes:
+        sections.append(struct.pack("<10I", name_offsets[5], 1, 3, data.base, data_offset, len(data_bytes), 0, 0, 4, 0))
+
+    return b"".join([header, program_header, text, b"\0" * (data_offset - text_offset - len(text)), data_bytes,
+                     b"\0" * (symtab_offset - data_offset - len(data_bytes)), symtab, bytes(strtab), bytes(shstrtab),
+                     b"\0" * (section_offset - shstrtab_offset - len(shstrtab))] + sections)
+
+def align(value, alignment):
+    """Rounds `value` up to a multiple of `alignment`."""
+    return (value + alignment - 1) // alignment * alignment
@@ -0,0 +1,96 @@
+"""
+    Tests for the binary object formats of the CSSE232 Risc-V Assembler
+"""
+import assembler, object_formats, data_segment, compressor
+import io, struct, unittest
+
+def parse_ihex(text):
+    #helper that turns Intel HEX text back into {address: byte}
+    memory = {}
+    upper = 0
+    for line in text.split():
+        record = bytes.fromhex(line[1:])
+        assert sum(record) & 0xff == 0, "bad checksum in %s" % line
+        size, address, record_type = struct.unpack(">BHB", record[:4])
+        data = record[4:4 + size]
+        if record_type == 0x04:
+            upper = struct.unpack(">H", data)[0] << 16
+        elif record_type == 0x00:
+            for i, b in enumerate(data):
+                memory[upper + address + i] = b
+    return memory
+
+class TestObjectFormats(unittest.TestCase):
+    words = [assembler.encode_instruction(i) for i in 
+             ["addi t0, x0, 5", "addi t0, t0, -1", "sw t0, 0(sp)", "bne t0, x0, -4", "jal ra, -16"]]
+
+    def test_raw_is_little_endian(self):
+        data = object_formats.to_raw(self.words)
+        self.assertEqual(20, len(data))
+        self.assertEqual(bytes([0x93, 0x02, 0x50, 0x00]), data[:4])
+        self.assertEqual(self.words, list(struct.unpack("<5I", data)))
+
+    def test_ihex_round_trip(self):
+        text = object_formats.to_ihex(self.words * 10)
+        memory = parse_ihex(text)
+        data = object_formats.to_raw(self.words * 10)
+        self.assertEqual({assembler.PC + i: b for i, b in enumerate(data)}, memory)
+        self.assertTrue(text.endswith(":00000001FF\n"))
+
+    def test_ihex_64k_boundary(self):
+        base = 0x0040fff8
+        text = object_formats.to_ihex(self.words, base)
+        memory = parse_ihex(text)
+        data = object_formats.to_raw(self.words)
+        self.assertEqual({base + i: b for i, b in enumerate(data)}, memory)
+        self.assertIn(":020000040041B9", text)
+
+    def test_elf_layout(self):
+        labels = {"start": assembler.PC, "loop": assembler.PC + 4}
+        data = object_formats.to_elf(self.words, labels)
+        self.assertEqual(b"\x7fELF\x01\x01\x01", data[:7])
+        (e_type, e_machine, e_version, e_entry, e_phoff, e_shoff) = struct.unpack("<HHIIII", data[16:36])
+        self.assertEqual((2, 243, assembler.PC, 52), (e_type, e_machine, e_entry, e_phoff))
+        #the program header points at the text
+        (p_type, p_offset, p_vaddr) = struct.unpack("<III", data[52:64])
+        self.assertEqual((1, assembler.PC), (p_type, p_vaddr))
+        self.assertEqual(object_formats.to_raw(self.words), data[p_offset:p_offset + 20])
+        #every section header is there
+        self.assertEqual(e_shoff + 5 * 40, len(data))
+
+    def test_elf_rvc_flag(self):
+        (e_flags,) = struct.unpack("<I", object_formats.to_elf(self.words)[36:40])
+        self.assertEqual(0, e_flags)
+        parcels, addresses = compressor.compress(self.words)
+        image = object_formats.to_elf(compressor.to_bytes(parcels))
+        (e_flags,) = struct.unpack("<I", image[36:40])
+        self.assertEqual(object_formats.EF_RISCV_RVC, e_flags)
+
+    def test_data_segment(self):
+        data = data_segment.DataSegment()
+        data.add_words([0x12345678, 0xdeadbeef])
+        memory = parse_ihex(object_formats.to_ihex(self.words, data = data))
+        self.assertEqual(bytes(memory[data_segment.DATA + i] for i in range(8)), bytes(data.buffer))
+        self.assertEqual(len(memory), 28)
+
+        image = object_formats.to_elf(self.words, {"table":data_segment.DATA}, data = data)
+        (e_shoff,) = struct.unpack("<I", image[32:36])
+        (e_phnum, e_shentsize, e_shnum) = struct.unpack("<HHH", image[44:50])
+        self.assertEqual((2, 6), (e_phnum, e_shnum))
+        (p_type, p_offset, p_vaddr) = struct.unpack("<III", image[84:96])
+        self.assertEqual((1, data_segment.DATA), (p_type, p_vaddr))
+        self.assertEqual(bytes(data.buffer), image[p_offset:p_offset + 8])
+        self.assertEqual(e_shoff + 6 * 40, len(image))
+
+        with self.assertRaises(ValueError):
+            object_formats.write_object(self.words, {}, "raw", io.BytesIO(), data = data)
+
+    def test_write_object_uses_binary_buffer(self):
+        buffer = io.BytesIO()
+        out = io.TextIOWrapper(buffer)
+        object_formats.write_object(self.words, {}, "raw", out)
+        self.assertEqual(object_formats.to_raw(self.words), buffer.getvalue())
+
+        out = io.StringIO()
+        object_formats.write_object(self.words, {}, "ihex", out)
+        self.assertEqual(object_formats.to_ihex(self.words), out.getvalue())
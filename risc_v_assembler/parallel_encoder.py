@@ -0,0 +1,77 @@
+"""
+
+ Parallel Encoder
+
+ Runs the machine code pass of the CSSE232 Assembler across a pool of
+ processes. Once the labels are known every instruction can be encoded
+ on its own, so the clean code is split into chunks which are encoded
+ by the workers and put back together in order.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import assembler
+
+MIN_CHUNK_SIZE = 2048
+"""Programs with fewer instructions than this per job are encoded in this process"""
+
+CHUNKS_PER_JOB = 4
+"""How many chunks each worker gets, more chunks balance the load better"""
+
+def encode_parallel(records, labels, jobs):
+    """Takes a list of `assembler.AsmLine` records with no labels or
+        pseudoinstructions and the labels dictionary, and returns the list of
+        32-bit machine words, encoding with `jobs` worker processes.
+
+        Errors are the same as for `assembler.machine_words_pass`: if several
+        instructions are invalid the one on the earliest line is raised."""
+
+    if jobs <= 1 or len(records) < jobs * MIN_CHUNK_SIZE:
+        return encode_chunk(0, [(r.command, r.operands, r.line_number) for r in records], labels)
+
+    chunk_size = -(-len(records) // (jobs * CHUNKS_PER_JOB))
+    chunks = []
+    for start in range(0, len(records), chunk_size):
+        chunks.append((start, [(r.command, r.operands, r.line_number) for r in records[start:start + chunk_size]]))
+
+    #the labels are sent once to each worker instead of with every chunk
+    with ProcessPoolExecutor(jobs, initializer=set_worker_labels, initargs=(labels,)) as pool:
+        results = list(pool.map(encode_worker_chunk, chunks))
+
+    machine_words = []
+    for words, error in results:
+        if error != None:
+            #chunks are in program order so this is the earliest error
+            raise error
+        machine_words.extend(words)
+    return machine_words
+
+def encode_chunk(start, instructions, labels):
+    """Encodes a list of `(command, operands, line_number)` tuples, the first of
+        which is at index `start` in the program. Returns the list of words."""
+    encode = assembler.encode
+    return [encode(command, operands, line_number, labels, index)
+            for index, (command, operands, line_number) in enumerate(instructions, start)]
+
+##############
+#
+# Worker side
+#
+##############
+
+worker_labels = None
+"""The labels dictionary of the program being encoded, set in each worker"""
+
+def set_worker_labels(labels):
+    global worker_labels
+    worker_labels = labels
+
+def encode_worker_chunk(chunk):
+    """Encodes one `(start, instructions)` chunk in a worker. Returns a tuple of
+        the words and `None`, or `None` and the first error found, since
+        exceptions should not stop the other chunks from being collected."""
+    start, instructions = chunk
+    try:
+        return (encode_chunk(start, instructions, worker_labels), None)
+    except Exception as error:
+        return (None, error)
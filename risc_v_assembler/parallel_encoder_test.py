@@ -0,0 +1,44 @@
+"""
+    Tests for the parallel machine code pass of the CSSE232 Risc-V Assembler
+"""
+import assembler, parallel_encoder
+import unittest
+
+def program(size):
+    #a label every third line with branches back to it
+    lines = []
+    for i in range(size):
+        if i % 3 == 0:
+            lines.append("L%d: addi t0, t1, %d" % (i, i % 2000))
+        elif i % 3 == 1:
+            lines.append("beq t0, t1, L%d" % (i - 1))
+        else:
+            lines.append("jal ra, L0")
+    return assembler.parse_labels(assembler.lex_pass(lines))
+
+class TestParallelEncoder(unittest.TestCase):
+    def setUp(self):
+        #make small programs use the worker pool
+        self.min_chunk_size = parallel_encoder.MIN_CHUNK_SIZE
+        parallel_encoder.MIN_CHUNK_SIZE = 16
+
+    def tearDown(self):
+        parallel_encoder.MIN_CHUNK_SIZE = self.min_chunk_size
+
+    def test_matches_sequential(self):
+        records, labels = program(600)
+        expected = assembler.machine_words_pass(records, labels)
+        self.assertEqual(expected, assembler.machine_words_pass(records, labels, 3))
+
+    def test_first_error_wins(self):
+        records, labels = program(600)
+        records[500].operands = ("zz",)
+        records[100].operands = ("t0", "t1", "NOWHERE")
+        with self.assertRaisesRegex(assembler.BadLabel, "NOWHERE"):
+            assembler.machine_words_pass(records, labels, 3)
+
+    def test_small_programs_stay_in_process(self):
+        parallel_encoder.MIN_CHUNK_SIZE = self.min_chunk_size
+        records, labels = program(30)
+        self.assertEqual(assembler.machine_words_pass(records, labels),
+                         parallel_encoder.encode_parallel(records, labels, 8))
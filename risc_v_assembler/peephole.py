@@ -0,0 +1,352 @@
+"""
+
+ Peephole Optimizer
+
+ An optional pass of the CSSE232 Assembler (`-O`) that runs between
+ the pseudoinstruction expansion and `assembler.parse_labels`, and
+ rewrites short runs of core instructions into fewer ones using the
+ rules in `RULES`:
+
+ - instructions that do nothing (`addi t0, t0, 0`, `add t0, t0, x0`, ...)
+ - ALU instructions writing `x0`
+ - consecutive adjustments of the same register, e.g. the
+   `addi sp, sp, -4` of back to back `push` expansions, with the
+   offsets of the loads and stores between them corrected
+ - a branch over a `jal x0` becomes a single inverted branch when the
+   jump target is in range
+
+ Labels stay on the instruction they named (or the one that took its
+ place) and branches with numeric offsets are retargeted, so every
+ branch still reaches the same code. Rules only touch instructions that
+ assemble without errors, so no error is hidden by the optimization.
+
+"""
+
+import assembler
+
+#registers that can not be told apart by name, e.g. t0 and x5
+REGISTERS = assembler.register_name_to_num
+
+BRANCHES = {"beq":"bne", "bne":"beq", "blt":"bge", "bge":"blt"}
+"""Dictionary mapping each branch to the branch with the inverted condition"""
+
+#instructions with no effect but writing rd, safe to drop when rd is x0
+PURE = set(command for command, instruction_type in assembler.instructions_to_types.items()
+           if instruction_type in [assembler.Types.R, assembler.Types.I, assembler.Types.U]) - {"lw", "jalr"}
+
+#instructions that leave rd unchanged when it is also rs1 and the last
+#operand is this register or immediate
+IDENTITIES = {"add":"x0", "sub":"x0", "or":"x0", "xor":"x0", "sll":"x0", "srl":"x0", "sra":"x0",
+              "addi":"0", "ori":"0", "xori":"0", "slli":"0", "srli":"0", "srai":"0"}
+
+#how far ahead a register adjustment is looked for
+ADJUST_WINDOW = 16
+
+##############
+#
+# Driver
+#
+##############
+
+def optimize(records):
+    """Takes a list of `assembler.AsmLine` records (core instructions, labels
+        allowed) and returns a tuple of the optimized list and the number of
+        instructions removed.
+
+        Programs with a numeric branch offset that does not land on one of
+        their instructions (or just past the end) are returned unchanged,
+        since moving code would change where the branch goes."""
+    program = Program(records)
+    if not program.targets_known:
+        return (records, 0)
+
+    before = program.instruction_count()
+    index = 0
+    while index < len(program.records):
+        for rule in RULES:
+            if rule(program, index):
+                #a rewrite can make the instructions before it match a rule
+                index = max(0, index - ADJUST_WINDOW)
+                break
+        else:
+            index += 1
+
+    relax_branches_over_jumps(program)
+    return (program.finish(), before - program.instruction_count())
+
+class Program():
+    """
+    The records being optimized, with the target of every branch and jump
+    that uses a numeric offset kept as a reference to the target record
+    (`None` for the end of the program), so the offsets can be computed
+    again once instructions moved.
+    """
+    def __init__(self, records):
+        self.records = list(records)
+        self.targets = {}
+        self.incoming = {}
+        self.targets_known = True
+        has_labels = any(record.label for record in self.records)
+
+        instructions = [record for record in self.records if record.command]
+        for index, record in enumerate(instructions):
+            target = branch_target(record)
+            if target == None:
+                continue
+            if assembler.is_int(target):
+                offset = int(target)
+                destination = index + offset // 4
+                if offset % 4 or not 0 <= destination <= len(instructions):
+                    self.targets_known = False
+                else:
+                    self.set_target(record, instructions[destination] if destination < len(instructions) else None)
+            elif not has_labels:
+                #branches to labels go to the start of the program when there are no labels
+                self.set_target(record, instructions[0])
+
+    def set_target(self, branch, target):
+        self.targets[branch] = target
+        self.incoming.setdefault(target, []).append(branch)
+
+    def instruction_count(self):
+        return sum(1 for record in self.records if record.command)
+
+    def has_entry(self, record):
+        """Returns True if `record` has a label or a branch going to it."""
+        return bool(record.label or self.incoming.get(record))
+
+    def replace(self, start, end, replacement):
+        """Replaces `records[start:end]` with the `replacement` records. Labels
+            and branches going to the first replaced record move to the first
+            replacement, or the instruction after the run if there is none
+            (skipping records that only hold a label)."""
+        first = self.records[start]
+        following = next_instruction(self.records, end - 1)
+        following = self.records[following] if following != None else None
+        new_first = replacement[0] if replacement else following
+
+        for branch in self.incoming.pop(first, []):
+            self.set_target(branch, new_first)
+        for record in self.records[start:end]:
+            if record in self.targets:
+                self.incoming[self.targets.pop(record)].remove(record)
+
+        if first.label:
+            if replacement:
+                replacement[0].label = first.label
+            else:
+                replacement = [assembler.AsmLine(first.label, None, (), first.line_number)]
+        self.records[start:end] = replacement
+
+    def positions(self):
+        """Returns a dictionary mapping each instruction record to its index."""
+        positions = {}
+        for record in self.records:
+            if record.command:
+                positions[record] = len(positions)
+        return positions
+
+    def finish(self):
+        """Returns the records with the numeric branch offsets computed again."""
+        positions = self.positions()
+        size = len(positions)
+        for branch, target in self.targets.items():
+            destination = size if target == None else positions[target]
+            operands = list(branch.operands)
+            if assembler.is_int(operands[-1]):
+                operands[-1] = str(4 * (destination - positions[branch]))
+                branch.operands = tuple(operands)
+        return self.records
+
+##############
+#
+# Rules
+#
+# Each rule takes the program and an index in its records, and rewrites
+# the records starting there if it applies, returning True if it did.
+#
+##############
+
+def drop_identity(program, index):
+    """`addi t0, t0, 0`, `add t0, t0, x0` and similar do nothing."""
+    record = program.records[index]
+    identity = IDENTITIES.get(record.command)
+    if identity == None or len(record.operands) != 3 or not is_valid(record):
+        return False
+    rd, rs1, last = record.operands
+    if REGISTERS[rd] != REGISTERS[rs1]:
+        return False
+    if not (REGISTERS.get(last) == 0 if identity == "x0" else int(last) == 0):
+        return False
+    program.replace(index, index + 1, [])
+    return True
+
+def drop_zero_writes(program, index):
+    """ALU instructions writing x0 do nothing."""
+    record = program.records[index]
+    if record.command not in PURE or not record.operands or REGISTERS.get(record.operands[0]) != 0 or not is_valid(record):
+        return False
+    program.replace(index, index + 1, [])
+    return True
+
+def merge_adjustments(program, index):
+    """`addi sp, sp, a` followed by `addi sp, sp, b` becomes `addi sp, sp, a+b`.
+        Loads and stores between them that use the register as their base get
+        their offsets corrected, anything else using the register (or a label
+        or branch into the run) stops the rule."""
+    records = program.records
+    first = records[index]
+    register = adjustment_register(first)
+    if register == None:
+        return False
+
+    between = []
+    for end in range(index + 1, min(len(records), index + ADJUST_WINDOW)):
+        record = records[end]
+        if not record.command or program.has_entry(record) or not is_valid(record):
+            return False
+        if adjustment_register(record) == register:
+            total = int(first.operands[2]) + int(record.operands[2])
+            adjustment = int(record.operands[2])
+            moved = [moved_access(access, register, -adjustment) for access in between]
+            if not -2048 <= total <= 2047 or None in moved:
+                return False
+            merged = assembler.AsmLine(None, "addi", (first.operands[0], first.operands[0], str(total)), first.line_number)
+            program.replace(index, end + 1, [merged] + moved)
+            return True
+        if record.command not in ["lw", "sw"] or uses_register(record, register):
+            return False
+        between.append(record)
+    return False
+
+def drop_branch_to_next(program, index):
+    """A branch or `jal x0` going to the next instruction does nothing."""
+    record = program.records[index]
+    if not (record.command in BRANCHES or (record.command == "jal" and REGISTERS.get(record.operands[0] if record.operands else None) == 0)):
+        return False
+    if not is_valid(record):
+        return False
+    following = next_instruction(program.records, index)
+    if following == None:
+        return False
+    if record in program.targets:
+        if program.targets[record] is not program.records[following]:
+            return False
+    elif record.operands[-1] not in [program.records[between].label for between in range(index + 1, following + 1)]:
+        return False
+    program.replace(index, index + 1, [])
+    return True
+
+RULES = [drop_identity, drop_zero_writes, merge_adjustments, drop_branch_to_next]
+"""The rules tried at every instruction, in order"""
+
+def relax_branches_over_jumps(program):
+    """Rewrites `bne a, b, +8` followed by `jal x0, target` into `beq a, b, target`
+        when the target is in range of a branch. Runs once all other rules are
+        done. The positions are not updated after each rewrite: removing
+        instructions only brings targets closer, so distances measured before
+        are never too short."""
+    positions = program.positions()
+    labels = label_positions(program.records)
+    records = program.records
+    index = 0
+    while index < len(records) - 1:
+        branch = records[index]
+        jump = records[index + 1]
+        if (branch.command not in BRANCHES or branch not in program.targets or jump.command != "jal"
+                or len(jump.operands) != 2 or REGISTERS.get(jump.operands[0]) != 0 or program.has_entry(jump)):
+            index += 1
+            continue
+        after = next_instruction(records, index + 1)
+        if program.targets[branch] is not (records[after] if after != None else None) or not is_valid(branch) or not is_valid(jump):
+            index += 1
+            continue
+
+        #where the jump goes, as an instruction index
+        if jump in program.targets:
+            target = program.targets[jump]
+            destination = len(positions) if target == None else positions[target]
+        elif jump.operands[1] in labels:
+            destination = labels[jump.operands[1]]
+        else:
+            index += 1
+            continue
+        if not -2048 <= 2 * (destination - positions[branch]) <= 2047:
+            index += 1
+            continue
+
+        inverted = assembler.AsmLine(None, BRANCHES[branch.command], branch.operands[:2] + (jump.operands[1],), branch.line_number)
+        positions[inverted] = positions[branch]
+        target = program.targets.get(jump, False)
+        program.replace(index, index + 2, [inverted])
+        if target != False:
+            program.set_target(inverted, target)
+        index += 1
+
+##############
+#
+# Helpers
+#
+##############
+
+def is_valid(record):
+    """Returns True if `record` assembles without errors (labels aside)."""
+    operands = record.operands
+    if record.command in BRANCHES or record.command == "jal":
+        #check the registers and use a made up offset for the target
+        operands = operands[:-1] + ("0",) if operands else operands
+    try:
+        assembler.encode(record.command, operands, record.line_number, {}, 0)
+    except Exception:
+        return False
+    return True
+
+def branch_target(record):
+    """Returns the target operand of a branch or `jal`, or `None`."""
+    if (record.command in BRANCHES and len(record.operands) == 3) or (record.command == "jal" and len(record.operands) == 2):
+        return record.operands[-1]
+    return None
+
+def adjustment_register(record):
+    """Returns the register of an `addi r, r, imm`, or `None`."""
+    if record.command != "addi" or len(record.operands) != 3 or not is_valid(record):
+        return None
+    rd, rs1, immediate = record.operands
+    if REGISTERS[rd] != REGISTERS[rs1] or REGISTERS[rd] == 0:
+        return None
+    return REGISTERS[rd]
+
+def uses_register(record, register):
+    """Returns True if a `lw` or `sw` uses `register` other than as its base."""
+    return REGISTERS.get(record.operands[0]) == register
+
+def moved_access(record, register, delta):
+    """Returns a copy of the `lw`/`sw` `record` with `delta` added to its offset
+        if its base is `register`, or `None` if the offset no longer fits."""
+    if len(record.operands) != 2:
+        return None
+    offset, base = record.operands[1].replace(")", "").split("(")
+    if REGISTERS.get(base) != register:
+        return record
+    offset = int(offset) + delta
+    if not -2048 <= offset <= 2047:
+        return None
+    return assembler.AsmLine(record.label, record.command, (record.operands[0], "%s(%s)" % (offset, base)), record.line_number)
+
+def next_instruction(records, index):
+    """Returns the index of the first instruction after `records[index]`, or `None`."""
+    for following in range(index + 1, len(records)):
+        if records[following].command:
+            return following
+    return None
+
+def label_positions(records):
+    """Returns a dictionary mapping each label to the index of the instruction it names."""
+    labels = {}
+    index = 0
+    for record in records:
+        if record.label:
+            labels[record.label] = index
+        if record.command:
+            index += 1
+    return labels
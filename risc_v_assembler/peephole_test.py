@@ -0,0 +1,111 @@
+"""
+    Tests for the peephole optimizer of the CSSE232 Risc-V Assembler
+"""
+import assembler, assembly_stats, peephole, simulator
+import io, sys, unittest
+
+def optimized(lines):
+    records = assembler.pseudoinstruction_pass(assembler.lex_pass(lines), assembler.ph.get_pseudoinstruction_defs())
+    records, removed = peephole.optimize(records)
+    return (assembler.records_to_text(records), removed)
+
+def final_registers(lines, optimize):
+    machine = simulator.Simulator(assembler.assemble_program(lines, optimize = optimize)[0])
+    machine.run(max_steps = 10000)
+    #ra starts at the end of the program, which moves
+    return [machine.get_register("x%s" % number) for number in range(32) if number != 1]
+
+class TestPeephole(unittest.TestCase):
+    def test_identities(self):
+        text, removed = optimized(["addi t0, t0, 0", "add t1, x6, x0", "or t2, t2, zero", "slli t0, t0, 0",
+                                   "addi t0, t1, 0", "add t0, t0, t1"])
+        self.assertEqual(["addi t0, t1, 0", "add t0, t0, t1"], text)
+        self.assertEqual(4, removed)
+
+    def test_zero_writes(self):
+        text, removed = optimized(["add x0, t0, t1", "lui zero, 5", "lw x0, 0(sp)", "jalr x0, ra, 0"])
+        self.assertEqual(["lw x0, 0(sp)", "jalr x0, ra, 0"], text)
+        self.assertEqual(2, removed)
+
+    def test_merge_pushes(self):
+        text, removed = optimized(["push t0", "push t1", "lw t2, 0(sp)", "addi sp, sp, 4"])
+        self.assertEqual(["addi sp, sp, -4", "sw t0, 0(sp)", "sw t1, -4(sp)", "lw t2, -4(sp)"], text)
+        self.assertEqual(2, removed)
+
+    def test_merge_stops(self):
+        #sp is read, a label is in the run, the total is out of range
+        for lines in [["addi sp, sp, -4", "add t0, sp, x0", "addi sp, sp, -4"],
+                      ["addi sp, sp, -4", "here: sw t0, 0(sp)", "addi sp, sp, -4"],
+                      ["addi sp, sp, -2000", "addi sp, sp, -100"],
+                      ["addi sp, sp, -4", "sw sp, 0(sp)", "addi sp, sp, -4"]]:
+            self.assertEqual(0, optimized(lines)[1])
+
+    def test_labels_kept(self):
+        text, removed = optimized(["start: addi t0, t0, 0", "addi t1, x0, 1", "end: add x0, x0, x0",
+                                   "beq t0, t1, start", "beq t0, t1, end"])
+        self.assertEqual(["start:", "addi t1, x0, 1", "end:", "beq t0, t1, start", "beq t0, t1, end"], text)
+        self.assertEqual(2, removed)
+
+    def test_numeric_offsets_retargeted(self):
+        text, removed = optimized(["beq t0, t1, 12", "addi t0, t0, 0", "addi t1, x0, 1", "addi t2, x0, 2",
+                                   "jal x0, -12"])
+        self.assertEqual(["beq t0, t1, 8", "addi t1, x0, 1", "addi t2, x0, 2", "jal x0, -8"], text)
+        self.assertEqual(1, removed)
+
+    def test_retargeted_past_labels(self):
+        #the instruction after the dropped one comes after a label
+        text, removed = optimized(["beq t0, t1, 8", "addi a0, a0, 1", "addi t2, t2, 0", "loop: addi a1, a1, 1"])
+        self.assertEqual(["beq t0, t1, 8", "addi a0, a0, 1", "loop:", "addi a1, a1, 1"], text)
+        self.assertEqual(1, removed)
+        #or there is none and the branch goes to the end
+        text, removed = optimized(["beq t0, t1, 8", "addi a0, a0, 1", "addi t2, t2, 0", "end:"])
+        self.assertEqual(["beq t0, t1, 8", "addi a0, a0, 1", "end:"], text)
+
+    def test_unknown_targets_unchanged(self):
+        for lines in [["beq t0, t1, 6", "addi t0, t0, 0"], ["jal x0, 400", "addi t0, t0, 0"]]:
+            self.assertEqual((lines, 0), optimized(lines))
+
+    def test_branch_to_next(self):
+        text, removed = optimized(["beq t0, t1, 4", "jal x0, next", "next: addi t0, x0, 1"])
+        self.assertEqual(["next:", "addi t0, x0, 1"], text)
+        self.assertEqual(2, removed)
+
+    def test_branch_over_jump(self):
+        text, removed = optimized(["bge t0, t1, 8", "jal x0, far", "addi t0, x0, 1", "far: addi t1, x0, 2"])
+        self.assertEqual(["blt t0, t1, far", "addi t0, x0, 1", "far:", "addi t1, x0, 2"], text)
+        self.assertEqual(1, removed)
+
+        #the jump links ra, so it has to stay
+        lines = ["jalif t0, t1, far", "addi t0, x0, 1", "far: addi t1, x0, 2"]
+        self.assertEqual(0, optimized(lines)[1])
+
+    def test_branch_over_jump_out_of_range(self):
+        lines = ["bne t0, t1, 8", "jal x0, far"] + ["add t0, t0, t1"] * 1100 + ["far: addi t1, x0, 2"]
+        self.assertEqual(0, optimized(lines)[1])
+
+    def test_errors_not_hidden(self):
+        for line in ["addi t0, t0, 0, 0", "add x0, t0, nope", "addi t0, t0, 5000"]:
+            self.assertRaises(Exception, assembler.assemble_program, [line], optimize = True)
+            self.assertEqual(0, optimized([line])[1])
+
+    def test_same_results(self):
+        lines = ["addi t0, x0, 5", "addi t1, x0, 7", "push t0", "push t1", "lw t2, 0(sp)", "lw t3, 4(sp)", "addi sp, sp, 8",
+                 "loop: addi t0, t0, -1", "addi t0, t0, 0", "add x0, t0, t1", "bne t0, x0, 8", "jal x0, done",
+                 "addi t4, t4, 3", "beq x0, x0, loop", "done: add t5, t2, t3"]
+        self.assertEqual(final_registers(lines, False), final_registers(lines, True))
+        self.assertLess(len(assembler.assemble_program(lines, optimize = True)[0]), len(assembler.assemble_program(lines)[0]))
+
+    def test_report(self):
+        stats = assembly_stats.AssemblyStats()
+        stderr = sys.stderr
+        sys.stderr = io.StringIO()
+        try:
+            stats.add_hook(assembler.report_removed)
+            assembler.assemble_program(["start: addi t0, t0, 0", "addi t0, x0, 1"], optimize = True, stats = stats)
+            report = sys.stderr.getvalue()
+        finally:
+            sys.stderr = stderr
+        self.assertEqual("peephole: removed 1 of 2 instructions\n", report)
+
+if __name__ == '__main__':
+    unittest.main()
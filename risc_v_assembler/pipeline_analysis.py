@@ -0,0 +1,282 @@
+"""
+
+ Pipeline Analysis
+
+ Estimates how a program assembled by the CSSE232 Assembler runs on the
+ classic 5-stage RV32 pipeline (IF, ID, EX, MEM, WB) without simulating
+ it: the instructions are walked in program order, the registers each
+ machine word reads and writes are taken from its rd, rs1 and rs2
+ fields, and every data and control hazard is counted as stall cycles.
+
+ The model:
+
+ - registers are written in the first half of WB and read in the second
+   half of ID
+ - without forwarding an instruction waits in ID until the instruction
+   producing one of its registers is in WB
+ - with forwarding only a load followed by an instruction using its
+   result stalls, for one cycle
+ - branches and jumps are resolved in EX with a predict not taken
+   front end, so every taken one flushes `BRANCH_PENALTY` instructions.
+   `jal` and `jalr` are always taken, a branch is counted as taken if it
+   goes backwards (a loop) or always goes the same way
+
+ Stalls are reported per basic block (see `control_flow`), with the
+ cycles and CPI of each block and of the whole program, which also pays
+ `STAGES - 1` cycles to fill the pipeline.
+
+ Usage:
+    python3 pipeline_analysis.py program.asm --hazards
+
+"""
+
+import sys, argparse
+import assembler, control_flow
+
+STAGES = 5
+
+#instructions flushed by a taken branch or jump, resolved in EX
+BRANCH_PENALTY = 2
+
+#cycles between the ID of a producer and the first ID that can use its result
+LATENCY_FORWARDING = 1
+LATENCY_LOAD_FORWARDING = 2
+LATENCY_NO_FORWARDING = 3
+
+#opcodes and the register fields they use, as (writes rd, reads rs1, reads rs2)
+LOAD_OPCODE = 0b0000011
+OPCODE_REGISTERS = {0b0110011:(True, True, True),    #R
+                    0b0010011:(True, True, False),   #I
+                    LOAD_OPCODE:(True, True, False), #lw
+                    0b1100111:(True, True, False),   #jalr
+                    0b0100011:(False, True, True),   #S
+                    0b1100011:(False, True, True),   #SB
+                    0b0110111:(True, False, False),  #U
+                    0b1101111:(True, False, False)}  #UJ
+"""Dictionary mapping each opcode to the register fields its instructions use"""
+
+#kinds of hazards
+LOAD_USE = "load-use"
+DATA = "data"
+CONTROL = "control"
+
+##############
+#
+# Analysis
+#
+##############
+
+class Hazard():
+    """
+    A hazard found at the instruction `index`: its `kind`, the `register`
+    (for data hazards) written by the instruction at `producer`, and the
+    number of `stalls` it costs.
+    """
+    __slots__ = ("index", "kind", "register", "producer", "stalls")
+
+    def __init__(self, index, kind, register, producer, stalls):
+        self.index = index
+        self.kind = kind
+        self.register = register
+        self.producer = producer
+        self.stalls = stalls
+
+    def __repr__(self):
+        return "Hazard(%r, %r, %r, %r, %r)" % (self.index, self.kind, self.register, self.producer, self.stalls)
+
+class BlockTiming():
+    """
+    The estimate for one `control_flow.BasicBlock`: its number of
+    `instructions` and the `data_stalls` and `control_stalls` spent in it.
+    """
+    def __init__(self, block):
+        self.block = block
+        self.instructions = len(block)
+        self.data_stalls = 0
+        self.control_stalls = 0
+
+    def stalls(self):
+        return self.data_stalls + self.control_stalls
+
+    def cycles(self):
+        return self.instructions + self.stalls()
+
+    def cpi(self):
+        return self.cycles() / self.instructions
+
+class PipelineReport():
+    """
+    The estimate for a whole program with or without `forwarding`: the
+    `BlockTiming` of each basic block and the list of `Hazard`s in program
+    order.
+    """
+    def __init__(self, forwarding, blocks, hazards):
+        self.forwarding = forwarding
+        self.blocks = blocks
+        self.hazards = hazards
+
+    def instructions(self):
+        return sum(timing.instructions for timing in self.blocks)
+
+    def stalls(self, kind = None):
+        """Returns the stall cycles of hazards of `kind`, or of all hazards."""
+        return sum(hazard.stalls for hazard in self.hazards if kind == None or hazard.kind == kind)
+
+    def cycles(self):
+        """Returns the cycles to run every instruction once, filling the pipeline included."""
+        if not self.blocks:
+            return 0
+        return sum(timing.cycles() for timing in self.blocks) + STAGES - 1
+
+    def cpi(self):
+        return self.cycles() / self.instructions() if self.blocks else 0.0
+
+def analyze(machine_words, clean_code, labels, forwarding = True):
+    """Takes the machine words of a program, the clean code they were assembled
+        from (`assembler.AsmLine` records or strings) and the labels dictionary,
+        and returns a `PipelineReport` for the pipeline with or without
+        `forwarding`."""
+    graph = control_flow.build_cfg(clean_code, labels)
+    timings = [BlockTiming(block) for block in graph.blocks]
+    hazards = []
+    latency, load_latency = latencies(forwarding)
+
+    #cycle each register can first be read in ID, and the instruction writing it
+    ready = {}
+    producers = {}
+    cycle = -1
+    for index, word in enumerate(machine_words):
+        timing = timings[graph.block_of[index]]
+        rd, sources = register_fields(word)
+
+        #wait for the registers read
+        issue = cycle + 1
+        stalled_on = None
+        for register in sources:
+            if register != 0 and ready.get(register, 0) > issue:
+                issue = ready[register]
+                stalled_on = register
+        if stalled_on != None:
+            producer = producers[stalled_on]
+            kind = LOAD_USE if forwarding and machine_words[producer] & 0x7f == LOAD_OPCODE else DATA
+            hazards.append(Hazard(index, kind, stalled_on, producer, issue - cycle - 1))
+            timing.data_stalls += issue - cycle - 1
+        cycle = issue
+
+        if rd:
+            ready[rd] = cycle + (load_latency if word & 0x7f == LOAD_OPCODE else latency)
+            producers[rd] = index
+
+        if is_taken(graph, index):
+            hazards.append(Hazard(index, CONTROL, None, None, BRANCH_PENALTY))
+            timing.control_stalls += BRANCH_PENALTY
+            cycle += BRANCH_PENALTY
+        if graph.records[index].command in ["jal", "jalr"]:
+            #the next instruction in the list does not run after a jump, its registers are not known
+            ready = {}
+
+    return PipelineReport(forwarding, timings, hazards)
+
+def latencies(forwarding):
+    """Returns a tuple of the cycles between the ID of an instruction and the
+        first ID that can use its result, for most instructions and for loads."""
+    if forwarding:
+        return (LATENCY_FORWARDING, LATENCY_LOAD_FORWARDING)
+    return (LATENCY_NO_FORWARDING, LATENCY_NO_FORWARDING)
+
+def register_fields(word):
+    """Returns a tuple of the register `word` writes (`None` if none) and the
+        tuple of registers it reads."""
+    used = OPCODE_REGISTERS.get(word & 0x7f)
+    if used == None:
+        return (None, ())
+    writes, reads_rs1, reads_rs2 = used
+    rd = (word >> 7) & 0x1f if writes else None
+    sources = ()
+    if reads_rs1:
+        sources += ((word >> 15) & 0x1f,)
+    if reads_rs2:
+        sources += ((word >> 20) & 0x1f,)
+    return (rd, sources)
+
+def is_taken(graph, index):
+    """Returns True if the branch or jump at `index` is counted as taken."""
+    command = graph.records[index].command
+    if command == "jal" or command == "jalr":
+        return True
+    if command not in control_flow.BRANCHES or index not in graph.targets:
+        return False
+    block = graph.blocks[graph.block_of[index]]
+    always = control_flow.FALLTHROUGH not in [kind for successor, kind in block.successors]
+    return always or graph.targets[index] <= index
+
+##############
+#
+# Reports
+#
+##############
+
+def write_report(machine_words, clean_code, labels, out = None, hazards = False):
+    """Writes the estimates without and with forwarding side by side, one row
+        per basic block and one for the whole program, to `out` (stderr by
+        default). If `hazards` is True every hazard found without forwarding
+        and with it is listed as well."""
+    out = out or sys.stderr
+    reports = [analyze(machine_words, clean_code, labels, forwarding) for forwarding in [False, True]]
+    records, is_text = assembler.lex_if_text(clean_code)
+
+    out.write("%-8s %-10s %6s | %-29s | %-29s\n" % ("", "", "", "no forwarding", "forwarding"))
+    out.write("%-8s %-10s %6s | %6s %6s %7s %6s | %6s %6s %7s %6s\n"
+              % ("block", "address", "instrs", "data", "ctrl", "cycles", "CPI", "data", "ctrl", "cycles", "CPI"))
+    for timings in zip(*[report.blocks for report in reports]):
+        block = timings[0].block
+        name = block.labels[0] if block.labels else "b%s" % block.number
+        columns = []
+        for timing in timings:
+            columns += [timing.data_stalls, timing.control_stalls, timing.cycles(), timing.cpi()]
+        out.write("%-8s 0x%08x %6s | %6s %6s %7s %6.2f | %6s %6s %7s %6.2f\n"
+                  % tuple([name[:8], assembler.index_to_address(block.start), timings[0].instructions] + columns))
+
+    columns = []
+    for report in reports:
+        columns += [report.stalls(LOAD_USE) + report.stalls(DATA), report.stalls(CONTROL), report.cycles(), report.cpi()]
+    out.write("%-8s %-10s %6s | %6s %6s %7s %6.2f | %6s %6s %7s %6.2f\n"
+              % tuple(["total", "", reports[0].instructions()] + columns))
+
+    if hazards:
+        for report in reports:
+            out.write("\nhazards %s forwarding:\n" % ("with" if report.forwarding else "without"))
+            for hazard in report.hazards:
+                if hazard.kind == CONTROL:
+                    cause = "taken branch"
+                else:
+                    cause = "x%s from 0x%08x" % (hazard.register, assembler.index_to_address(hazard.producer))
+                out.write("0x%08x  %-9s %-22s %s stall%s\t%s\n" % (assembler.index_to_address(hazard.index), hazard.kind,
+                          cause, hazard.stalls, "" if hazard.stalls == 1 else "s", records[hazard.index].instruction_text()))
+
+##############
+#
+# Command line
+#
+##############
+
+def parse_args():
+    """Parses the arguments to the pipeline analysis and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Estimates the cycles a 32-bit RISC-V program takes on a 5-stage\
+                                     pipeline, with and without forwarding.")
+    parser.add_argument("asm", type=argparse.FileType('r'), help="An asm file, see assembler.py --help.")
+    parser.add_argument("--out", "-o", type=argparse.FileType('w'), help="The output file, the console by\
+                        default.")
+    parser.add_argument("--hazards", action="store_true", help="List every hazard found.")
+    parser.add_argument("--pseudos", "-p", type=argparse.FileType('r'), help="A file defining more\
+                        pseudoinstructions, see assembler.py --help.")
+    return parser.parse_args()
+
+def main(args):
+    machine_words, clean_code, labels = assembler.assemble_program(args.asm.readlines(), assembler.load_pseudos(args))
+    write_report(machine_words, clean_code, labels, args.out or sys.stdout, args.hazards)
+
+
+if __name__== "__main__":
+    main(parse_args())
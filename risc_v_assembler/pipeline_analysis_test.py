@@ -0,0 +1,78 @@
+"""
+    Tests for the pipeline analysis of the CSSE232 Risc-V Assembler
+"""
+import assembler, pipeline_analysis
+import io, unittest
+
+LOOP = """main: addi t0, x0, 10
+          addi t1, x0, 0
+          loop: lw t2, 0(sp)
+          add t1, t1, t2
+          addi t0, t0, -1
+          bne t0, x0, loop
+          sw t1, 4(sp)""".split("\n")
+
+def analyze(lines, forwarding = True):
+    machine_words, clean_code, labels = assembler.assemble_program(lines)
+    return pipeline_analysis.analyze(machine_words, clean_code, labels, forwarding)
+
+def data_stalls(lines, forwarding = True):
+    return [(hazard.index, hazard.kind, hazard.stalls) for hazard in analyze(lines, forwarding).hazards]
+
+class TestPipelineAnalysis(unittest.TestCase):
+    def test_register_fields(self):
+        fields = pipeline_analysis.register_fields
+        self.assertEqual((5, (6, 7)), fields(assembler.encode("add", ["t0", "t1", "t2"])))
+        self.assertEqual((5, (2,)), fields(assembler.encode("lw", ["t0", "4(sp)"])))
+        self.assertEqual((None, (2, 5)), fields(assembler.encode("sw", ["t0", "4(sp)"])))
+        self.assertEqual((5, ()), fields(assembler.encode("lui", ["t0", "1"])))
+        self.assertEqual((None, (5, 0)), fields(assembler.encode("beq", ["t0", "x0", "8"])))
+
+    def test_load_use(self):
+        lines = ["lw t0, 0(sp)", "add t1, t0, t0"]
+        self.assertEqual([(1, pipeline_analysis.LOAD_USE, 1)], data_stalls(lines))
+        self.assertEqual([(1, pipeline_analysis.DATA, 2)], data_stalls(lines, False))
+
+        #one instruction in between hides the load with forwarding
+        lines = ["lw t0, 0(sp)", "addi t2, x0, 1", "add t1, t0, t0"]
+        self.assertEqual([], data_stalls(lines))
+        self.assertEqual([(2, pipeline_analysis.DATA, 1)], data_stalls(lines, False))
+
+    def test_alu_chains(self):
+        lines = ["addi t0, x0, 1", "addi t1, t0, 1", "addi t2, t1, 1", "add t3, t0, x0"]
+        self.assertEqual([], data_stalls(lines))
+        self.assertEqual([(1, pipeline_analysis.DATA, 2), (2, pipeline_analysis.DATA, 2)], data_stalls(lines, False))
+        #x0 is never waited for
+        self.assertEqual([], data_stalls(["add x0, t0, t0", "add t1, x0, x0"], False))
+
+    def test_control(self):
+        report = analyze(["beq t0, t1, 8", "addi t0, x0, 1", "jal x0, 4", "bne t0, t1, -4", "beq x0, x0, 4"])
+        self.assertEqual([(2, 2), (3, 2), (4, 2)],
+                         [(hazard.index, hazard.stalls) for hazard in report.hazards if hazard.kind == pipeline_analysis.CONTROL])
+
+    def test_jumps_forget_registers(self):
+        #the instruction after a jump runs after a return, not right after the jump
+        lines = ["lw t0, 0(sp)", "jal x0, 8", "add t1, t0, t0", "add t2, t0, t0"]
+        self.assertEqual([(1, pipeline_analysis.CONTROL, 2)], data_stalls(lines))
+
+    def test_blocks(self):
+        for forwarding, expected in [(False, [(2, 0, 0, 2), (4, 4, 2, 10), (1, 0, 0, 1)]),
+                                     (True, [(2, 0, 0, 2), (4, 1, 2, 7), (1, 0, 0, 1)])]:
+            report = analyze(LOOP, forwarding)
+            self.assertEqual(expected, [(timing.instructions, timing.data_stalls, timing.control_stalls, timing.cycles())
+                                        for timing in report.blocks])
+            self.assertEqual(sum(timing.cycles() for timing in report.blocks) + 4, report.cycles())
+        self.assertAlmostEqual(14 / 7, report.cpi())
+        self.assertAlmostEqual(1.75, report.blocks[1].cpi())
+
+    def test_report(self):
+        machine_words, clean_code, labels = assembler.assemble_program(LOOP)
+        out = io.StringIO()
+        pipeline_analysis.write_report(machine_words, clean_code, labels, out, hazards = True)
+        lines = out.getvalue().split("\n")
+        self.assertEqual("loop     0x00400008      4 |      4      2      10   2.50 |      1      2       7   1.75", lines[3])
+        self.assertEqual("total                    7 |      4      2      17   2.43 |      1      2      14   2.00", lines[5])
+        self.assertIn("0x0040000c  load-use  x7 from 0x00400008     1 stall\tadd t1, t1, t2", lines)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,7 +18,10 @@ def get_pseudoinstruction_defs():
     """Returns a dictionary mapping pseudoinstruction names to methods 
         that will translate a given pseudoinstruction call to a list of 
         core instructions. Each of these function should have the 
-        signature: `func(inst_string, line_num)`"""
+        signature: `func(inst_string, line_num)`
+
+        `inst_string` may also be an `assembler.AsmLine` record, in which case 
+        the function returns a list of records instead of strings."""
     pseudo_dict = {"double":double,
                    "diffsums":diffsums,
                    "push":push,
@@ -33,7 +36,9 @@ def get_pseudoinstruction_defs():
 # Individual definitions for pseudoinstructions
 #
 # Each of these functions should take in a string (e.g. "double t0, t1")
-# and the line number from the original code that is being translated.
+# or an AsmLine record and the line number from the original code that is 
+# being translated. The output is built with `make_instruction` so it 
+# matches the kind of input.
 # The line number is mostly for error tracing, but you may find it
 # useful for some pseudoinstructions.
 ##############
@@ -47,10 +52,10 @@ def double(instruction, line_number):
             `double r1, r2 -> Reg[r1] = 2 * r2`
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 3:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction double on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction double on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
 
     registers = split_instructions[1:3]
     for register in registers:
@@ -60,7 +65,7 @@ def double(instruction, line_number):
     rs1 = split_instructions[1]
     rs2 = split_instructions[2]
 
-    output = "add %s, %s, %s" % (rs1, rs2, rs2)
+    output = make_instruction(instruction, "add", rs1, rs2, rs2)
 
     return [output]
 
@@ -76,10 +81,10 @@ def diffsums(instruction, line_number):
             `diffsums t0, t0, t1, t0, t2`
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 6:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction diffsums on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction diffsums on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
     
     registers = split_instructions[1:6]
     for register in registers:
@@ -92,9 +97,9 @@ def diffsums(instruction, line_number):
     rs4 = split_instructions[4]
     rs5 = split_instructions[5]
     
-    first_sum = "add %s, %s, %s" % (rs2, rs2, rs3)
-    second_sum = "add %s, %s, %s" % (rs4, rs4, rs5)
-    difference = "sub %s, %s, %s" % (rs1, rs2, rs4)
+    first_sum = make_instruction(instruction, "add", rs2, rs2, rs3)
+    second_sum = make_instruction(instruction, "add", rs4, rs4, rs5)
+    difference = make_instruction(instruction, "sub", rs1, rs2, rs4)
 
     output = [first_sum, second_sum, difference]
 
@@ -109,17 +114,17 @@ def push(instruction, line_number):
             `push r1 -> sp = sp-4 ; Mem[sp] = r1`
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 2:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction push on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction push on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
     
     rs1 = split_instructions[1]
     if not assembler.is_register_name(rs1):
         raise assembler.BadRegister("Found invalid register name in psuedoinstruction push on line %s with args:\n\tpush %s\n" % (line_number, rs1))
 
-    add = "addi sp, sp, -4"
-    store = "sw %s, 0(sp)" % rs1
+    add = make_instruction(instruction, "addi", "sp", "sp", "-4")
+    store = make_instruction(instruction, "sw", rs1, "0(sp)")
     
     output = [add, store]
     
@@ -133,13 +138,14 @@ def li(instruction, line_number):
         Behavior:
             `li rd, imm -> rd = imm`
 
-        Assumes that imm can be up to 32 bits.
+        Assumes that imm can be up to 32 bits, signed or unsigned. Uses the
+        shortest sequence that loads it, see `materialize_constant`.
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 3:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction li on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction li on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
     
     rd = split_instructions[1]
     if not assembler.is_register_name(rd):
@@ -149,17 +155,11 @@ def li(instruction, line_number):
     if assembler.is_register_name(immediate):
         raise assembler.BadImmediate("Found invalid immediate value in psuedoinstruction li on line %s with args:\n\tli %s\n" % (line_number, immediate))
 
-    immediate_decimal = int(immediate)
-    if not (-2**32 <= immediate_decimal <= 2**32 - 1):
+    immediate_decimal = assembler.parse_immediate(immediate)
+    if not (-2**31 <= immediate_decimal <= 2**32 - 1):
         raise assembler.BadImmediate("Immediate value out of range for psuedoinstruction li on line %s with args:\n\tli %s\n" % (line_number, immediate))
 
-    immediate_binary = assembler.decimal_to_binary(immediate_decimal, 32)
-
-    load = "lui %s, %s" % (rd, immediate_binary[31:12])
-    add = "addi %s, %s, %s" % (rd, rd, immediate_binary[11:0])
-    output = [load, add]
-
-    return output
+    return [make_instruction(instruction, command, *operands) for command, operands in materialize_constant(rd, immediate_decimal)]
 
 def beqz(instruction, line_number):
     """Takes a string representing a call to the `beqz` pseudoinstruction. 
@@ -172,10 +172,10 @@ def beqz(instruction, line_number):
         Assumes LABEL should fit into 12 bits.
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 3:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction beqz on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction beqz on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
     
     rs1 = split_instructions[1]
     if not assembler.is_register_name(rs1):
@@ -183,7 +183,7 @@ def beqz(instruction, line_number):
     
     label = split_instructions[2]
 
-    output = "beq %s, x0, %s" % (rs1, label)
+    output = make_instruction(instruction, "beq", rs1, "x0", label)
    
     return [output]
 
@@ -198,10 +198,10 @@ def jalif(instruction, line_number):
         Assumes LABEL should fit into 20 bits.
         """
 
-    split_instructions = instruction.strip().replace(",", " ").split()
+    split_instructions = split_instruction(instruction)
 
     if len(split_instructions) != 4:
-        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction jalif on line %s with args:\n\t%s\n" % (line_number, instruction))
+        raise assembler.BadOperands("Found invalid number of operands for psuedoinstruction jalif on line %s with args:\n\t%s\n" % (line_number, source_text(instruction)))
     
     registers = split_instructions[1:3]
     for register in registers:
@@ -217,8 +217,8 @@ def jalif(instruction, line_number):
         if not (-2**20 <= label <= 2**20 - 1):
             raise assembler.BadImmediate("Immediate value out of range for psuedoinstruction jalif on line %s with args:\n\tjalif %s\n" % (line_number, label))
 
-    condition1 = "bne %s, %s, 8" % (rs1, rs2)
-    jump = "jal ra, %s" % (label)
+    condition1 = make_instruction(instruction, "bne", rs1, rs2, "8")
+    jump = make_instruction(instruction, "jal", "ra", str(label))
 
     output = [condition1, jump]
 
@@ -232,6 +232,52 @@ def jalif(instruction, line_number):
 #
 ##############
 
+def split_instruction(instruction):
+    """Returns the instruction name followed by its operands as a list. Takes
+        either a string or an `assembler.AsmLine` record, records are already 
+        tokenized so they are not split again."""
+    if type(instruction) == assembler.AsmLine:
+        return [instruction.command, *instruction.operands]
+    return instruction.strip().replace(",", " ").split()
+
+def source_text(instruction):
+    """Returns the pseudoinstruction call as written, for error messages. Takes
+        either a string or an `assembler.AsmLine` record."""
+    if type(instruction) == assembler.AsmLine:
+        return instruction.instruction_text()
+    return instruction
+
+def make_instruction(source, command, *operands):
+    """Builds a core instruction for a pseudoinstruction expansion. If `source` 
+        (the pseudoinstruction call) is an `assembler.AsmLine` record the result 
+        is a record carrying the same line number, otherwise it is a string."""
+    if type(source) == assembler.AsmLine:
+        return assembler.AsmLine(None, command, operands, source.line_number)
+    return "%s %s" % (command, ", ".join(operands))
+
+def materialize_constant(rd, value):
+    """Returns the shortest list of `(command, operands)` tuples that loads the
+        32-bit `value` (signed or unsigned) into register `rd`:
+
+        - `addi rd, x0, value` if it fits in a 12-bit signed immediate
+        - `lui rd, upper` if its lowest 12 bits are 0
+        - `lui rd, upper` and `addi rd, rd, lower` otherwise
+
+        `addi` sign extends `lower`, so when bit 11 of `value` is set `upper`
+        is one more than the top 20 bits of `value` to make up for it."""
+    value &= 0xffffffff
+    signed = value - (1 << 32) if value >> 31 else value
+    if -2048 <= signed <= 2047:
+        return [("addi", (rd, "x0", str(signed)))]
+
+    lower = value & 0xfff
+    if lower >> 11:
+        lower -= 1 << 12
+    upper = ((value - lower) >> 12) & 0xfffff
+    if lower == 0:
+        return [("lui", (rd, str(upper)))]
+    return [("lui", (rd, str(upper))), ("addi", (rd, rd, str(lower)))]
+
 def replace_all(old, new, list):
     """Replaces all instances of `old` with `new` in each string in the list `list`."""
 
@@ -0,0 +1,178 @@
+"""
+
+ Branch Relaxation
+
+ An optional pass of the CSSE232 Assembler (`--relax`) that runs after
+ `assembler.parse_labels` and rewrites every branch whose target is out
+ of the range of its 12-bit offset (-4096 to 4094 bytes) into the
+ inverted branch over a `jal x0`, which reaches 1 MB either way:
+
+    beq a0, a1, far         bne a0, a1, 8
+                     ->     jal x0, far
+
+ Every rewrite adds an instruction, which moves the code after it and
+ can push more branches out of range, so rewriting goes on until every
+ branch left is in range. Branches only ever get longer, so a branch
+ only has to be checked again when an instruction between it and its
+ target grew: each round rewrites every branch found out of range, the
+ grown instructions are counted in a `GrowthTree` (any offset in
+ O(log n)), and the branches still in range are kept in buckets of
+ `SPAN` instructions, the most one of them can span, so only the
+ branches in the buckets of the grown instructions that span one of
+ them are checked in the next round.
+
+ Labels and the numeric offsets of branches and jumps are computed
+ again for the new addresses. `jal`s out of range are left alone and
+ reported as usual.
+
+"""
+
+import bisect
+import assembler, control_flow
+
+BRANCHES = {"beq":"bne", "bne":"beq", "blt":"bge", "bge":"blt"}
+"""Dictionary mapping each branch to the branch with the inverted condition"""
+
+#offsets a branch can reach, in bytes
+BRANCH_RANGE = (-4096, 4094)
+
+#the most instructions a branch in range can span
+SPAN = -BRANCH_RANGE[0] // 4
+
+##############
+#
+# Relaxing
+#
+##############
+
+def relax(asm_lines, labels):
+    """Takes clean code (a list of `assembler.AsmLine` records or strings with
+        no labels or pseudoinstructions) and the labels dictionary, and returns
+        a tuple of the new code (of the same kind), the new labels dictionary
+        and the number of branches rewritten.
+
+        Programs with a numeric branch or jump offset that does not land on one
+        of their instructions (or just past the end) are returned unchanged,
+        since moving code would change where it goes. Branches with invalid
+        registers are left alone, the machine code pass reports those."""
+    records, is_text = assembler.lex_if_text(asm_lines)
+    size = len(records)
+    targets = {}
+    for index, record in enumerate(records):
+        if not control_flow.is_control_transfer(record) or record.command == "jalr":
+            continue
+        target = control_flow.jump_target(record, labels, index, size)
+        if target != None:
+            targets[index] = target
+        elif record.operands and assembler.is_int(record.operands[-1]):
+            return (asm_lines, labels, 0)
+
+    branches = [index for index in sorted(targets) if records[index].command in BRANCHES
+                and all(assembler.is_register_name(register) for register in records[index].operands[:2])]
+    relaxed = find_relaxed(branches, targets, size)
+    if not relaxed:
+        return (asm_lines, labels, 0)
+
+    #new index of every instruction (and of the end of the program)
+    new_index = []
+    grown = 0
+    for index in range(size + 1):
+        new_index.append(index + grown)
+        if index in relaxed:
+            grown += 1
+
+    new_records = []
+    for index, record in enumerate(records):
+        operands = record.operands
+        if index in relaxed:
+            new_records.append(assembler.AsmLine(record.label, BRANCHES[record.command], operands[:2] + ("8",), record.line_number))
+            record = assembler.AsmLine(None, "jal", ("x0", operands[2]), record.line_number)
+        if index in targets and assembler.is_int(operands[-1]):
+            offset = 4 * (new_index[targets[index]] - len(new_records))
+            record = assembler.AsmLine(record.label, record.command, record.operands[:-1] + (str(offset),), record.line_number)
+        new_records.append(record)
+
+    new_labels = {}
+    for label, address in labels.items():
+        index = (address - assembler.PC) // 4
+        if 0 <= index <= size and address % 4 == 0:
+            address = assembler.index_to_address(new_index[index])
+        new_labels[label] = address
+
+    if is_text:
+        new_records = assembler.records_to_text(new_records)
+    return (new_records, new_labels, len(relaxed))
+
+def find_relaxed(branches, targets, size):
+    """Takes the sorted indices of the `branches` of a program of `size`
+        instructions and the `targets` dictionary mapping each one to the index
+        of its target, and returns the set of the branches that have to be
+        rewritten for every other one to be in range."""
+    grown = GrowthTree(size)
+
+    def in_range(index):
+        target = targets[index]
+        if target > index:
+            offset = 4 * (target - index + grown.count(index, target))
+        else:
+            offset = -4 * (index - target + grown.count(target, index))
+        return BRANCH_RANGE[0] <= offset <= BRANCH_RANGE[1]
+
+    #branches in range, in buckets of SPAN instructions of the code they span
+    buckets = {}
+    work = []
+    for index in branches:
+        #nothing grew yet, the offset is the distance
+        if BRANCH_RANGE[0] <= 4 * (targets[index] - index) <= BRANCH_RANGE[1]:
+            low, high = sorted((index, targets[index]))
+            for bucket in range(low // SPAN, max(low, high - 1) // SPAN + 1):
+                buckets.setdefault(bucket, set()).add(index)
+        else:
+            work.append(index)
+
+    #grow every branch out of range at once, then look at the branches in
+    #range spanning one of them, until none goes out of range
+    relaxed = set()
+    while work:
+        for index in work:
+            relaxed.add(index)
+            grown.add(index)
+        work.sort()
+        candidates = set()
+        for bucket in set(index // SPAN for index in work):
+            candidates.update(buckets.get(bucket, ()))
+        grown_now = work
+        work = []
+        for other in candidates:
+            low, high = sorted((other, targets[other]))
+            if bisect.bisect_left(grown_now, low) < bisect.bisect_left(grown_now, high) and not in_range(other):
+                for bucket in range(low // SPAN, max(low, high - 1) // SPAN + 1):
+                    buckets[bucket].discard(other)
+                work.append(other)
+    return relaxed
+
+class GrowthTree():
+    """
+    A Fenwick tree counting the grown instructions of a program of `size`
+    instructions.
+    """
+    def __init__(self, size):
+        self.tree = [0] * (size + 1)
+
+    def add(self, index):
+        index += 1
+        while index < len(self.tree):
+            self.tree[index] += 1
+            index += index & -index
+
+    def before(self, index):
+        """Returns the number of grown instructions before `index`."""
+        total = 0
+        while index > 0:
+            total += self.tree[index]
+            index -= index & -index
+        return total
+
+    def count(self, start, end):
+        """Returns the number of grown instructions in `start` to `end - 1`."""
+        return self.before(end) - self.before(start)
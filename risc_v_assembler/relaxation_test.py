@@ -0,0 +1,93 @@
+"""
+    Tests for the branch relaxation of the CSSE232 Risc-V Assembler
+"""
+import assembler, relaxation, simulator
+import random, unittest
+
+FILLER = "add t0, t0, t1"
+
+def relaxed(lines):
+    clean_code, labels = assembler.parse_labels(assembler.lex_pass(lines))
+    records, labels, count = relaxation.relax(clean_code, labels)
+    return ([record.instruction_text() for record in records], labels, count)
+
+def naive_relaxed(branches, targets, size):
+    """Grows branches one round at a time, computing every address again."""
+    grown = set()
+    while True:
+        addresses = [0]
+        for index in range(size):
+            addresses.append(addresses[-1] + (8 if index in grown else 4))
+        out = [index for index in branches if index not in grown
+               and not -4096 <= addresses[targets[index]] - addresses[index] <= 4094]
+        if not out:
+            return grown
+        grown.update(out)
+
+class TestRelaxation(unittest.TestCase):
+    def test_in_range_unchanged(self):
+        lines = ["start: beq a0, a1, end"] + [FILLER] * 1000 + ["end: bne a0, a1, start"]
+        clean_code, labels = assembler.parse_labels(assembler.lex_pass(lines))
+        self.assertEqual(relaxation.relax(clean_code, labels), (clean_code, labels, 0))
+
+    def test_forward_and_backward(self):
+        lines = ["start: beq a0, a1, end"] + [FILLER] * 1100 + ["end: blt a0, a1, start"]
+        text, labels, count = relaxed(lines)
+        self.assertEqual(count, 2)
+        self.assertEqual(text[:2], ["bne a0, a1, 8", "jal x0, end"])
+        self.assertEqual(text[-2:], ["bge a0, a1, 8", "jal x0, start"])
+        self.assertEqual(labels, {"start":assembler.PC, "end":assembler.index_to_address(1102)})
+        assembler.machine_words_pass(*relaxation.relax(*assembler.parse_labels(assembler.lex_pass(lines)))[:2])
+
+    def test_out_of_range_fails_without_relaxing(self):
+        lines = ["beq a0, a1, end"] + [FILLER] * 1100 + ["end: " + FILLER]
+        with self.assertRaises(assembler.BadImmediate):
+            assembler.assemble_program(lines)
+        with self.assertRaises(assembler.BadImmediate):
+            assembler.assemble_program(["start: " + FILLER] + [FILLER] * 1100 + ["bne a0, a1, start"])
+        self.assertEqual(len(assembler.assemble_program(lines, relax = True)[0]), 1103)
+
+    def test_cascade(self):
+        #the first branch is just in range until the second one grows
+        lines = ["beq a0, a1, end", "bne a0, a1, far"] + [FILLER] * 1021 + ["end: " + FILLER] + [FILLER] * 100 + ["far: " + FILLER]
+        text, labels, count = relaxed(lines)
+        self.assertEqual(count, 2)
+        self.assertEqual(text[:4], ["bne a0, a1, 8", "jal x0, end", "beq a0, a1, 8", "jal x0, far"])
+
+    def test_numeric_offsets(self):
+        lines = ["bne a0, a1, 12", "beq a0, a1, far", FILLER, "jal x0, -12"] + [FILLER] * 1100 + ["far: " + FILLER]
+        text, labels, count = relaxed(lines)
+        self.assertEqual(count, 1)
+        self.assertEqual(text[:5], ["bne a0, a1, 16", "bne a0, a1, 8", "jal x0, far", FILLER, "jal x0, -16"])
+
+    def test_unknown_numeric_offset(self):
+        lines = ["beq a0, a1, far", "jal x0, 6"] + [FILLER] * 1100 + ["far: " + FILLER]
+        self.assertEqual(relaxed(lines)[2], 0)
+
+    def test_same_result_when_run(self):
+        #counts down a0 with the loop branch out of range
+        lines = ["addi a0, x0, 5", "addi a1, x0, 0", "loop: addi a1, a1, 3"] + ["add t0, t0, x0"] * 1030 + \
+                ["addi a0, a0, -1", "blt x0, a0, loop", "beq x0, x0, 8", "addi a1, x0, -1"]
+        words = assembler.assemble_program(lines, relax = True)[0]
+        machine = simulator.Simulator(words)
+        machine.run(max_steps = 100000)
+        self.assertEqual(machine.get_register("a1"), 15)
+
+    def test_matches_naive_relaxation(self):
+        generator = random.Random(232)
+        size = 6000
+        lines = []
+        for index in range(size):
+            if generator.random() < 0.3:
+                target = min(size - 1, max(0, index + int(generator.gauss(0, 900))))
+                lines.append("L%s: %s a0, a1, L%s" % (index, generator.choice(["beq", "bne", "blt", "bge"]), target))
+            else:
+                lines.append("L%s: %s" % (index, FILLER))
+        clean_code, labels = assembler.parse_labels(assembler.lex_pass(lines))
+        branches = [index for index, record in enumerate(clean_code) if record.command != "add"]
+        targets = {index:int(clean_code[index].operands[2][1:]) for index in branches}
+        self.assertEqual(relaxation.find_relaxed(branches, targets, size), naive_relaxed(branches, targets, size))
+        assembler.machine_words_pass(*relaxation.relax(clean_code, labels)[:2])
+
+if __name__ == '__main__':
+    unittest.main()
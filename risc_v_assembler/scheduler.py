@@ -0,0 +1,172 @@
+"""
+
+ Instruction Scheduler
+
+ An optional pass of the CSSE232 Assembler (`--schedule`) that reorders
+ the instructions of each basic block (see `control_flow`) so fewer of
+ them wait for the result of the one before, using the pipeline model
+ of `pipeline_analysis`: a load is moved away from the instruction using
+ its result, and dependent ALU instructions are interleaved with
+ independent ones.
+
+ Instructions only move past instructions they do not depend on: the
+ registers they read and write (rd, rs1 and rs2) and the order of a
+ `sw` with any other `lw` or `sw` are kept. The branch or jump ending a
+ block stays last and every block keeps its start and length, so labels
+ and branch offsets do not change. A block is only reordered if that
+ removes stalls.
+
+"""
+
+import assembler, control_flow, pipeline_analysis
+
+#blocks are scheduled in windows of at most this many instructions, so
+#huge straight line programs do not take quadratic time
+WINDOW = 256
+
+STORE_OPCODE = 0b0100011
+
+def schedule(asm_lines, labels, forwarding = True):
+    """Takes clean code (a list of `assembler.AsmLine` records or strings with
+        no labels or pseudoinstructions) and the labels dictionary, and returns
+        a tuple of the reordered code (of the same kind) and the number of
+        stall cycles saved on the pipeline with or without `forwarding`.
+
+        Blocks with an instruction that does not assemble are left alone."""
+    records, is_text = assembler.lex_if_text(asm_lines)
+    graph = control_flow.ControlFlowGraph(records, labels)
+    scheduled = list(records)
+    saved = 0
+
+    for block in graph.blocks:
+        for start in range(block.start, block.end, WINDOW):
+            end = min(start + WINDOW, block.end)
+            words = encode_all(records, labels, start, end)
+            if words == None or end - start < 2:
+                continue
+            order = schedule_window(words, forwarding, control_flow.is_control_transfer(records[end - 1]))
+            gain = stalls(words, forwarding) - stalls([words[position] for position in order], forwarding)
+            if gain <= 0:
+                continue
+            saved += gain
+            for position, index in enumerate(order):
+                scheduled[start + position] = records[start + index]
+
+    if is_text:
+        return (assembler.records_to_text(scheduled), saved)
+    return (scheduled, saved)
+
+def schedule_window(words, forwarding, fixed_last):
+    """Returns the new order of the machine `words` of part of a block, as a
+        list of positions in `words`. If `fixed_last` is True the last word
+        stays last.
+
+        A list scheduler: every cycle it issues the instruction that does not
+        stall (or stalls the least) and is furthest from the end of the
+        window along its chain of dependences."""
+    latency, load_latency = pipeline_analysis.latencies(forwarding)
+    fields = [pipeline_analysis.register_fields(word) for word in words]
+    successors, predecessor_counts = dependences(words, fields, latency, load_latency)
+    size = len(words)
+    if fixed_last:
+        for position in range(size - 1):
+            successors[position].append((size - 1, 0))
+            predecessor_counts[size - 1] += 1
+
+    #cycles from issuing each instruction to the end of the window, following dependences
+    heights = [0] * size
+    for position in range(size - 1, -1, -1):
+        heights[position] = max([delay + heights[successor] for successor, delay in successors[position]] + [0])
+
+    ready = [position for position in range(size) if predecessor_counts[position] == 0]
+    earliest = [0] * size
+    order = []
+    cycle = 0
+    while ready:
+        best = min(ready, key=lambda position: (max(earliest[position] - cycle, 0), -heights[position], position))
+        ready.remove(best)
+        order.append(best)
+        cycle = max(cycle, earliest[best])
+        for successor, delay in successors[best]:
+            earliest[successor] = max(earliest[successor], cycle + delay)
+            predecessor_counts[successor] -= 1
+            if predecessor_counts[successor] == 0:
+                ready.append(successor)
+        cycle += 1
+    return order
+
+def dependences(words, fields, latency, load_latency):
+    """Returns a tuple of the list of `(successor, delay)` tuples of each
+        instruction, where `delay` is the cycles the successor has to wait
+        for its result (0 for ordering only), and the number of predecessors
+        of each instruction."""
+    size = len(words)
+    successors = [[] for position in range(size)]
+    predecessor_counts = [0] * size
+    last_writer = {}
+    readers = {}
+    last_store = None
+    loads = []
+
+    def add(producer, consumer, delay):
+        successors[producer].append((consumer, delay))
+        predecessor_counts[consumer] += 1
+
+    for position, word in enumerate(words):
+        rd, sources = fields[position]
+        for register in set(sources):
+            if register != 0 and register in last_writer:
+                producer = last_writer[register]
+                add(producer, position, load_latency if words[producer] & 0x7f == pipeline_analysis.LOAD_OPCODE else latency)
+        if rd:
+            if rd in last_writer:
+                add(last_writer[rd], position, 0)
+            for reader in readers.get(rd, []):
+                add(reader, position, 0)
+            last_writer[rd] = position
+            readers[rd] = []
+        for register in set(sources):
+            if register != 0:
+                readers.setdefault(register, []).append(position)
+
+        opcode = word & 0x7f
+        if opcode == STORE_OPCODE:
+            for load in loads:
+                add(load, position, 0)
+            if last_store != None:
+                add(last_store, position, 0)
+            last_store = position
+            loads = []
+        elif opcode == pipeline_analysis.LOAD_OPCODE:
+            if last_store != None:
+                add(last_store, position, 0)
+            loads.append(position)
+    return (successors, predecessor_counts)
+
+def stalls(words, forwarding):
+    """Returns the data stall cycles of running the machine `words` in order,
+        starting with an empty pipeline."""
+    latency, load_latency = pipeline_analysis.latencies(forwarding)
+    ready = {}
+    cycle = -1
+    total = 0
+    for word in words:
+        rd, sources = pipeline_analysis.register_fields(word)
+        issue = max([cycle + 1] + [ready.get(register, 0) for register in sources if register != 0])
+        total += issue - cycle - 1
+        cycle = issue
+        if rd:
+            ready[rd] = cycle + (load_latency if word & 0x7f == pipeline_analysis.LOAD_OPCODE else latency)
+    return total
+
+def encode_all(records, labels, start, end):
+    """Returns the machine words of `records[start:end]`, or `None` if one of
+        them does not assemble."""
+    words = []
+    for index in range(start, end):
+        record = records[index]
+        try:
+            words.append(assembler.encode(record.command, record.operands, record.line_number, labels, index))
+        except Exception:
+            return None
+    return words
@@ -0,0 +1,86 @@
+"""
+    Tests for the instruction scheduler of the CSSE232 Risc-V Assembler
+"""
+import assembler, pipeline_analysis, scheduler, simulator
+import random, unittest
+
+REGISTERS = ["t0", "t1", "t2", "t3", "a0", "a1", "s0"]
+
+def scheduled(lines, forwarding = True):
+    clean_code, labels = assembler.parse_labels(assembler.lex_pass(lines))
+    records, saved = scheduler.schedule(clean_code, labels, forwarding)
+    return ([record.instruction_text() for record in records], saved)
+
+def random_block(generator, size):
+    lines = ["addi %s, x0, %s" % (register, generator.randrange(-50, 50)) for register in REGISTERS]
+    for count in range(size):
+        kind = generator.randrange(4)
+        rd, rs1, rs2 = [generator.choice(REGISTERS) for count in range(3)]
+        offset = -4 * generator.randrange(1, 8)
+        if kind == 0:
+            lines.append("lw %s, %s(sp)" % (rd, offset))
+        elif kind == 1:
+            lines.append("sw %s, %s(sp)" % (rs1, offset))
+        elif kind == 2:
+            lines.append("addi %s, %s, %s" % (rd, rs1, generator.randrange(-20, 20)))
+        else:
+            lines.append("%s %s, %s, %s" % (generator.choice(["add", "sub", "xor", "or", "and"]), rd, rs1, rs2))
+    return lines
+
+def final_state(lines):
+    machine = simulator.Simulator(assembler.assemble_program(lines)[0])
+    machine.run(max_steps = 10000)
+    top = machine.get_register("sp")
+    return ([machine.get_register(register) for register in REGISTERS],
+            [machine.read_word(top - 4 * offset) for offset in range(1, 8)])
+
+class TestScheduler(unittest.TestCase):
+    def test_load_use(self):
+        lines = ["lw t0, 0(sp)", "add t1, t0, t0", "lw t2, 4(sp)", "add t3, t2, t2", "addi a0, x0, 1"]
+        text, saved = scheduled(lines)
+        self.assertEqual(["lw t0, 0(sp)", "lw t2, 4(sp)", "add t1, t0, t0", "add t3, t2, t2", "addi a0, x0, 1"], text)
+        self.assertEqual(2, saved)
+
+    def test_alu_chains_without_forwarding(self):
+        lines = ["addi t0, x0, 1", "addi t1, t0, 1", "addi t2, x0, 2", "addi t3, t2, 2", "addi a0, x0, 3"]
+        text, saved = scheduled(lines, False)
+        self.assertEqual(["addi t0, x0, 1", "addi t2, x0, 2", "addi a0, x0, 3", "addi t1, t0, 1", "addi t3, t2, 2"], text)
+        self.assertEqual(4, saved)
+        #with forwarding nothing stalls, so nothing moves
+        self.assertEqual((lines, 0), scheduled(lines))
+
+    def test_dependences_kept(self):
+        #the store has to stay before the load, and t0 is written twice
+        for lines in [["sw t1, 0(sp)", "lw t0, 0(sp)", "add t2, t0, t0"],
+                      ["lw t0, 0(sp)", "add t1, t0, t0", "addi t0, x0, 1"],
+                      ["lw t0, 0(sp)", "sw t0, 4(sp)", "lw t1, 4(sp)"]]:
+            self.assertEqual(lines, scheduled(lines)[0][:len(lines)])
+
+    def test_blocks_and_labels(self):
+        #the branch stays last and the labelled instructions stay first
+        lines = ["start: lw t0, 0(sp)", "add t1, t0, t0", "addi t2, x0, 1", "bne t1, t2, 20",
+                 "loop: lw a0, 0(sp)", "add a1, a0, a0", "addi s0, x0, 1", "beq a1, s0, loop"]
+        text, saved = scheduled(lines)
+        self.assertEqual(["lw t0, 0(sp)", "addi t2, x0, 1", "add t1, t0, t0", "bne t1, t2, 20",
+                          "lw a0, 0(sp)", "addi s0, x0, 1", "add a1, a0, a0", "beq a1, s0, loop"], text)
+        self.assertEqual(2, saved)
+
+    def test_errors_not_hidden(self):
+        lines = ["lw t0, 0(sp)", "add t1, t0, t0", "addi t2, x0, 5000"]
+        self.assertEqual((lines, 0), scheduled(lines))
+        self.assertRaises(assembler.BadImmediate, assembler.assemble_program, lines, schedule = "forwarding")
+
+    def test_same_results(self):
+        generator = random.Random(232)
+        for count in range(40):
+            lines = random_block(generator, generator.randrange(5, 40))
+            for mode in ["forwarding", "no-forwarding"]:
+                words, clean_code, labels = assembler.assemble_program(lines, schedule = mode)
+                text = [record.instruction_text() for record in clean_code]
+                self.assertEqual(final_state(lines), final_state(text), msg=lines)
+                before = pipeline_analysis.analyze(*assembler.assemble_program(lines), forwarding = mode == "forwarding")
+                after = pipeline_analysis.analyze(words, clean_code, labels, forwarding = mode == "forwarding")
+                self.assertLessEqual(after.cycles(), before.cycles())
+
+if __name__ == '__main__':
+    unittest.main()
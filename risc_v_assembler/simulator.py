@@ -0,0 +1,523 @@
+"""
+
+ Simulator
+
+ A functional simulator for the RV32 instructions the CSSE232 Assembler
+ supports, so assembled programs can be run against test inputs right
+ after assembly.
+
+ Every word of the text segment is decoded once into a small tuple (an
+ operation number and its operands, with branch targets already turned
+ into instruction indices), and `Simulator.run` executes those tuples in
+ a single dispatch loop. Memory is one `bytearray` starting at
+ `assembler.PC` holding the text segment, with the stack at the top,
+ and the data segment of the program (see `data_segment`) is another one
+ at its own address.
+
+ A program stops when it runs off the end of the text segment or returns
+ to the address initially in `ra`.
+
+ Usage:
+    python3 simulator.py program.asm --set a0=5 --dump-registers
+    python3 simulator.py program.bin --raw --max-steps 1000000 --dump-memory 0x00400000:64
+
+"""
+
+import sys, argparse
+import assembler, disassembler, data_segment
+
+DEFAULT_MEMORY_SIZE = 1024 * 1024
+"""Default size of the simulated memory in bytes, text segment included"""
+
+MASK = 0xffffffff
+
+#operations of the predecoded instructions, the most common ones first
+#since the dispatch loop tests them in this order
+(ADDI, ADD, LW, SW, BEQ, BNE, BLT, BGE, JAL, JALR, LUI, SUB, SLLI, SRLI, SRAI,
+ ANDI, ORI, XORI, AND, OR, XOR, SLL, SRL, SRA, SLT, HALT, TRAP) = range(27)
+
+OPERATIONS = {"addi":ADDI, "add":ADD, "lw":LW, "sw":SW, "beq":BEQ, "bne":BNE, "blt":BLT, "bge":BGE,
+              "jal":JAL, "jalr":JALR, "lui":LUI, "sub":SUB, "slli":SLLI, "srli":SRLI, "srai":SRAI,
+              "andi":ANDI, "ori":ORI, "xori":XORI, "and":AND, "or":OR, "xor":XOR, "sll":SLL,
+              "srl":SRL, "sra":SRA, "slt":SLT}
+"""Dictionary mapping instruction names to their operation in predecoded instructions"""
+
+#writes to x0 go to this extra register, which is never read, so the
+#dispatch loop does not need to check for x0
+SCRATCH = 32
+
+MAX_BLOCK_SIZE = 64
+"""Most instructions compiled into one block, see `Simulator.compile_block`"""
+
+#python code run for each operation in a compiled block. `r` is the list of
+#registers, `m` the memory and `d` the data segment as words. Memory accesses
+#that fail return -(index + 2) so the instruction is run again, one step at
+#a time, to raise the error. Stores into the text segment return -(index + 3)
+#to end the block right after them, so the rest runs the new instructions
+BLOCK_TEMPLATES = {
+    ADDI:"r[%(rd)s] = (r[%(rs1)s] + %(imm)s) & 0xffffffff",
+    ADD:"r[%(rd)s] = (r[%(rs1)s] + r[%(rs2)s]) & 0xffffffff",
+    LW:"a = ((r[%(rs1)s] + %(imm)s) & 0xffffffff) - %(base)s\n"
+       "if a & 3 or not 0 <= a < %(memory_size)s:\n"
+       "    a -= %(data_offset)s\n"
+       "    if a & 3 or not 0 <= a < %(data_size)s: return %(fault)s\n"
+       "    r[%(rd)s] = d[a >> 2]\n"
+       "else:\n"
+       "    r[%(rd)s] = m[a >> 2]",
+    SW:"a = ((r[%(rs1)s] + %(imm)s) & 0xffffffff) - %(base)s\n"
+       "if a & 3 or not 0 <= a < %(memory_size)s:\n"
+       "    a -= %(data_offset)s\n"
+       "    if a & 3 or not 0 <= a < %(data_size)s: return %(fault)s\n"
+       "    d[a >> 2] = r[%(rs2)s]\n"
+       "else:\n"
+       "    m[a >> 2] = r[%(rs2)s]\n"
+       "    if a < %(text_end)s:\n"
+       "        invalidate(a >> 2)\n"
+       "        return %(resume)s",
+    BEQ:"return %(target)s if r[%(rs1)s] == r[%(rs2)s] else %(next)s",
+    BNE:"return %(target)s if r[%(rs1)s] != r[%(rs2)s] else %(next)s",
+    BLT:"return %(target)s if (r[%(rs1)s] ^ 0x80000000) < (r[%(rs2)s] ^ 0x80000000) else %(next)s",
+    BGE:"return %(target)s if (r[%(rs1)s] ^ 0x80000000) >= (r[%(rs2)s] ^ 0x80000000) else %(next)s",
+    JAL:"r[%(rd)s] = %(link)s\n"
+        "return %(target)s",
+    JALR:"a = ((r[%(rs1)s] + %(imm)s) & 0xfffffffe) - %(base)s\n"
+         "r[%(rd)s] = %(link)s\n"
+         "return a >> 2 if a & 3 == 0 and 0 <= a <= %(text_end)s else %(trap)s",
+    LUI:"r[%(rd)s] = %(imm)s",
+    SUB:"r[%(rd)s] = (r[%(rs1)s] - r[%(rs2)s]) & 0xffffffff",
+    SLLI:"r[%(rd)s] = (r[%(rs1)s] << %(imm)s) & 0xffffffff",
+    SRLI:"r[%(rd)s] = r[%(rs1)s] >> %(imm)s",
+    SRAI:"r[%(rd)s] = (((r[%(rs1)s] ^ 0x80000000) - 0x80000000) >> %(imm)s) & 0xffffffff",
+    ANDI:"r[%(rd)s] = r[%(rs1)s] & %(imm)s",
+    ORI:"r[%(rd)s] = r[%(rs1)s] | %(imm)s",
+    XORI:"r[%(rd)s] = r[%(rs1)s] ^ %(imm)s",
+    AND:"r[%(rd)s] = r[%(rs1)s] & r[%(rs2)s]",
+    OR:"r[%(rd)s] = r[%(rs1)s] | r[%(rs2)s]",
+    XOR:"r[%(rd)s] = r[%(rs1)s] ^ r[%(rs2)s]",
+    SLL:"r[%(rd)s] = (r[%(rs1)s] << (r[%(rs2)s] & 0x1f)) & 0xffffffff",
+    SRL:"r[%(rd)s] = r[%(rs1)s] >> (r[%(rs2)s] & 0x1f)",
+    SRA:"r[%(rd)s] = (((r[%(rs1)s] ^ 0x80000000) - 0x80000000) >> (r[%(rs2)s] & 0x1f)) & 0xffffffff",
+    SLT:"r[%(rd)s] = 1 if (r[%(rs1)s] ^ 0x80000000) < (r[%(rs2)s] ^ 0x80000000) else 0"}
+"""Dictionary mapping each operation to the python code it compiles to"""
+
+#operations that end a block
+CONTROL_OPERATIONS = [BEQ, BNE, BLT, BGE, JAL, JALR]
+
+class BadAddress(Exception):
+    """Indicates that a program accessed memory outside the simulated memory, or jumped outside the text segment."""
+    pass
+
+def predecode(word, index, size):
+    """Decodes the machine word at instruction `index` of a text segment of
+        `size` instructions into a tuple of `(operation, rd, rs1, rs2, immediate)`.
+        Immediates are unsigned 32-bit values, except for branches and jumps
+        whose immediate is the index of the target instruction (`size + 1`, the
+        trap entry, if the target is outside the text segment). Words that are
+        not instructions become `TRAP`."""
+    command = disassembler.instruction_name(word)
+    if command == None:
+        return (TRAP, 0, 0, 0, word)
+
+    operation = OPERATIONS[command]
+    rd = (word >> 7) & 0x1f or SCRATCH
+    rs1 = (word >> 15) & 0x1f
+    rs2 = (word >> 20) & 0x1f
+    instruction_type = assembler.instructions_to_types[command]
+
+    if instruction_type == assembler.Types.SB:
+        return (operation, 0, rs1, rs2, branch_index(index, disassembler.SB_offset(word), size))
+    if instruction_type == assembler.Types.UJ:
+        return (operation, rd, 0, 0, branch_index(index, disassembler.UJ_offset(word), size))
+    if instruction_type == assembler.Types.U:
+        return (operation, rd, 0, 0, word & 0xfffff000)
+    if instruction_type == assembler.Types.S:
+        return (operation, 0, rs1, rs2, disassembler.sign_extend(((word >> 25) << 5) | ((word >> 7) & 0x1f), 12) & MASK)
+    if instruction_type == assembler.Types.R:
+        return (operation, rd, rs1, rs2, 0)
+    if assembler.is_shift_immediate_instance(command):
+        return (operation, rd, rs1, 0, rs2)
+    return (operation, rd, rs1, 0, disassembler.sign_extend(word >> 20, 12) & MASK)
+
+def branch_index(index, offset, size):
+    """Returns the index of the instruction `offset` bytes from instruction
+        `index`, or the index of the trap entry if that is not an instruction
+        (index `size`, just past the end, is where programs stop)."""
+    if offset % 4 or not 0 <= index + offset // 4 <= size:
+        return size + 1
+    return index + offset // 4
+
+class Simulator():
+    """
+    A simulated RV32 machine running the machine words `words` loaded at
+    `assembler.PC`, with `memory_size` bytes of memory, and the bytes of
+    `data` (a `data_segment.DataSegment`, or bytes loaded at
+    `data_segment.DATA`) in a data segment of their size. `registers` holds
+    the 32 registers as unsigned 32-bit integers (plus the scratch register
+    written instead of x0), `pc` the address of the next instruction and
+    `steps` the number of instructions run so far.
+    """
+    def __init__(self, words, memory_size = DEFAULT_MEMORY_SIZE, base = None, compile_blocks = True, data = None):
+        self.base = assembler.PC if base == None else base
+        words = disassembler.to_words(words)
+        if memory_size % 4 or memory_size < 4 * len(words):
+            raise ValueError("Memory size must be a multiple of 4 bytes and hold the %s instructions" % len(words))
+
+        self.memory = bytearray(memory_size)
+        #a view of the memory as 32-bit words, in the byte order of this machine
+        self.memory_words = memoryview(self.memory).cast(disassembler.WORD_TYPECODE)
+        self.memory_words[:len(words)] = words
+        self.text_size = len(words)
+
+        #the data segment, padded to whole words
+        self.data_base = data.base if isinstance(data, data_segment.DataSegment) else data_segment.DATA
+        data = bytes(data.buffer if isinstance(data, data_segment.DataSegment) else data or b"")
+        self.data = bytearray(data + bytes(-len(data) % 4))
+        self.data_words = memoryview(self.data).cast(disassembler.WORD_TYPECODE)
+        self.data_words[:] = disassembler.to_words(self.data)
+
+        #the predecoded text segment, followed by the halt and trap entries
+        #that jumps past the end of the program land on
+        self.code = [predecode(word, index, len(words)) for index, word in enumerate(words)]
+        self.code.append((HALT, 0, 0, 0, 0))
+        self.code.append((TRAP, 0, 0, 0, None))
+
+        #straight line runs of instructions compiled to python functions the
+        #first time they run, by the index of their first instruction
+        self.compile_blocks = compile_blocks
+        self.blocks = [None] * len(self.code)
+        self.block_sizes = [0] * len(self.code)
+
+        self.registers = [0] * 33
+        #the stack starts at the top of memory, and returning from the
+        #program (jumping to `ra`) ends it
+        self.registers[2] = (self.base + memory_size) & MASK
+        self.registers[1] = self.end_address()
+        self.pc = self.base
+        self.steps = 0
+
+    def end_address(self):
+        """Returns the address just after the text segment, jumping there ends the program."""
+        return self.base + 4 * self.text_size
+
+    def run(self, max_steps = None):
+        """Runs until the program ends or `max_steps` instructions have been
+            run. Returns `True` if the program ended, `False` if it ran out of
+            steps.
+
+            Raises `BadAddress` on a memory access outside the memory (or not
+            word aligned) or a jump outside the text segment, and
+            `assembler.BadInstruction` on a word that is not an instruction."""
+        pc = (self.pc - self.base) >> 2
+        if not 0 <= pc <= self.text_size or (self.pc - self.base) & 3:
+            raise BadAddress("Program counter outside the text segment: %s" % hex(self.pc))
+
+        remaining = budget = (1 << 62) if max_steps == None else max_steps
+        if self.compile_blocks:
+            pc, remaining = self.run_blocks(pc, remaining)
+        pc, remaining = self.run_steps(pc, remaining)
+
+        self.steps += budget - remaining
+        self.pc = self.base + 4 * pc
+        if pc == self.text_size:
+            return True
+        if remaining:
+            #stopped at an instruction that can not run
+            self.fault(pc)
+        return False
+
+    def run_blocks(self, pc, remaining):
+        """Runs compiled blocks from index `pc` while a whole block fits in the
+            `remaining` steps. Returns the index of the next instruction and the
+            steps left, the rest is left to `run_steps`."""
+        blocks = self.blocks
+        block_sizes = self.block_sizes
+        halt = self.text_size
+        while pc < halt:
+            block = blocks[pc]
+            if block == None:
+                block = self.compile_block(pc)
+                if block == None:
+                    break
+            size = block_sizes[pc]
+            if size > remaining:
+                break
+
+            next_pc = block()
+            if next_pc < 0:
+                #the block stopped early, after a store into the text or right
+                #before a memory access that failed
+                next_pc = -next_pc - 2
+                remaining -= next_pc - pc
+                if next_pc == pc:
+                    break
+                pc = next_pc
+                continue
+            remaining -= size
+            pc = next_pc
+        return (pc, remaining)
+
+    def compile_block(self, first):
+        """Compiles the instructions from index `first` up to the first branch or
+            jump (at most `MAX_BLOCK_SIZE` of them) into a python function that
+            runs them and returns the index of the next instruction. Returns the
+            function, or `None` if the instruction at `first` is not valid."""
+        lines = ["def block():"]
+        index = first
+        operation = None
+        while index < self.text_size and index - first < MAX_BLOCK_SIZE:
+            operation, rd, rs1, rs2, immediate = self.code[index]
+            if operation == TRAP:
+                break
+            #writes to x0 do nothing, unless the instruction also jumps
+            if rd != SCRATCH or operation in CONTROL_OPERATIONS or operation in [LW, SW]:
+                fields = {"rd":rd, "rs1":rs1, "rs2":rs2, "imm":immediate, "next":index + 1, "target":immediate,
+                          "link":self.base + 4 * (index + 1), "base":self.base, "memory_size":len(self.memory),
+                          "data_offset":self.data_base - self.base, "data_size":len(self.data),
+                          "text_end":4 * self.text_size, "trap":self.text_size + 1, "fault":-(index + 2),
+                          "resume":-(index + 3)}
+                for line in (BLOCK_TEMPLATES[operation] % fields).split("\n"):
+                    lines.append("    " + line)
+            index += 1
+            if operation in CONTROL_OPERATIONS:
+                break
+
+        if index == first:
+            return None
+        if operation not in CONTROL_OPERATIONS:
+            lines.append("    return %s" % index)
+
+        namespace = {"r":self.registers, "m":self.memory_words, "d":self.data_words, "invalidate":self.invalidate}
+        exec(compile("\n".join(lines), "<block %s>" % hex(self.base + 4 * first), "exec"), namespace)
+        self.blocks[first] = namespace["block"]
+        self.block_sizes[first] = index - first
+        return namespace["block"]
+
+    def invalidate(self, index):
+        """Decodes the instruction at `index` again after the program wrote over
+            it, and drops the compiled blocks holding it. A compiled store into the
+            text ends its block right after calling this, so the new instruction
+            is the one that runs even if it was in the same block."""
+        self.code[index] = predecode(self.memory_words[index], index, self.text_size)
+        for first in range(max(0, index - MAX_BLOCK_SIZE + 1), index + 1):
+            if self.blocks[first] != None and first + self.block_sizes[first] > index:
+                self.blocks[first] = None
+
+    def run_steps(self, pc, remaining):
+        """Runs the predecoded instructions one at a time from index `pc` for at
+            most `remaining` steps. Returns the index of the next instruction and
+            the steps left. Stops early at the end of the program or at an
+            instruction that can not run."""
+        code = self.code
+        registers = self.registers
+        memory_words = self.memory_words
+        data_words = self.data_words
+        base = self.base
+        memory_size = len(self.memory)
+        data_offset = self.data_base - base
+        data_size = len(self.data)
+        text_end = 4 * self.text_size
+        halt = self.text_size
+
+        while remaining:
+            remaining -= 1
+            operation, rd, rs1, rs2, immediate = code[pc]
+            pc += 1
+
+            if operation == ADDI:
+                registers[rd] = (registers[rs1] + immediate) & MASK
+            elif operation == ADD:
+                registers[rd] = (registers[rs1] + registers[rs2]) & MASK
+            elif operation == LW:
+                offset = ((registers[rs1] + immediate) & MASK) - base
+                if offset & 3 or not 0 <= offset < memory_size:
+                    offset -= data_offset
+                    if offset & 3 or not 0 <= offset < data_size:
+                        break
+                    registers[rd] = data_words[offset >> 2]
+                else:
+                    registers[rd] = memory_words[offset >> 2]
+            elif operation == SW:
+                offset = ((registers[rs1] + immediate) & MASK) - base
+                if offset & 3 or not 0 <= offset < memory_size:
+                    offset -= data_offset
+                    if offset & 3 or not 0 <= offset < data_size:
+                        break
+                    data_words[offset >> 2] = registers[rs2]
+                else:
+                    memory_words[offset >> 2] = registers[rs2]
+                    if offset < text_end:
+                        #the program wrote over its own code
+                        self.invalidate(offset >> 2)
+            elif operation == BEQ:
+                if registers[rs1] == registers[rs2]:
+                    pc = immediate
+            elif operation == BNE:
+                if registers[rs1] != registers[rs2]:
+                    pc = immediate
+            elif operation == BLT:
+                if (registers[rs1] ^ 0x80000000) < (registers[rs2] ^ 0x80000000):
+                    pc = immediate
+            elif operation == BGE:
+                if (registers[rs1] ^ 0x80000000) >= (registers[rs2] ^ 0x80000000):
+                    pc = immediate
+            elif operation == JAL:
+                registers[rd] = (base + 4 * pc) & MASK
+                pc = immediate
+            elif operation == JALR:
+                target = ((registers[rs1] + immediate) & 0xfffffffe) - base
+                registers[rd] = (base + 4 * pc) & MASK
+                pc = target >> 2 if target & 3 == 0 and 0 <= target <= text_end else halt + 1
+            elif operation == LUI:
+                registers[rd] = immediate
+            elif operation == SUB:
+                registers[rd] = (registers[rs1] - registers[rs2]) & MASK
+            elif operation == SLLI:
+                registers[rd] = (registers[rs1] << immediate) & MASK
+            elif operation == SRLI:
+                registers[rd] = registers[rs1] >> immediate
+            elif operation == SRAI:
+                registers[rd] = (((registers[rs1] ^ 0x80000000) - 0x80000000) >> immediate) & MASK
+            elif operation == ANDI:
+                registers[rd] = registers[rs1] & immediate
+            elif operation == ORI:
+                registers[rd] = registers[rs1] | immediate
+            elif operation == XORI:
+                registers[rd] = registers[rs1] ^ immediate
+            elif operation == AND:
+                registers[rd] = registers[rs1] & registers[rs2]
+            elif operation == OR:
+                registers[rd] = registers[rs1] | registers[rs2]
+            elif operation == XOR:
+                registers[rd] = registers[rs1] ^ registers[rs2]
+            elif operation == SLL:
+                registers[rd] = (registers[rs1] << (registers[rs2] & 0x1f)) & MASK
+            elif operation == SRL:
+                registers[rd] = registers[rs1] >> (registers[rs2] & 0x1f)
+            elif operation == SRA:
+                registers[rd] = (((registers[rs1] ^ 0x80000000) - 0x80000000) >> (registers[rs2] & 0x1f)) & MASK
+            elif operation == SLT:
+                registers[rd] = 1 if (registers[rs1] ^ 0x80000000) < (registers[rs2] ^ 0x80000000) else 0
+            else:
+                #halt or trap, not an instruction of the program
+                break
+
+        else:
+            #ran out of steps
+            return (pc, remaining)
+
+        #the last instruction fetched did not run
+        return (pc - 1, remaining + 1)
+
+    def fault(self, pc):
+        """Raises the error for the instruction at index `pc`, which could not run."""
+        operation, rd, rs1, rs2, immediate = self.code[pc]
+        if operation in [LW, SW]:
+            address = (self.registers[rs1] + immediate) & MASK
+            raise BadAddress("Bad memory access at %s: address %s is outside memory or not word aligned"
+                             % (hex(self.pc), hex(address)))
+        if immediate == None:
+            raise BadAddress("Jump outside the text segment after %s steps" % self.steps)
+        raise assembler.BadInstruction("Unknown instruction word at %s: 0x%08x" % (hex(self.pc), immediate))
+
+    ##############
+    #
+    # Registers and memory
+    #
+    ##############
+
+    def get_register(self, name):
+        """Returns the value of a register (by name) as an unsigned integer."""
+        return self.registers[assembler.get_register_number(name)]
+
+    def set_register(self, name, value):
+        """Sets a register (by name) to `value`, negative values are stored in two's complement."""
+        number = assembler.get_register_number(name)
+        if number != 0:
+            self.registers[number] = value & MASK
+
+    def read_word(self, address):
+        words, index = self.word_index(address)
+        return words[index]
+
+    def write_word(self, address, value):
+        words, index = self.word_index(address)
+        words[index] = value & MASK
+        if words is self.memory_words and index < self.text_size:
+            self.invalidate(index)
+
+    def word_index(self, address):
+        """Returns a tuple of the words holding `address` (the memory or the
+            data segment) and the index of its word."""
+        offset = address - self.base
+        if offset & 3 == 0 and 0 <= offset < len(self.memory):
+            return (self.memory_words, offset >> 2)
+        offset = address - self.data_base
+        if offset & 3 == 0 and 0 <= offset < len(self.data):
+            return (self.data_words, offset >> 2)
+        raise BadAddress("Address %s is outside memory or not word aligned" % hex(address))
+
+    def dump_registers(self, out = None):
+        """Writes every register in hex and signed decimal, four per line."""
+        out = out or sys.stdout
+        out.write("pc = %s  steps = %s\n" % (hex(self.pc), self.steps))
+        for number in range(32):
+            value = self.registers[number]
+            out.write("%-4s %08x %11d%s" % (disassembler.REGISTER_NAMES[number], value,
+                                            disassembler.sign_extend(value, 32), "\n" if number % 4 == 3 else "   "))
+
+    def dump_memory(self, address, length, out = None):
+        """Writes `length` bytes of memory starting at `address` as hex words,
+            four per line."""
+        out = out or sys.stdout
+        words, start = self.word_index(address)
+        words = words[start:start + -(-length // 4)].tolist()
+        for i in range(0, len(words), 4):
+            out.write("%08x: %s\n" % (address + 4 * i, " ".join("%08x" % word for word in words[i:i + 4])))
+
+def parse_args():
+    """Parses the arguments to the simulator and returns them as a
+        argparse.Namespace object."""
+    parser = argparse.ArgumentParser(description="Runs a 32-bit RISC-V program.")
+    parser.add_argument("program", type=argparse.FileType('rb'), help="An asm file, or a raw image with --raw.")
+    parser.add_argument("--raw", action="store_true", help="The program is a raw little-endian image, as written\
+                        by assembler.py --format raw.")
+    parser.add_argument("--max-steps", type=int, default=10000000, help="Stop after this many instructions.\
+                        Defaults to 10000000.")
+    parser.add_argument("--memory", type=int, default=DEFAULT_MEMORY_SIZE, help="Memory size in bytes, starting at\
+                        0x00400000. The stack pointer starts at the top.")
+    parser.add_argument("--set", action="append", default=[], metavar="REG=VALUE", help="Set a register before\
+                        running, e.g. --set a0=5. Can be given many times.")
+    parser.add_argument("--dump-registers", "-r", action="store_true", help="Print the registers at the end.")
+    parser.add_argument("--dump-memory", action="append", default=[], metavar="ADDRESS:LENGTH", help="Print\
+                        LENGTH bytes of memory from ADDRESS at the end, e.g. 0x00400000:64.")
+    return parser.parse_args()
+
+def main(args):
+    program = args.program.read()
+    data = data_segment.DataSegment()
+    if(args.raw):
+        words = disassembler.to_words(program)
+    else:
+        words = assembler.assemble_program(program.decode().splitlines(), data = data)[0]
+
+    simulator = Simulator(words, args.memory, data = data)
+    for setting in args.set:
+        name, value = setting.split("=")
+        simulator.set_register(name.strip(), int(value, 0))
+
+    ended = simulator.run(args.max_steps)
+    if(not ended):
+        sys.stderr.write("Stopped after %s steps without ending\n" % simulator.steps)
+
+    if(args.dump_registers):
+        simulator.dump_registers()
+    for dump in args.dump_memory:
+        address, length = dump.split(":")
+        simulator.dump_memory(int(address, 0), int(length, 0))
+
+    if(not ended):
+        sys.exit(1)
+
+
+if __name__== "__main__":
+    main(parse_args())
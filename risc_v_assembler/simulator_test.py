@@ -0,0 +1,186 @@
+"""
+    Tests for the simulator of the CSSE232 Risc-V Assembler
+"""
+import assembler, simulator, benchmark, data_segment
+import io, unittest
+
+def load(text, **options):
+    words = assembler.assemble_program(text.split("\n"))[0]
+    return simulator.Simulator(words, **options)
+
+fibonacci = """
+        addi t0, x0, 0      ; fib(0)
+        addi t1, x0, 1      ; fib(1)
+        beq a0, x0, done
+    loop:
+        add t2, t0, t1
+        add t0, x0, t1
+        add t1, x0, t2
+        addi a0, a0, -1
+        bne a0, x0, loop
+    done:
+        add a0, x0, t0"""
+
+stack = """
+        addi s0, x0, 10
+        addi t0, x0, 0
+    fill:
+        push s0
+        addi t0, t0, 1
+        addi s0, s0, -1
+        blt x0, s0, fill
+        addi t1, x0, 0
+    drain:
+        lw t2, 0(sp)
+        addi sp, sp, 4
+        add t1, t1, t2
+        addi t0, t0, -1
+        bne t0, x0, drain
+        jalr x0, 0(ra)      ; return ends the program
+        addi t1, x0, -1     ; never runs"""
+
+class TestSimulator(unittest.TestCase):
+    def test_fibonacci(self):
+        for compile_blocks in [True, False]:
+            machine = load(fibonacci, compile_blocks=compile_blocks)
+            machine.set_register("a0", 30)
+            self.assertTrue(machine.run())
+            self.assertEqual(832040, machine.get_register("a0"))
+            self.assertEqual(machine.end_address(), machine.pc)
+            self.assertEqual(3 + 5 * 30 + 1, machine.steps)
+
+    def test_stack_and_return(self):
+        machine = load(stack)
+        top = machine.get_register("sp")
+        self.assertTrue(machine.run())
+        self.assertEqual(55, machine.get_register("t1"))
+        self.assertEqual(top, machine.get_register("sp"))
+        self.assertEqual(10, machine.read_word(top - 4))
+        self.assertEqual(1, machine.read_word(top - 40))
+
+    def test_signed_arithmetic(self):
+        machine = load("""addi t0, x0, -8
+                          srai t1, t0, 1
+                          srli t2, t0, 28
+                          slt t3, t0, x0
+                          slt t4, x0, t0
+                          addi s0, x0, 3
+                          sra s1, t0, s0
+                          sub s2, x0, t0
+                          xori s3, t0, -1
+                          lui s4, 1048575
+                          blt t0, x0, skip
+                          addi t3, x0, 100
+                          skip: add x0, t0, t0""")
+        machine.run()
+        registers = [machine.get_register(name) for name in ["t0", "t1", "t2", "t3", "t4", "s1", "s2", "s3", "s4", "x0"]]
+        self.assertEqual([0xfffffff8, 0xfffffffc, 0xf, 1, 0, 0xffffffff, 8, 7, 0xfffff000, 0], registers)
+
+    def test_step_budget(self):
+        machine = load("loop: addi t0, t0, 1\njal x0, loop")
+        self.assertFalse(machine.run(1001))
+        self.assertEqual(1001, machine.steps)
+        self.assertEqual(501, machine.get_register("t0"))
+        #running again continues where it stopped
+        self.assertFalse(machine.run(999))
+        self.assertEqual(1000, machine.get_register("t0"))
+        self.assertEqual(assembler.PC, machine.pc)
+
+    def test_compiled_blocks_match_single_steps(self):
+        #the generated programs jump around a lot and touch no memory
+        lines = ["addi %s, x0, %s" % (register, 7 * i + 1) for i, register in enumerate(["t0", "t1", "t2", "s0"])]
+        mix = {"R":10, "I":10, "SB":4, "U":1}
+        program = lines + benchmark.generate_program(400, seed=2, mix=mix, comment_every=0, pseudos=[])
+        #swap the memory instructions for ones that can not fail
+        program = [line.split(":")[0] + ": add t0, t0, t1" if "(" in line and ":" in line
+                   else "add t0, t0, t1" if "(" in line else line for line in program]
+        words = assembler.assemble_program(program)[0]
+        results = []
+        for compile_blocks in [True, False]:
+            machine = simulator.Simulator(words, compile_blocks=compile_blocks)
+            ended = machine.run(20000)
+            results.append((ended, machine.steps, machine.pc, machine.registers[:32]))
+        self.assertEqual(results[0], results[1])
+
+    def test_bad_memory_access(self):
+        for compile_blocks in [True, False]:
+            machine = load("addi t0, x0, 1\nlw t1, 0(x0)\naddi t0, x0, 2", compile_blocks=compile_blocks)
+            with self.assertRaisesRegex(simulator.BadAddress, "0x400004"):
+                machine.run()
+            self.assertEqual(1, machine.steps)
+            self.assertEqual(assembler.PC + 4, machine.pc)
+            self.assertEqual(1, machine.get_register("t0"))
+
+    def test_bad_jump(self):
+        for compile_blocks in [True, False]:
+            machine = load("jal x0, 4096", compile_blocks=compile_blocks)
+            with self.assertRaises(simulator.BadAddress):
+                machine.run()
+            machine = load("addi t0, x0, 1\njalr x0, 0(t0)", compile_blocks=compile_blocks)
+            with self.assertRaises(simulator.BadAddress):
+                machine.run()
+
+    def test_unknown_instruction(self):
+        machine = simulator.Simulator([assembler.encode_instruction("addi t0, x0, 1"), 0])
+        with self.assertRaises(assembler.BadInstruction):
+            machine.run()
+        self.assertEqual(1, machine.steps)
+
+    def test_self_modifying_code(self):
+        #overwrite the last instruction with a copy of the first, in the
+        #block that is running
+        for compile_blocks in [True, False]:
+            machine = load("""lw t0, 0(s11)
+                              sw t0, 8(s11)
+                              addi t1, x0, 5""", compile_blocks=compile_blocks)
+            machine.set_register("s11", assembler.PC)
+            machine.run()
+            self.assertEqual(0, machine.get_register("t1"))
+            self.assertEqual(machine.read_word(assembler.PC), machine.read_word(assembler.PC + 8))
+            self.assertEqual(3, machine.steps)
+
+    def test_patching_after_a_compiled_run(self):
+        #the loop body was compiled by the first run, the patch has to replace it
+        program = """addi t1, x0, 1000
+                     loop: addi t0, t0, 1
+                     add a0, a0, t0
+                     bne t0, t1, loop"""
+        results = []
+        for compile_blocks in [True, False]:
+            machine = load(program, compile_blocks=compile_blocks)
+            machine.run()
+            self.assertEqual(500500, machine.get_register("a0"))
+            machine.write_word(assembler.PC + 4, assembler.encode_instruction("addi t0, t0, 2"))
+            machine.set_register("t0", 0)
+            machine.set_register("a0", 0)
+            machine.pc = assembler.PC
+            machine.run()
+            results.append(machine.get_register("a0"))
+        self.assertEqual([250500, 250500], results)
+
+    def test_data_segment(self):
+        data = data_segment.DataSegment()
+        data.add_words([5, 7, 0])
+        for compile_blocks in [True, False]:
+            machine = simulator.Simulator(assembler.assemble_program(["lui gp, 65552", "lw t0, 0(gp)", "lw t1, 4(gp)",
+                                                                      "add t2, t0, t1", "sw t2, 8(gp)"])[0],
+                                          compile_blocks=compile_blocks, data=data)
+            machine.run()
+            self.assertEqual(12, machine.read_word(data_segment.DATA + 8))
+            self.assertEqual(bytes(data.buffer[:8]), machine.data[:8])
+            with self.assertRaises(simulator.BadAddress):
+                machine.read_word(data_segment.DATA + 12)
+
+    def test_dumps(self):
+        machine = load(fibonacci)
+        machine.set_register("a0", 10)
+        machine.run()
+        out = io.StringIO()
+        machine.dump_registers(out)
+        self.assertIn("a0   00000037          55", out.getvalue())
+        out = io.StringIO()
+        machine.dump_memory(assembler.PC, 8, out)
+        self.assertEqual("00400000: 00000293 00100313\n", out.getvalue())
+
+if __name__ == "__main__":
+    unittest.main()
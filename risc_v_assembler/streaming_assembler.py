@@ -0,0 +1,182 @@
+"""
+
+ Streaming Assembler
+
+ Assembles RISC-V code for the CSSE232 Assembler one line at a time,
+ so very large programs (e.g. generated ones read from a pipe) never
+ have to be held in memory as a whole.
+
+ Each instruction is encoded as soon as its operands are known. Branches
+ and jumps to labels that have not been seen yet are recorded in a fixup
+ table and backpatched when the label is defined.
+
+"""
+
+import sys
+from collections import deque
+import assembler
+import pseudoinstruction_handler as ph
+
+def assemble_stream(asm_lines, out = None, mode = "bin", window = 4096, pseudos = None):
+    """Takes an iterable of lines of assembly code (e.g. an open file) and
+        writes the machine code to `out` in the same format as `assembler.output`,
+        reading the input lazily. If `out` is None the output goes to the console.
+
+        Instructions are written in order as soon as every instruction before
+        them is resolved. At most `window` instructions are held back waiting
+        on forward references: past that, if `out` is seekable the oldest one
+        is written with a placeholder and rewritten in place once its label is
+        defined. Otherwise the window keeps growing until the label shows up.
+
+        `pseudos` defaults to `pseudoinstruction_handler.get_pseudoinstruction_defs()`.
+
+        Raises the same exceptions as `assembler.assemble_asm`, as soon as the
+        offending line is read. Raises BadLabel at the end of the input if a
+        referenced label was never defined.
+
+        Returns the number of instructions written."""
+
+    if pseudos == None:
+        pseudos = ph.get_pseudoinstruction_defs()
+    if out == None:
+        out = sys.stdout
+
+    stream = StreamState(out, mode, window)
+
+    for line_number, line in enumerate(asm_lines, 1):
+        record = assembler.tokenize_line(line, line_number)
+        if record == None:
+            continue
+        if assembler.has_directives([record]):
+            raise assembler.BadInstruction("Found directive %s on line %s, streaming only assembles instructions "
+                                           "(assemble the file without --stream for .data sections)" % (record.command, line_number))
+
+        for core in assembler.pseudoinstruction_pass([record], pseudos):
+            if core.label:
+                stream.define_label(core.label, core.line_number)
+            if core.command:
+                stream.add_instruction(core)
+
+    stream.finish()
+    return stream.index
+
+class PendingInstruction():
+    """
+    An instruction that has been read but not written yet. `word` is `None`
+    until every label it uses is known. `position` is set if the line was
+    already written with a placeholder and has to be rewritten in place.
+    """
+    __slots__ = ("record", "index", "label", "word", "position")
+
+    def __init__(self, record, index, label):
+        self.record = record
+        self.index = index
+        self.label = label
+        self.word = None
+        self.position = None
+
+class StreamState():
+    """
+    Labels, fixups and the output window for `assemble_stream`.
+    """
+    def __init__(self, out, mode, window):
+        self.out = out
+        self.mode = mode
+        self.window = window
+        self.seekable = hasattr(out, "seekable") and out.seekable()
+        self.labels = {}
+        #maps a label that has not been defined yet to the instructions using it
+        self.fixups = {}
+        self.pending = deque()
+        self.index = 0
+        #last label defined at the address of the next instruction
+        self.next_label = None
+
+    def define_label(self, label, line_number):
+        """Records the address of `label` and encodes any instruction waiting on it."""
+        if label in self.labels:
+            raise assembler.BadLabel("Duplicate label found on line %s: %s at line address" % (line_number, label), self.labels[label])
+
+        self.labels[label] = assembler.index_to_address(self.index)
+        self.next_label = label
+
+        for entry in self.fixups.pop(label, []):
+            self.encode(entry)
+            if entry.position != None:
+                self.rewrite(entry)
+        self.flush()
+
+    def add_instruction(self, record):
+        """Queues `record` for output, encoding it right away unless it uses a
+            label that has not been defined yet."""
+        entry = PendingInstruction(record, self.index, self.next_label)
+        self.next_label = None
+        self.index += 1
+
+        target = self.forward_reference(record)
+        if target == None:
+            self.encode(entry)
+        else:
+            self.fixups.setdefault(target, []).append(entry)
+
+        self.pending.append(entry)
+        self.flush()
+
+    def forward_reference(self, record):
+        """Returns the label used by a branch or jump if it is not defined yet,
+            otherwise `None`."""
+        instruction_type = assembler.instructions_to_types.get(record.command)
+        if instruction_type == assembler.Types.SB:
+            operand_count = 3
+        elif instruction_type == assembler.Types.UJ:
+            operand_count = 2
+        else:
+            return None
+
+        operands = record.operands
+        #let the encoder report operand errors right away
+        if len(operands) != operand_count:
+            return None
+
+        target = operands[-1]
+        if assembler.is_int(target) or assembler.is_register_name(target) or target in self.labels:
+            return None
+        return target
+
+    def encode(self, entry):
+        record = entry.record
+        entry.word = assembler.encode(record.command, record.operands, record.line_number, self.labels, entry.index)
+
+    def line(self, entry, word):
+        return assembler.output_line(word, assembler.index_to_address(entry.index), entry.label,
+                                     entry.record.instruction_text(), self.mode)
+
+    def flush(self):
+        """Writes every resolved instruction at the front of the window. If the
+            window is full and the output is seekable the oldest unresolved
+            instructions are written with a placeholder."""
+        pending = self.pending
+        while pending:
+            entry = pending[0]
+            if entry.word != None:
+                self.out.write(self.line(entry, entry.word) + "\n")
+            elif self.seekable and len(pending) > self.window:
+                entry.position = self.out.tell()
+                self.out.write(self.line(entry, 0) + "\n")
+            else:
+                break
+            pending.popleft()
+
+    def rewrite(self, entry):
+        """Overwrites the placeholder line of `entry` with its real machine code."""
+        end = self.out.tell()
+        self.out.seek(entry.position)
+        self.out.write(self.line(entry, entry.word))
+        self.out.seek(end)
+
+    def finish(self):
+        """Checks that every referenced label was defined and writes the rest
+            of the window."""
+        for label, entries in self.fixups.items():
+            raise assembler.BadLabel("Label not found on line %s: %s" % (entries[0].record.line_number, label))
+        self.flush()
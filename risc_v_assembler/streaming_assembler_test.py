@@ -0,0 +1,69 @@
+"""
+    Tests for the streaming mode of the CSSE232 Risc-V Assembler
+"""
+import assembler, streaming_assembler
+import io, unittest
+
+program = """start: addi t0, x0, 5
+            beq t0, x0, done     ; forward reference
+            jal ra, far
+            loop: addi t0, t0, -1
+            push t0
+            bne t0, x0, loop
+            jalif t0, x0, start
+            far:
+            add t1, t1, t1
+            done: sub t1, t1, t0"""
+
+def batch_output(lines, mode="bin"):
+    #output from the normal, whole file assembler
+    out = io.StringIO()
+    clean_code, labels = assembler.parse_labels(assembler.pseudoinstruction_pass(
+        assembler.lex_pass(lines), assembler.ph.get_pseudoinstruction_defs()))
+    words = assembler.machine_words_pass(clean_code, labels)
+    assembler.output(words, [c.instruction_text() for c in clean_code], labels, mode=mode, out=out)
+    return out.getvalue()
+
+class NonSeekable(io.StringIO):
+    def seekable(self):
+        return False
+
+class TestStreaming(unittest.TestCase):
+    def test_matches_batch_output(self):
+        lines = program.split("\n")
+        for mode in [None, "bin", "hex"]:
+            out = io.StringIO()
+            count = streaming_assembler.assemble_stream(iter(lines), out, mode)
+            self.assertEqual(11, count)
+            self.assertEqual(batch_output(lines, mode), out.getvalue())
+
+    def test_backpatching_past_the_window(self):
+        #a window of 1 forces the forward references to be written as placeholders
+        lines = program.split("\n")
+        out = io.StringIO()
+        streaming_assembler.assemble_stream(iter(lines), out, "hex", window=1)
+        self.assertEqual(batch_output(lines, "hex"), out.getvalue())
+
+    def test_window_grows_when_not_seekable(self):
+        lines = program.split("\n")
+        out = NonSeekable()
+        streaming_assembler.assemble_stream(iter(lines), out, "bin", window=1)
+        self.assertEqual(batch_output(lines), out.getvalue())
+
+    def test_undefined_label(self):
+        lines = ["add t0, t0, t0", "beq t0, x0, NOWHERE"]
+        with self.assertRaisesRegex(assembler.BadLabel, "line 2"):
+            streaming_assembler.assemble_stream(iter(lines), io.StringIO())
+
+    def test_directives_refused(self):
+        lines = ["add t0, t0, t0", ".data", "table: .word 1"]
+        with self.assertRaisesRegex(assembler.BadInstruction, "directive .data on line 2.*--stream"):
+            streaming_assembler.assemble_stream(iter(lines), io.StringIO())
+
+    def test_errors_are_raised_while_reading(self):
+        def lines():
+            yield "add t0, t0, t0"
+            yield "add t0, t0, 4"
+            raise AssertionError("read past the bad line")
+        with self.assertRaises(assembler.BadRegister):
+            streaming_assembler.assemble_stream(lines(), io.StringIO())
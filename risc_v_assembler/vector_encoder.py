@@ -0,0 +1,214 @@
+"""
+
+ Vector Encoder
+
+ Encodes whole programs for the CSSE232 Assembler with NumPy. The
+ operands of every instruction are parsed into columns (base bits, rd,
+ rs1, rs2, immediate and format), and all machine words are then built
+ at once with vectorized shifts and masks, including the scattered
+ immediates of branches and jumps.
+
+ Instructions in an unusual form (e.g. `jalr ra, a0, 4`) and any
+ instruction with an error are encoded by `assembler.encode` instead, so
+ results and errors are exactly those of `assembler.machine_words_pass`.
+
+ NumPy is optional: without it `assemble_many` encodes one instruction
+ at a time.
+
+"""
+
+import assembler
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+#formats of the rows, the shifts use the I format
+R, I, SHIFT, S, SB, U, UJ = range(7)
+
+#lw and jalr are parsed differently but stored as I rows
+BASE_OFFSET = 7
+
+#a row is out of range if its immediate field (the offset halved for SB and
+#UJ) is at least this, negative immediates are masked like `assembler.decimal_to_field`.
+#SB and UJ offsets are signed, so their fields have to be within half of it either way
+FIELD_LIMITS = {R:1, I:1 << 12, SHIFT:32, S:1 << 12, SB:1 << 12, U:1 << 20, UJ:1 << 20}
+
+#the largest immediate that is put in a row (so the columns fit in 64 bits),
+#bigger ones go to `assembler.encode`
+MAX_IMMEDIATE = 1 << 40
+
+def build_formats():
+    """Returns a dictionary mapping each instruction name to a tuple of its
+        format (or `BASE_OFFSET`) and its base bits."""
+    formats = {}
+    for command, instruction_type in assembler.instructions_to_types.items():
+        base = assembler.instructions_to_fields[command].base
+        if command in ["lw", "jalr"]:
+            formats[command] = (BASE_OFFSET, base)
+        elif assembler.is_shift_immediate_instance(command):
+            formats[command] = (SHIFT, base | (0b0100000 << 25 if command == "srai" else 0))
+        elif instruction_type == assembler.Types.R:
+            formats[command] = (R, base)
+        elif instruction_type == assembler.Types.I:
+            formats[command] = (I, base)
+        elif instruction_type == assembler.Types.S:
+            formats[command] = (S, base)
+        elif instruction_type == assembler.Types.SB:
+            formats[command] = (SB, base)
+        elif instruction_type == assembler.Types.U:
+            formats[command] = (U, base)
+        elif instruction_type == assembler.Types.UJ:
+            formats[command] = (UJ, base)
+    return formats
+
+FORMATS = build_formats()
+"""Dictionary mapping each instruction name to a tuple of its format and base bits"""
+
+##############
+#
+# Encoding
+#
+##############
+
+def assemble_many(asm_lines, labels = None):
+    """Takes a list of `assembler.AsmLine` records (or strings) with no labels
+        or pseudoinstructions and the labels dictionary, and returns the list of
+        32-bit machine words, the same as `assembler.machine_words_pass`.
+
+        Raises the same exceptions too: if several instructions are invalid the
+        one on the earliest line is raised, with its line number."""
+    records, is_text = assembler.lex_if_text(asm_lines)
+    if labels == None:
+        labels = {}
+    if numpy == None:
+        return assembler.machine_words_pass(records, labels)
+
+    columns, indices, fallback = parse_columns(records, labels)
+    words = [0] * len(records)
+    if indices:
+        row_words, bad_rows = encode_columns(*[numpy.array(column, dtype=numpy.int64) for column in columns])
+        if len(bad_rows):
+            #the scalar encoder raises the error with the right message
+            fallback.append(indices[bad_rows[0]])
+            fallback.sort()
+        for index, word in zip(indices, row_words.tolist()):
+            words[index] = word
+
+    for index in fallback:
+        record = records[index]
+        words[index] = assembler.encode(record.command, record.operands, record.line_number, labels, index)
+    return words
+
+def parse_columns(records, labels):
+    """Parses the operands of `records` into columns. Returns a tuple of the
+        columns (lists of formats, base bits, rd, rs1, rs2 and immediates, one
+        entry per row), the index of each row in `records`, and the indices of
+        the records left for `assembler.encode`."""
+    formats_get = FORMATS.get
+    registers = assembler.register_name_to_num
+    formats, bases, rds, rs1s, rs2s, immediates = columns = ([], [], [], [], [], [])
+    indices = []
+    fallback = []
+
+    for index, record in enumerate(records):
+        entry = formats_get(record.command)
+        operands = record.operands
+        try:
+            if entry == None:
+                raise ValueError(record.command)
+            format = entry[0]
+            if format == R:
+                rd, rs1, rs2 = operands
+                rd, rs1, rs2, immediate = registers[rd], registers[rs1], registers[rs2], 0
+            elif format == I or format == SHIFT:
+                rd, rs1, immediate = operands
+                rd, rs1, rs2, immediate = registers[rd], registers[rs1], 0, int(immediate)
+            elif format == BASE_OFFSET:
+                #only the offset(base) form, the others are left to `assembler.encode`
+                rd, offset = operands
+                offset, rs1 = offset.replace(")", "").split("(")
+                format, rd, rs1, rs2, immediate = I, registers[rd], registers[rs1], 0, int(offset)
+            elif format == S:
+                rs2, offset = operands
+                offset, rs1 = offset.replace(")", "").split("(")
+                rd, rs1, rs2, immediate = 0, registers[rs1], registers[rs2], int(offset)
+            elif format == SB:
+                rs1, rs2, target = operands
+                rd, rs1, rs2, immediate = 0, registers[rs1], registers[rs2], branch_offset(target, labels, index)
+            elif format == U:
+                rd, immediate = operands
+                rd, rs1, rs2, immediate = registers[rd], 0, 0, int(immediate)
+            else:
+                rd, target = operands
+                rd, rs1, rs2, immediate = registers[rd], 0, 0, branch_offset(target, labels, index)
+        except (ValueError, KeyError):
+            fallback.append(index)
+            continue
+
+        if not -MAX_IMMEDIATE < immediate < MAX_IMMEDIATE:
+            fallback.append(index)
+            continue
+        formats.append(format)
+        bases.append(entry[1])
+        rds.append(rd)
+        rs1s.append(rs1)
+        rs2s.append(rs2)
+        immediates.append(immediate)
+        indices.append(index)
+
+    return (columns, indices, fallback)
+
+def branch_offset(target, labels, index):
+    """Returns the byte offset of a branch or jump operand, like `assembler.label_to_offset`.
+        Raises ValueError for targets `assembler.encode` has to report."""
+    try:
+        return int(target)
+    except ValueError:
+        pass
+    if assembler.is_register_name(target):
+        raise ValueError(target)
+    if len(labels) == 0:
+        return assembler.PC - assembler.index_to_address(index)
+    return labels[target] - assembler.index_to_address(index)
+
+def encode_columns(formats, bases, rds, rs1s, rs2s, immediates):
+    """Takes NumPy arrays of the columns from `parse_columns` and returns a
+        tuple of the array of machine words and the array of positions of the
+        rows whose immediate is out of range."""
+    #branches and jumps hold the offset halved
+    is_branch = (formats == SB) | (formats == UJ)
+    fields = numpy.where(is_branch, immediates >> 1, immediates)
+
+    limits = numpy.array([FIELD_LIMITS[format] for format in range(len(FIELD_LIMITS))], dtype=numpy.int64)[formats]
+    bad = (fields >= limits) | ((formats == SHIFT) & (fields < 0)) | (is_branch & ((fields >= limits >> 1) | (fields < -(limits >> 1))))
+
+    words = bases | (rds << 7) | (rs1s << 15) | (rs2s << 20)
+
+    #I and the shifts: imm[11:0] on top
+    mask = (formats == I) | (formats == SHIFT)
+    words[mask] |= (fields[mask] & 0xfff) << 20
+
+    #S: imm[11:5] on top, imm[4:0] where rd would be
+    mask = formats == S
+    immediate = fields[mask] & 0xfff
+    words[mask] |= ((immediate >> 5) << 25) | ((immediate & 0x1f) << 7)
+
+    #SB: imm[12|10:5] on top, imm[4:1|11] where rd would be
+    mask = formats == SB
+    immediate = fields[mask] & 0xfff
+    words[mask] |= (((immediate >> 11) << 31) | (((immediate >> 4) & 0x3f) << 25)
+                    | ((immediate & 0xf) << 8) | (((immediate >> 10) & 0x1) << 7))
+
+    #U: imm[31:12] on top
+    mask = formats == U
+    words[mask] |= (fields[mask] & 0xfffff) << 12
+
+    #UJ: imm[20|10:1|11|19:12] on top
+    mask = formats == UJ
+    immediate = fields[mask] & 0xfffff
+    words[mask] |= (((immediate >> 19) << 31) | ((immediate & 0x3ff) << 21)
+                    | (((immediate >> 10) & 0x1) << 20) | (((immediate >> 11) & 0xff) << 12))
+
+    return (words.astype(numpy.uint32), numpy.flatnonzero(bad))
@@ -0,0 +1,58 @@
+"""
+    Tests for the vector encoder of the CSSE232 Risc-V Assembler
+"""
+import assembler, benchmark, vector_encoder
+import io, unittest
+
+def clean_program(size, seed):
+    pseudos = benchmark.usable_pseudos(out=io.StringIO())
+    lines = benchmark.generate_program(size, seed, pseudos=pseudos)
+    return assembler.parse_labels(assembler.pseudoinstruction_pass(assembler.lex_pass(lines), assembler.ph.get_pseudoinstruction_defs()))
+
+@unittest.skipUnless(vector_encoder.numpy, "needs numpy")
+class TestVectorEncoder(unittest.TestCase):
+    def test_same_as_scalar(self):
+        for seed in range(4):
+            records, labels = clean_program(3000, seed)
+            self.assertEqual(assembler.machine_words_pass(records, labels), vector_encoder.assemble_many(records, labels))
+
+    def test_edge_immediates(self):
+        lines = ["addi t0, t1, -2048", "addi t0, t1, 4095", "lui t0, 1048575", "lui t0, -1", "slli t0, t0, 31",
+                 "srai t0, t0, 31", "sw t0, -2048(sp)", "lw t0, 2047(sp)", "jalr ra, a0, 4", "jalr x0, 4 (a0)",
+                 "beq t0, t1, -4096", "bne t0, t1, 4094", "jal ra, -1048576", "jal ra, 1048574", "andi a0, a1, -1"]
+        self.assertEqual([assembler.encode_instruction(line, i) for i, line in enumerate(lines)],
+                         vector_encoder.assemble_many(lines))
+
+    def test_labels(self):
+        lines = ["beq t0, x0, end", "jal ra, start", "jal ra, end", "bne t0, x0, start"]
+        labels = {"start":assembler.PC, "end":assembler.PC + 16}
+        self.assertEqual(assembler.machine_words_pass(lines, labels), vector_encoder.assemble_many(lines, labels))
+        #without labels, branches go to the start of the text segment
+        self.assertEqual(assembler.machine_words_pass(lines, {}), vector_encoder.assemble_many(lines))
+
+    def test_earliest_error_wins(self):
+        cases = [(["add t0, t0, t0", "addi t0, t0, 4096", "add t9, t0, t0"], assembler.BadImmediate, "4096"),
+                 (["add t0, t0, t0", "add t9, t0, t0", "addi t0, t0, 4096"], assembler.BadRegister, "line 1"),
+                 (["slli t0, t0, 32"], assembler.BadImmediate, "line 0"),
+                 (["beq t0, t1, 8192"], assembler.BadImmediate, "4096"),
+                 (["jal ra, 99999999999999999999999"], assembler.BadImmediate, "20"),
+                 (["nop"], assembler.BadInstruction, "line 0"),
+                 (["beq t0, t1, t2"], assembler.BadImmediate, "line 0")]
+        for lines, error, message in cases:
+            with self.assertRaisesRegex(error, message):
+                vector_encoder.assemble_many(lines)
+        with self.assertRaises(assembler.BadLabel):
+            vector_encoder.assemble_many(["jal ra, missing"], {"start":assembler.PC})
+
+class TestWithoutNumpy(unittest.TestCase):
+    def test_scalar_fallback(self):
+        numpy = vector_encoder.numpy
+        vector_encoder.numpy = None
+        try:
+            records, labels = clean_program(500, 1)
+            self.assertEqual(assembler.machine_words_pass(records, labels), vector_encoder.assemble_many(records, labels))
+        finally:
+            vector_encoder.numpy = numpy
+
+if __name__ == "__main__":
+    unittest.main()